@@ -0,0 +1,307 @@
+"""
+Benchmark the public evaluation paths of gwsurrogate.
+
+Each case loads a model and evaluates it with one set of options. For each
+case the cold time (loading the model and the first evaluation) and the warm
+time (median over repeated evaluations of the loaded model) are recorded, as
+well as the peak memory allocated during a warm evaluation, as traced by
+tracemalloc.
+
+Usage:
+
+    python benchmarks/evaluation.py [--repeat N] [--match PATTERN]
+        [--save baseline.json] [--compare baseline.json] [--tolerance TOL]
+        [--synthetic DIR]
+
+The models NRHybSur3dq8, NRHybSur3dq8Tidal and NRSur7dq4 are used from the
+surrogate download path, cases of models that have not been downloaded are
+skipped unless --download is given. With --synthetic, synthetic models of the
+same structure are written to DIR and used instead, see
+gwsurrogate.synthetic, so no downloads are needed. The text tutorial model
+and the FastTensorSplineSurrogate case, which uses random data, need no
+downloads.
+
+Timings depend on the machine, so a baseline should be saved with --save on
+the machine where it is compared with --compare. With --compare, a case
+regresses if its warm time is larger than (1 + TOL) times the baseline, or
+its cold time or peak memory is larger than (1 + 2*TOL) times the baseline.
+The exit status is 1 if any case regressed.
+"""
+
+from __future__ import division, print_function
+import argparse
+import contextlib
+import fnmatch
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+
+import gwsurrogate as gws
+
+_TUTORIAL_PATH = os.path.join(_ROOT, 'tutorial', 'TutorialSurrogate',
+                              'EOB_q1_2_NoSpin_Mode22')
+_TUTORIAL_MODE_PATH = os.path.join(_TUTORIAL_PATH,
+                                   'l2_m2_len12239M_SurID19poly')
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+# Paths of the model files to use instead of the download path, see
+# --synthetic
+_model_paths = {}
+
+
+@contextlib.contextmanager
+def _quiet():
+    """ Silences the stdout of the text surrogate loaders """
+    with open(os.devnull, 'w') as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+
+class Case(object):
+    """ A benchmark: load() returns the model, and call(model) evaluates
+    it. requires is the name of a model in the surrogate download path that
+    is needed, or None. """
+
+    def __init__(self, name, load, call, requires=None):
+        self.name = name
+        self.load = load
+        self.call = call
+        self.requires = requires
+
+    def available(self):
+        if self.requires is None or self.requires in _model_paths:
+            return True
+        return os.path.isfile('%s/%s.h5' % (gws.catalog.download_path(),
+                                            self.requires))
+
+
+def _load_surrogate(name, **kwargs):
+    """ Loads a fresh copy of a model, so that the cold time includes
+    loading from disk """
+    def load():
+        base_name = 'NRHybSur3dq8' if name == 'NRHybSur3dq8Tidal' else name
+        if base_name not in _model_paths:
+            return gws.LoadSurrogate(name, reuse=False, **kwargs)
+        spliced = name if name != base_name else None
+        return gws.LoadSurrogate(_model_paths[base_name],
+                                 surrogate_name_spliced=spliced, reuse=False,
+                                 **kwargs)
+    return load
+
+
+def _fast_tensor_spline_surrogate(num_modes=12, num_nodes=20,
+                                  num_times=20000, num_knots=10, seed=0):
+    """ A FastTensorSplineSurrogate in 3 dimensions with random data """
+    from gwsurrogate.new.surrogate import FastTensorSplineSurrogate, \
+        ParamDim, ParamSpace
+    rng = np.random.RandomState(seed)
+    names = ['q', 'chi1', 'chi2']
+    min_vals = [1., -0.8, -0.8]
+    max_vals = [8., 0.8, 0.8]
+    param_space = ParamSpace('random', [ParamDim(name, a, b)
+        for name, a, b in zip(names, min_vals, max_vals)])
+    knot_vecs = [np.linspace(a, b, num_knots)
+                 for a, b in zip(min_vals, max_vals)]
+    coef_shape = (num_nodes,) + (num_knots + 2,)*len(knot_vecs)
+    modes = [(ell, m) for ell in range(2, 5) for m in range(-ell, ell+1)
+             if m != 0][:num_modes]
+    mode_data = dict((mode, (rng.randn(num_nodes, num_times)
+                             + 1j*rng.randn(num_nodes, num_times),
+                             rng.randn(*coef_shape), rng.randn(*coef_shape)))
+                     for mode in modes)
+    return FastTensorSplineSurrogate('random', np.arange(num_times),
+                                     param_space, knot_vecs, mode_data,
+                                     modes)
+
+
+def _load_tutorial_single_mode():
+    with _quiet():
+        return gws.EvaluateSingleModeSurrogate(_TUTORIAL_MODE_PATH + '/')
+
+
+def _load_tutorial():
+    with _quiet():
+        return gws.EvaluateSurrogate(_TUTORIAL_PATH + '/')
+
+
+def _call(*args, **kwargs):
+    """ Returns a function that calls a model with these arguments """
+    def call(sur):
+        with _quiet():
+            return sur(*args, **kwargs)
+    return call
+
+
+def cases():
+    """ Returns the list of all benchmark cases """
+    chi_aligned = ([0, 0, 0.5], [0, 0, -0.3])
+    chi_precessing = ([0.3, 0.2, 0.4], [-0.2, 0.4, 0.1])
+    times = np.arange(-2000., -10., 0.5)
+    tidal_opts = {'Lambda1': 1000., 'Lambda2': 500.}
+
+    variants = [
+        # name, keyword arguments
+        ('dimensionless', dict(f_low=0)),
+        ('dimensionless_dt', dict(f_low=0, dt=0.1)),
+        ('times', dict(f_low=0, times=times)),
+        ('mks', dict(f_low=20, dt=1./4096, M=60, dist_mpc=100,
+                     units='mks')),
+        ('mks_inclination', dict(f_low=20, dt=1./4096, M=60, dist_mpc=100,
+                                 units='mks', inclination=0.4, phi_ref=1.)),
+        ('ellMax2', dict(f_low=0, dt=0.1, ellMax=2)),
+        ]
+
+    res = []
+    for model, (chiA0, chiB0) in [('NRHybSur3dq8', chi_aligned),
+                                  ('NRSur7dq4', chi_precessing)]:
+        for variant, kwargs in variants:
+            res.append(Case('%s/%s' % (model, variant), _load_surrogate(model),
+                            _call(2., chiA0, chiB0, **kwargs),
+                            requires=model))
+
+    # The tidal model needs f_low > 0, and ends at the peak
+    for variant, kwargs in [
+            ('dimensionless_dt', dict(f_low=3e-3, dt=0.25)),
+            ('times', dict(f_low=3e-3, times=times)),
+            ('mks', dict(f_low=20, dt=1./4096, M=20, dist_mpc=100,
+                         units='mks')),
+            ('mks_inclination', dict(f_low=20, dt=1./4096, M=20,
+                                     dist_mpc=100, units='mks',
+                                     inclination=0.4, phi_ref=1.)),
+            ('ellMax2', dict(f_low=3e-3, dt=0.25, ellMax=2)),
+            ]:
+        res.append(Case('NRHybSur3dq8Tidal/%s' % variant,
+                        _load_surrogate('NRHybSur3dq8Tidal'),
+                        _call(1.2, *chi_aligned, tidal_opts=tidal_opts,
+                              **kwargs),
+                        requires='NRHybSur3dq8'))
+
+    # The text tutorial model, which is sampled on [0, 12239.9]M
+    for variant, kwargs in [
+            ('dimensionless', dict()),
+            ('mks', dict(M=80., dist=1., f_low=10.)),
+            ('times', dict(times=np.arange(100., 12000., 0.5))),
+            ]:
+        res.append(Case('EvaluateSingleModeSurrogate/%s' % variant,
+                        _load_tutorial_single_mode, _call(1.7, **kwargs)))
+    for variant, kwargs in [
+            ('dimensionless', dict(mode_sum=False)),
+            ('mks', dict(M=80., dist=1., mode_sum=False)),
+            ('mks_inclination', dict(M=80., dist=1., theta=0.4, phi=1.)),
+            ]:
+        res.append(Case('EvaluateSurrogate/%s' % variant, _load_tutorial,
+                        _call(1.7, **kwargs)))
+
+    x = np.array([2., 0.3, -0.2])
+    res.append(Case('FastTensorSplineSurrogate/modes',
+                    _fast_tensor_spline_surrogate, _call(x)))
+    res.append(Case('FastTensorSplineSurrogate/inclination',
+                    _fast_tensor_spline_surrogate,
+                    _call(x, theta=0.4, phi=1.)))
+    return res
+
+
+def run_case(case, repeat=10):
+    """ Returns a dict with the cold and warm times in seconds, and the peak
+    memory of a warm evaluation in bytes. """
+    t0 = _timer()
+    sur = case.load()
+    case.call(sur)
+    cold = _timer() - t0
+
+    warm = []
+    for _ in range(repeat):
+        t0 = _timer()
+        case.call(sur)
+        warm.append(_timer() - t0)
+
+    tracemalloc.start()
+    try:
+        case.call(sur)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'cold': cold, 'warm': float(np.median(warm)),
+            'warm_min': float(np.min(warm)), 'peak_memory': peak}
+
+
+def compare(results, baseline, tolerance):
+    """ Returns a list of (case, quantity, result, baseline) for the
+    quantities of results that regressed with respect to baseline. """
+    limits = {'warm': 1 + tolerance, 'cold': 1 + 2*tolerance,
+              'peak_memory': 1 + 2*tolerance}
+    regressions = []
+    for name, res in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for key, limit in sorted(limits.items()):
+            if res[key] > limit*baseline[name][key]:
+                regressions.append((name, key, res[key],
+                                    baseline[name][key]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--match', default='*',
+                        help='Only run cases matching this glob pattern')
+    parser.add_argument('--download', action='store_true',
+                        help='Download models that are not available')
+    parser.add_argument('--save', help='Save the results to this file')
+    parser.add_argument('--compare',
+                        help='Compare the results with this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--synthetic', metavar='DIR',
+                        help='Use synthetic models written to this directory')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        from gwsurrogate import synthetic
+        _model_paths.update(synthetic.write_models(args.synthetic))
+
+    results = {}
+    print('%-45s %12s %12s %12s' % ('case', 'cold [ms]', 'warm [ms]',
+                                    'peak [MB]'))
+    for case in cases():
+        if not fnmatch.fnmatch(case.name, args.match):
+            continue
+        if not (args.download or case.available()):
+            print('%-45s skipped, %s not downloaded' % (case.name,
+                                                        case.requires))
+            continue
+        res = results[case.name] = run_case(case, args.repeat)
+        print('%-45s %12.2f %12.2f %12.2f' % (case.name, 1e3*res['cold'],
+              1e3*res['warm'], res['peak_memory']/2.**20))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, key, res, base in regressions:
+            print('REGRESSION %s %s: %.4g vs baseline %.4g (%+.1f%%)'
+                  % (name, key, res, base, 100*(res/base - 1)))
+        if regressions:
+            sys.exit(1)
+        print('No regressions with respect to %s' % args.compare)
+
+
+if __name__ == '__main__':
+    main()
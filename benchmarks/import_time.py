@@ -0,0 +1,85 @@
+"""
+Benchmark the time taken by "import gwsurrogate".
+
+Each measurement is done in a fresh python process, so that nothing is
+already in sys.modules. The time to first use of LoadSurrogate, which imports
+the surrogate module and its dependencies, is reported separately.
+
+Usage:
+
+    python benchmarks/import_time.py [--repeat N] [--importtime]
+
+With --importtime the output of "python -X importtime" (python 3.7+) is
+printed for the slowest modules.
+"""
+
+from __future__ import division, print_function
+import argparse
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_TIMER = """
+import time
+t0 = time.time()
+import gwsurrogate
+t1 = time.time()
+%s
+t2 = time.time()
+print('%%.9f %%.9f' %% (t1 - t0, t2 - t1))
+"""
+
+
+def _run(code, env=None):
+    """ Runs code in a new python process and returns its stdout """
+    out = subprocess.check_output([sys.executable, '-c', code], env=env,
+                                  cwd=_ROOT)
+    return out.decode().strip().splitlines()[-1]
+
+
+def time_import(repeat=10, statement='gwsurrogate.LoadSurrogate'):
+    """ Returns arrays of the import times and the times of statement, run
+    after the import, from repeat new processes. """
+    times = np.array([[float(x) for x in _run(_TIMER % statement).split()]
+                      for _ in range(repeat)])
+    return times[:, 0], times[:, 1]
+
+
+def import_profile(num=20):
+    """ Prints the num modules with the largest cumulative import time, as
+    reported by "python -X importtime". """
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                             'import gwsurrogate'], cwd=_ROOT,
+                            stderr=subprocess.PIPE)
+    _, err = proc.communicate()
+    rows = []
+    # lines are "import time: self [us] | cumulative | imported package"
+    for line in err.decode().splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    for cumulative, name in sorted(rows, reverse=True)[:num]:
+        print('%10.1f ms  %s' % (cumulative*1e-3, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--importtime', action='store_true')
+    args = parser.parse_args()
+
+    t_import, t_first_use = time_import(args.repeat)
+    print('import gwsurrogate:                     median %8.2f ms, min %8.2f ms'
+          % (1e3*np.median(t_import), 1e3*np.min(t_import)))
+    print('first use of gwsurrogate.LoadSurrogate: median %8.2f ms, min %8.2f ms'
+          % (1e3*np.median(t_first_use), 1e3*np.min(t_first_use)))
+
+    if args.importtime:
+        import_profile()
+
+
+if __name__ == '__main__':
+    main()
@@ -70,15 +70,67 @@ of interest.
 
 """
 
-from . import surrogate
-__author__ = surrogate.__author__
-__email__ = surrogate.__email__
-__copyright__ = surrogate.__copyright__
-__license__ = surrogate.__license__
-__version__ = surrogate.__version__
-__doc__ = surrogate.__doc__
-
-from .surrogate import *
-from . import catalog
-from . import spline_interp_Cwrapper
-from . import precessing_utils
+import sys as _sys
+
+# Submodules are imported when first used, so that "import gwsurrogate" is
+# fast. The public names of the surrogate module are available here as well,
+# as if imported with "from .surrogate import *".
+_SUBMODULES = ['surrogate', 'catalog', 'spline_interp_Cwrapper',
+               'precessing_utils', 'cache', 'fourier', 'harmonics', 'new',
+               'parametric_funcs', 'surrogateIO', 'profiling', 'synthetic',
+               'roq']
+_METADATA = ['__author__', '__email__', '__copyright__', '__license__',
+             '__version__']
+
+# The names exported by "from gwsurrogate import *": the public names of the
+# surrogate module and the submodules that used to be imported eagerly.
+# These are imported on first use like any other name.
+__all__ = ['surrogate', 'catalog', 'spline_interp_Cwrapper',
+           'precessing_utils', 'my_funcs', 'ParamDim', 'ParamSpace',
+           'new_surrogate', 'precessing_surrogate', 'write_waveform',
+           'ExportSurrogate', 'EvaluateSingleModeSurrogate',
+           'CreateManyEvaluateSingleModeSurrogates', 'EvaluateSurrogate',
+           'CompareSingleModeSurrogate', 'EvaluationPlan', 'MassRescaler',
+           'SurrogateEvaluator', 'NRHybSur3dq8', 'NRHybSur3dq8Tidal',
+           'NRSur7dq4', 'SURROGATE_CLASSES', 'release', 'LoadSurrogate']
+
+if _sys.version_info < (3, 7):
+  # module level __getattr__ (PEP 562) is not available, import eagerly
+  from . import surrogate
+  __author__ = surrogate.__author__
+  __email__ = surrogate.__email__
+  __copyright__ = surrogate.__copyright__
+  __license__ = surrogate.__license__
+  __version__ = surrogate.__version__
+  __doc__ = surrogate.__doc__
+
+  from .surrogate import *
+  from . import catalog
+  from . import spline_interp_Cwrapper
+  from . import precessing_utils
+
+else:
+
+  def __getattr__(name):
+    import importlib
+    if name in _SUBMODULES:
+      if name == 'new':
+        # the surrogate module imports the modules of the new subpackage,
+        # which are then available as its attributes
+        importlib.import_module('.surrogate', __name__)
+      return importlib.import_module('.' + name, __name__)
+    if name.startswith('_') and name not in _METADATA:
+      raise AttributeError("module %r has no attribute %r"%(__name__, name))
+    surrogate = importlib.import_module('.surrogate', __name__)
+    try:
+      value = getattr(surrogate, name)
+    except AttributeError:
+      raise AttributeError("module %r has no attribute %r"%(__name__, name))
+    # Later lookups don't need to go through __getattr__
+    globals()[name] = value
+    return value
+
+  def __dir__():
+    from . import surrogate
+    names = [k for k in vars(surrogate).keys() if not k.startswith('_')]
+    return sorted(set(list(globals().keys()) + _SUBMODULES + names))
@@ -0,0 +1,429 @@
+""" Caching of surrogate evaluations.
+
+Samplers and grid searches often request the same waveform many times. A
+WaveformCache stores recent (domain, h, dynamics) results of a
+SurrogateEvaluator in memory, keyed on all arguments of the evaluation, and
+returns copies of them for repeated requests. A DiskWaveformCache stores
+results as .npy files in a directory that can be shared by many processes
+and jobs. See SurrogateEvaluator.enable_cache. """
+
+from __future__ import division # for python 2
+
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@umassd.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma, Kevin Barkett"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+
+def hashable_key(value):
+    """ Converts value, which can be built from numbers, strings, None,
+    numpy arrays, lists, tuples and dicts, into a hashable key. Equal values
+    give equal keys.
+    """
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, dict):
+        return ('dict',) + tuple(sorted((k, hashable_key(v))
+                                        for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return ('seq',) + tuple(hashable_key(v) for v in value)
+    arr = np.asarray(value)
+    if arr.ndim == 0:
+        # Numbers of any type are keyed by value, so 3, 3. and np.float64(3)
+        # are the same
+        if np.iscomplexobj(arr):
+            return complex(arr)
+        return float(arr)
+    return ('array', arr.shape, arr.dtype.str, arr.tobytes())
+
+
+def _round_params(value, decimals):
+    """ Rounds value to decimals, if decimals is not None. """
+    if decimals is None:
+        return value
+    return np.round(np.asarray(value, dtype=float), decimals)
+
+
+def copy_result(result):
+    """ Returns a copy of a (domain, h, dynamics) tuple, copying all numpy
+    arrays so that changes to one copy do not affect the other.
+    """
+    def _copy(value):
+        if isinstance(value, np.ndarray):
+            return value.copy()
+        if isinstance(value, dict):
+            return dict((k, _copy(v)) for k, v in value.items())
+        if isinstance(value, (list, tuple)):
+            return type(value)(_copy(v) for v in value)
+        return value
+    return _copy(result)
+
+
+def result_nbytes(result):
+    """ Total size in bytes of the numpy arrays in result. """
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, dict):
+        return sum(result_nbytes(v) for v in result.values())
+    if isinstance(result, (list, tuple)):
+        return sum(result_nbytes(v) for v in result)
+    return 0
+
+
+class WaveformCache(object):
+    """
+    A thread-safe least-recently-used cache of surrogate evaluations.
+
+    Entries are evicted, least recently used first, when there are more than
+    max_entries of them or when the arrays they hold take more than max_bytes.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=None, param_decimals=None):
+        """
+        max_entries:    Maximum number of cached evaluations. None for no
+                        limit. Default: 128.
+
+        max_bytes:      Maximum total size in bytes of the cached arrays.
+                        None for no limit. Default: None.
+
+        param_decimals: If not None, the intrinsic parameters are rounded to
+                        this many decimals before they are used as keys.
+                        Binaries that agree after rounding share a cache
+                        entry. Default: None, in which case only identical
+                        parameters share an entry.
+        """
+        if max_entries is not None and max_entries < 1:
+            raise ValueError('max_entries should be at least 1.')
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError('max_bytes should be non-negative.')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.param_decimals = param_decimals
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _copy(self, result):
+        return copy_result(result)
+
+    def round_params(self, value):
+        """ Rounds value to param_decimals, if param_decimals is set. """
+        return _round_params(value, self.param_decimals)
+
+    def get(self, key):
+        """ Returns a copy of the result stored at key, or None if there is
+        no such entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._copy(entry[0])
+
+    def put(self, key, result):
+        """ Stores a copy of result at key, evicting entries as needed. """
+        nbytes = result_nbytes(result)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            # Would evict everything else and still not fit
+            return
+        result = self._copy(result)
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._entries[key] = (result, nbytes)
+            self.nbytes += nbytes
+
+            while (self.max_entries is not None \
+                    and len(self._entries) > self.max_entries) \
+                    or (self.max_bytes is not None \
+                    and self.nbytes > self.max_bytes):
+                _, (_, old_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= old_nbytes
+                self.evictions += 1
+
+    def clear(self):
+        """ Removes all entries. The statistics are not reset. """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """ Returns a dict with the number of hits, misses and evictions so
+        far, and the current number of entries and their size in bytes.
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self._entries),
+                    'nbytes': self.nbytes,
+                    }
+
+
+class BasisCache(WaveformCache):
+    """
+    A thread-safe least-recently-used cache of arrays derived from a model,
+    such as EI bases interpolated onto a dense time grid. Unlike
+    WaveformCache, entries are stored and returned without copying, so the
+    cached arrays are shared and must not be modified.
+    """
+
+    def __init__(self, max_entries=4, max_bytes=None):
+        """
+        max_entries:    Maximum number of cached entries. None for no
+                        limit. Default: 4.
+
+        max_bytes:      Maximum total size in bytes of the cached arrays.
+                        None for no limit. Default: None.
+        """
+        super(BasisCache, self).__init__(max_entries=max_entries,
+            max_bytes=max_bytes)
+
+    def _copy(self, result):
+        return result
+
+
+def file_md5(filename):
+    """ Returns the md5 hash of the contents of a file. """
+    hash_md5 = hashlib.md5()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hash_md5.update(chunk)
+    return hash_md5.hexdigest()
+
+
+class DiskWaveformCache(object):
+    """
+    A cache of surrogate evaluations stored in a directory, which can be
+    shared by many processes, including processes on different machines
+    using a shared filesystem.
+
+    Each entry is a subdirectory named by a hash of the model and the
+    evaluation arguments. It holds one .npy file per array and a meta.json
+    describing how to put them back together. Entries are written to a
+    temporary directory first and then renamed into place, so a reader never
+    sees a partially written entry, and concurrent writers of the same entry
+    do not interfere.
+
+    When max_bytes is set, the least recently used entries are removed after
+    each write until the entries fit. An entry's use time is the
+    modification time of its meta.json, which is updated on every hit.
+    """
+
+    def __init__(self, directory, model_hash, max_bytes=None, mmap=True,
+            param_decimals=None):
+        """
+        directory:  Directory for the cache entries. Created if needed.
+
+        model_hash: A string identifying the model, normally the md5 hash of
+                    its h5 file. Entries of other models are never used.
+
+        max_bytes:  Maximum total size in bytes of the cached arrays. None
+                    for no limit. Default: None.
+
+        mmap:       If True, cached arrays are returned as read-only memory
+                    maps of the .npy files. Else they are read into memory.
+                    Default: True.
+
+        param_decimals: See WaveformCache.
+        """
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError('max_bytes should be non-negative.')
+        self.directory = os.path.abspath(directory)
+        self.model_hash = model_hash
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        self.param_decimals = param_decimals
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def round_params(self, value):
+        """ Rounds value to param_decimals, if param_decimals is set. """
+        return _round_params(value, self.param_decimals)
+
+    def _entry_dir(self, key):
+        """ Returns the directory for the entry with a hashable key """
+        digest = hashlib.sha1(self.model_hash.encode('utf-8')
+            + pickle.dumps(key, protocol=2)).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def get(self, key):
+        """ Returns the result stored at key, or None if there is no such
+        entry.
+        """
+        entry = self._entry_dir(key)
+        mmap_mode = 'r' if self.mmap else None
+        try:
+            meta_file = os.path.join(entry, 'meta.json')
+            with open(meta_file) as f:
+                meta = json.load(f)
+            load = lambda name: np.load(os.path.join(entry, name + '.npy'),
+                                        mmap_mode=mmap_mode)
+            domain = load('domain')
+            if meta['modes'] is None:
+                h = load('h')
+            else:
+                h = dict((tuple(mode), load('h_%d' % i))
+                         for i, mode in enumerate(meta['modes']))
+            if meta['dynamics'] is None:
+                dynamics = None
+            else:
+                dynamics = dict((k, load('dynamics_%d' % i))
+                                for i, k in enumerate(meta['dynamics']))
+            # Mark as recently used
+            os.utime(meta_file, None)
+        except (IOError, OSError, ValueError):
+            # Missing, or removed by another process while reading
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return domain, h, dynamics
+
+    def put(self, key, result):
+        """ Stores result at key, then evicts entries as needed. """
+        domain, h, dynamics = result
+        entry = self._entry_dir(key)
+        if os.path.isdir(entry):
+            return
+
+        arrays = {'domain': domain}
+        meta = {'modes': None, 'dynamics': None}
+        if isinstance(h, dict):
+            meta['modes'] = [list(mode) for mode in h.keys()]
+            for i, mode in enumerate(h.keys()):
+                arrays['h_%d' % i] = h[mode]
+        else:
+            arrays['h'] = h
+        if dynamics is not None:
+            meta['dynamics'] = list(dynamics.keys())
+            for i, k in enumerate(meta['dynamics']):
+                arrays['dynamics_%d' % i] = dynamics[k]
+
+        tmp = os.path.join(self.directory, 'tmp-%s' % uuid.uuid4().hex)
+        os.makedirs(tmp)
+        try:
+            for name, arr in arrays.items():
+                np.save(os.path.join(tmp, name + '.npy'), np.asarray(arr))
+            # meta.json is written last, get() treats entries without it as
+            # missing
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            os.rename(tmp, entry)
+        except OSError:
+            # Another process wrote the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(entry):
+                raise
+
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def _entries(self):
+        """ Returns a list of (last use time, size in bytes, directory) for
+        all complete entries.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            entry = os.path.join(self.directory, name)
+            if name.startswith('tmp-') or not os.path.isdir(entry):
+                continue
+            try:
+                used = os.path.getmtime(os.path.join(entry, 'meta.json'))
+                nbytes = sum(os.path.getsize(os.path.join(entry, f))
+                             for f in os.listdir(entry))
+            except OSError:
+                continue
+            entries.append((used, nbytes, entry))
+        return entries
+
+    def evict(self, max_bytes):
+        """ Removes the least recently used entries until the entries take
+        at most max_bytes.
+        """
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        for used, nbytes, entry in entries:
+            if total <= max_bytes:
+                break
+            # Rename first so that readers never see a partly removed entry
+            trash = os.path.join(self.directory,
+                                 'tmp-%s' % uuid.uuid4().hex)
+            try:
+                os.rename(entry, trash)
+            except OSError:
+                # Already removed by another process
+                continue
+            shutil.rmtree(trash, ignore_errors=True)
+            total -= nbytes
+            self._count('evictions')
+
+    def clear(self):
+        """ Removes all entries. """
+        self.evict(0)
+
+    def stats(self):
+        """ Returns a dict with the number of hits, misses and evictions by
+        this process so far, and the current number of entries and their
+        size in bytes.
+        """
+        entries = self._entries()
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(entries),
+                    'nbytes': sum(e[1] for e in entries),
+                    }
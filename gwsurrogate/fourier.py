@@ -0,0 +1,187 @@
+""" Frequency domain waveforms from time domain surrogates.
+
+The time domain waveform, sampled with a uniform time step dt, is tapered at
+the start, zero-padded to N = 1/(df dt) samples and Fourier transformed with
+an FFT. A FourierPlan holds everything that only depends on (N, dt): the
+output frequencies, the indices of these in the FFT output and the taper
+windows. Plans are shared through get_plan. See SurrogateEvaluator.__call__.
+
+The waveform modes and h = hplus - i hcross are complex, so the transform
+has both positive and negative frequencies. We use the convention
+    htilde(f) = int h(t) exp(-2 pi i f t) dt,
+with t = 0 at the peak of the waveform. """
+
+from __future__ import division # for python 2
+
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@umassd.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma, Kevin Barkett"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from . import profiling as _profiling
+
+try:
+    from scipy import fft as _fft
+except ImportError:
+    # scipy < 1.4
+    from numpy import fft as _fft
+
+
+# Default number of (2,2) mode cycles over which the start of the waveform
+# is tapered.
+TAPER_START_CYCLES = 2
+
+# Plans returned by get_plan, keyed on (N, dt)
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+_MAX_PLANS = 16
+
+
+def planck_window(n):
+    """ Returns a Planck taper window of length n, which rises smoothly from
+    0 at the first sample to 1 after the last sample. """
+    if n <= 1:
+        return np.zeros(n)
+    x = np.arange(n)/n
+    window = np.zeros(n)
+    # z = 1/x + 1/(x-1), the window is 1/(1 + exp(z)) for 0 < x < 1
+    with np.errstate(over='ignore'):
+        window[1:] = 1./(1. + np.exp(1./x[1:] + 1./(x[1:] - 1.)))
+    return window
+
+
+def taper_length(h22, num_cycles=TAPER_START_CYCLES):
+    """ Returns the number of samples in the first num_cycles cycles of the
+    (2,2) mode h22. """
+    phase = np.abs(np.unwrap(np.angle(h22)) - np.angle(h22[0]))
+    return int(np.argmax(np.append(phase, np.inf) >= 2*np.pi*num_cycles))
+
+
+def _num_samples(dt, df):
+    """ Returns N = 1/(df dt), which must be an integer. """
+    num = 1./(df*dt)
+    if abs(num - round(num)) > 1e-6*num:
+        raise ValueError("1/(df*dt) = %.6f must be an integer for a "
+            "frequency domain waveform from a time domain model."%num)
+    return int(round(num))
+
+
+class FourierPlan(object):
+    """
+    Fourier transform of waveforms with time step dt onto the frequencies
+    k*df, -N/2 <= k < N/2, where N = 1/(df dt) is the length of the FFT.
+    Use get_plan rather than constructing this directly.
+    """
+
+    def __init__(self, num, dt):
+        self.num = num
+        self.dt = dt
+        self.df = 1./(num*dt)
+        # FFT output order is k = 0, 1, ..., N/2-1, -N/2, ..., -1
+        self.index = (np.arange(num) - num//2) % num
+        self.freqs = (np.arange(num) - num//2)*self.df
+        self._windows = {}
+
+    def select(self, freqs):
+        """ Returns the indices in the FFT output of freqs, which must be
+        integer multiples of df in [-N/2 df, N/2 df). """
+        k = np.asarray(freqs)/self.df
+        if np.max(np.abs(k - np.round(k))) > 1e-6:
+            raise ValueError("freqs must be integer multiples of df = 1/(N dt)"
+                " for a frequency domain waveform from a time domain model.")
+        k = np.round(k).astype(int)
+        if np.min(k) < -(self.num//2) or np.max(k) >= self.num - self.num//2:
+            raise ValueError("freqs must be below the Nyquist frequency "
+                "1/(2 dt).")
+        return k % self.num
+
+    def window(self, num_taper):
+        """ Returns the (cached) taper for the first num_taper samples. """
+        window = self._windows.get(num_taper)
+        if window is None:
+            window = planck_window(num_taper)
+            # Keep only a limited number of windows, as each waveform
+            # length can have its own
+            if len(self._windows) > 64:
+                self._windows.clear()
+            self._windows[num_taper] = window
+        return window
+
+    def __call__(self, t0, h, num_taper=0, index=None):
+        """
+    Fourier transforms h, sampled at the times t0 + dt*arange(h.shape[-1]).
+
+    INPUT
+    =====
+    t0:        Time of the first sample.
+    h:         Complex array, time is the last axis.
+    num_taper: Number of samples to taper at the start.
+    index:     Indices in the FFT output, from select, of the frequencies to
+               return. Default: None, in which case all N frequencies in
+               self.freqs are returned.
+
+    RETURNS
+    =====
+    htilde, with the frequencies in the last axis.
+        """
+        num = h.shape[-1]
+        if num > self.num:
+            raise ValueError("The waveform, with %d samples, is longer than "
+                "1/df = %d samples. Use a smaller df or a larger f_low."
+                %(num, self.num))
+        if num_taper > 0:
+            with _profiling.stage('taper'):
+                h = np.array(h)
+                h[..., :num_taper] *= self.window(num_taper)
+
+        with _profiling.stage('fft'):
+            htilde = _fft.fft(h, n=self.num, axis=-1)
+        if index is None:
+            index = self.index
+            freqs = self.freqs
+        else:
+            freqs = ((index + self.num//2) % self.num - self.num//2)*self.df
+        # Shift the time origin from t0 to 0, keeping the precision of h
+        shift = self.dt*np.exp(-2j*np.pi*freqs*t0)
+        return htilde[..., index] * shift.astype(htilde.dtype, copy=False)
+
+
+def get_plan(dt, df):
+    """ Returns a FourierPlan for time step dt and frequency step df. Plans
+    are reused for the same (N, dt). """
+    key = (_num_samples(dt, df), dt)
+    with _plans_lock:
+        plan = _plans.pop(key, None)
+        if plan is None:
+            plan = FourierPlan(*key)
+        # (re)insert as the most recently used
+        _plans[key] = plan
+        while len(_plans) > _MAX_PLANS:
+            _plans.popitem(last=False)
+    return plan
@@ -0,0 +1,216 @@
+""" Spin-weighted spherical harmonics and sums over waveform modes.
+
+The -2Ylm for all modes up to some ellMax are evaluated together from the
+Wigner d-matrix, as polynomials in cos(theta/2) and sin(theta/2), and agree
+with gwtools.harmonics.sYlm. Tables for fixed angles are cached, see
+sYlm_table.
+
+mode_sum computes h = sum_lm -2Ylm h_lm. For nonprecessing models the m<0
+modes follow from h_{l,-m} = (-1)^l h_lm^*, so
+    Y_lm h_lm + Y_{l,-m} h_{l,-m} = A h_lm.real + B h_lm.imag,
+with A = Y_lm + (-1)^l Y_{l,-m} and B = i (Y_lm - (-1)^l Y_{l,-m}). The sum
+over modes is done in blocks of samples with these coefficients, which
+needs neither conjugated copies of the modes nor full length temporary
+arrays. """
+
+from __future__ import division # for python 2
+
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@umassd.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma, Kevin Barkett"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import threading
+from collections import OrderedDict
+from math import factorial
+
+import numpy as np
+
+from . import profiling as _profiling
+
+
+# Tables returned by sYlm_table for scalar angles, keyed on
+# (ellMax, theta, phi)
+_tables = OrderedDict()
+_tables_lock = threading.Lock()
+_MAX_TABLES = 64
+
+# Polynomial terms for each ellMax, see _wigner_terms
+_terms = {}
+
+# Number of samples summed over at a time in mode_sum
+_BLOCK_SAMPLES = 16384
+
+
+def mode_list(ellMax):
+    """ Returns all (ell, m) modes with 2 <= ell <= ellMax, ordered by ell
+    and then m, which is the order of the rows of sYlm_table. """
+    return [(ell, m) for ell in range(2, ellMax+1)
+            for m in range(-ell, ell+1)]
+
+
+def _wigner_terms(ellMax):
+    """ Returns idx, coefs, cos_pow, sin_pow such that
+        -2Ylm(theta, 0) = sum_{k: idx[k] = i} coefs[k]
+            * cos(theta/2)**cos_pow[k] * sin(theta/2)**sin_pow[k],
+    where (ell, m) = mode_list(ellMax)[i]. This uses
+        sYlm = (-1)**s sqrt((2 ell + 1)/(4 pi)) d^ell_{m,-s}(theta) e^{i m phi}
+    and the explicit sum for the Wigner d-matrix.
+    """
+    terms = _terms.get(ellMax)
+    if terms is not None:
+        return terms
+
+    s = -2
+    idx, coefs, cos_pow, sin_pow = [], [], [], []
+    for i, (ell, m) in enumerate(mode_list(ellMax)):
+        mp = -s
+        norm = (-1)**s * np.sqrt((2*ell + 1)/(4*np.pi)) \
+            * np.sqrt(float(factorial(ell+m) * factorial(ell-m)
+                            * factorial(ell+mp) * factorial(ell-mp)))
+        for k in range(max(0, mp-m), min(ell+mp, ell-m)+1):
+            idx.append(i)
+            coefs.append(norm * (-1)**(k-mp+m) / float(factorial(ell+mp-k)
+                * factorial(k) * factorial(ell-k-m) * factorial(k-mp+m)))
+            cos_pow.append(2*ell - 2*k + mp - m)
+            sin_pow.append(2*k - mp + m)
+
+    terms = (np.array(idx), np.array(coefs), np.array(cos_pow),
+             np.array(sin_pow))
+    _terms[ellMax] = terms
+    return terms
+
+
+def _sYlm_table(ellMax, theta, phi):
+    """ sYlm_table without the cache """
+    theta, phi = np.broadcast_arrays(np.asarray(theta, dtype=float),
+                                     np.asarray(phi, dtype=float))
+    idx, coefs, cos_pow, sin_pow = _wigner_terms(ellMax)
+    num_modes = (ellMax + 1)**2 - 4
+
+    # (num_terms, num_angles)
+    values = np.multiply.outer(coefs, np.ones(theta.size))
+    values *= np.cos(theta.ravel()/2)**cos_pow[:, None]
+    values *= np.sin(theta.ravel()/2)**sin_pow[:, None]
+    ylm = np.zeros((num_modes, theta.size))
+    np.add.at(ylm, idx, values)
+
+    m = np.array([m for (ell, m) in mode_list(ellMax)])
+    ylm = ylm * np.exp(1j*np.multiply.outer(m, phi.ravel()))
+    return ylm.reshape((num_modes,) + theta.shape)
+
+
+def sYlm_table(ellMax, theta, phi):
+    """ Returns the -2Ylm(theta, phi) for all modes in mode_list(ellMax), as
+    an array with shape (len(modes),) + shape, where shape is the broadcast
+    shape of theta and phi.
+
+    Tables for scalar theta and phi are cached, and should not be modified.
+    """
+    if np.ndim(theta) or np.ndim(phi):
+        return _sYlm_table(ellMax, theta, phi)
+
+    key = (ellMax, float(theta), float(phi))
+    with _tables_lock:
+        table = _tables.pop(key, None)
+        if table is None:
+            table = _sYlm_table(*key)
+            table.flags.writeable = False
+        # (re)insert as the most recently used
+        _tables[key] = table
+        while len(_tables) > _MAX_TABLES:
+            _tables.popitem(last=False)
+    return table
+
+
+def mode_sum_coefs(modes, theta, phi, fake_neg_modes=False):
+    """ Returns coefs, coefs_neg such that the sum over modes at theta, phi
+    is coefs.dot(h) + coefs_neg.dot(h.conjugate()), where h is an array of
+    the modes ordered as in modes. If fake_neg_modes is True, the m<0 modes
+    are deduced from the m>0 modes, and should not be in modes.
+
+    theta and phi can also be arrays, in which case coefs and coefs_neg
+    have an extra trailing axis for each of their broadcast dimensions.
+    """
+    ellMax = max(ell for (ell, m) in modes)
+    table = sYlm_table(ellMax, theta, phi)
+    # Row of (ell, m) in the table
+    rows = [ell*ell - 4 + ell + m for (ell, m) in modes]
+    coefs = table[rows]
+
+    coefs_neg = np.zeros(coefs.shape, dtype=complex)
+    if fake_neg_modes:
+        for i, (ell, m) in enumerate(modes):
+            if m > 0:
+                coefs_neg[i] = table[ell*ell - 4 + ell - m] * (-1)**ell
+            elif m < 0:
+                raise Exception('Expected only m>0 modes.')
+    return coefs, coefs_neg
+
+
+@_profiling.timed('mode_sum')
+def mode_sum(h_modes, coefs, coefs_neg=None, scale=1., out=None):
+    """ Returns scale*(coefs.dot(h) + coefs_neg.dot(h.conjugate())), where h
+    is an array of the modes in h_modes, a list of equal length complex
+    arrays, and coefs, coefs_neg are as returned by mode_sum_coefs for a
+    single theta, phi. The result is written to out if given.
+    """
+    num = len(h_modes[0])
+    # complex64 for single precision models
+    dtype = np.result_type(np.complex64, *[h.dtype for h in h_modes])
+    real_dtype = np.finfo(dtype).dtype
+    if out is None:
+        out = np.zeros(num, dtype=dtype)
+    else:
+        out[:] = 0
+    if coefs_neg is None:
+        coefs_neg = np.zeros(len(h_modes), dtype=complex)
+
+    # Real 2x2 matrices taking (h.real, h.imag) of each mode to its
+    # contribution to (out.real, out.imag)
+    A = scale*(coefs + coefs_neg)
+    B = 1j*scale*(coefs - coefs_neg)
+    mats = np.array([[A.real, A.imag], [B.real, B.imag]]).transpose(2, 0, 1)
+    mats = mats.astype(real_dtype)
+
+    h_real = [np.ascontiguousarray(h, dtype=dtype).view(real_dtype).reshape(
+        num, 2) for h in h_modes]
+    if out.flags.c_contiguous and (out.dtype == dtype):
+        out_real = out.view(real_dtype).reshape(num, 2)
+        res = out
+    else:
+        res = np.zeros(num, dtype=dtype)
+        out_real = res.view(real_dtype).reshape(num, 2)
+
+    tmp = np.empty((min(num, _BLOCK_SAMPLES), 2), dtype=real_dtype)
+    for start in range(0, num, _BLOCK_SAMPLES):
+        block = out_real[start:start+_BLOCK_SAMPLES]
+        tmp_block = tmp[:len(block)]
+        for i, h in enumerate(h_real):
+            np.dot(h[start:start+_BLOCK_SAMPLES], mats[i], out=tmp_block)
+            block += tmp_block
+
+    if res is not out:
+        out[:] = res
+    return out
@@ -28,15 +28,11 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-if __package__ is "" or "None": # py2 and py3 compatible
-  print("setting __package__ to gwsurrogate.new so relative imports work")
-  __package__="gwsurrogate.new"
 from .saveH5Object import SimpleH5Object  # assumes unique global name
 
 from gwsurrogate import parametric_funcs
 import numpy as np
 import gwtools
-from gwsurrogate.eval_pysur import evaluate_fit
 
 import warnings
 
@@ -91,11 +87,46 @@ class pySurrogateFit(SimpleH5Object):
         self.h5_prepare_subs()
 
     def h5_prepare_subs(self):
-        self.fitFunc = evaluate_fit.getFitEvaluator(self.fit_data)
+        self.fitFunc = None
+        self._gpr_predictor = None
+        if self.fit_data is None:
+            return
+
+        # Imported here as evaluate_fit imports scikit-learn, which is slow
+        from gwsurrogate.eval_pysur import evaluate_fit
+
+        # GPR fits can be evaluated at many points with a single predict
+        # call, see batch_call. The same predictor is used for single
+        # points, as in evaluate_fit.getFitEvaluator, so the training data
+        # is held only once.
+        if 'fitType' in self.fit_data and self.fit_data['fitType'] == 'GPR':
+            self._gpr_predictor = evaluate_fit.GPRPredictor(self.fit_data)
+            self.fitFunc = self._gpr_fit
+        else:
+            self.fitFunc = evaluate_fit.getFitEvaluator(self.fit_data)
+
+    def _gpr_fit(self, x):
+        return self._gpr_predictor.GPR_predict([x])['y'][0]
 
     def __call__(self, x):
         return self.fitFunc(x)
 
+    def _map_params(self, x):
+        """
+        Maps the parameters x, with shape (dim,) or (N, dim), to the
+        parameters of the fit. These are the same here.
+        """
+        return np.asarray(x)
+
+    def batch_call(self, xs):
+        """
+        Evaluates the fit at each row of xs, which has shape (N, dim).
+        Returns an array with shape (N,).
+        """
+        if self._gpr_predictor is not None:
+            return self._gpr_predictor.GPR_predict(np.atleast_2d(xs))['y']
+        return np.array([self.fitFunc(x) for x in xs])
+
 
 class NRHybSur3dq8Fit(pySurrogateFit):
     """
@@ -107,15 +138,22 @@ class NRHybSur3dq8Fit(pySurrogateFit):
     chi_a = (chi1z - chi2z)/2.
     """
 
-    def __call__(self, x):
-        q, chi1z, chi2z = x
+    def _map_params(self, x):
+        """
+        Maps [q, chi1z, chi2z] to [np.log(q), chiHat, chi_a]. x can also have
+        shape (N, 3), in which case the result has shape (N, 3).
+        """
+        q, chi1z, chi2z = np.transpose(x)
 
         eta = q/(1.+q)**2
         chi_wtAvg = (q*chi1z+chi2z)/(1.+q)
         chiHat = (chi_wtAvg - 38.*eta/113.*(chi1z + chi2z))/(1. - 76.*eta/113.)
         chi_a = (chi1z - chi2z)/2.
 
-        mapped_x = [np.log(q), chiHat, chi_a]
+        return np.transpose([np.log(q), chiHat, chi_a])
+
+    def __call__(self, x):
+        mapped_x = list(self._map_params(x))
 
         with warnings.catch_warnings():
             # Ignore this specific GPR warning.
@@ -128,6 +166,16 @@ class NRHybSur3dq8Fit(pySurrogateFit):
 
             return super(NRHybSur3dq8Fit, self).__call__(mapped_x)
 
+    def batch_call(self, xs):
+        mapped_xs = self._map_params(np.atleast_2d(xs))
+
+        with warnings.catch_warnings():
+            # See __call__
+            warnings.filterwarnings("ignore", message="Predicted variances"
+                " smaller than 0. Setting those variances to 0.")
+
+            return super(NRHybSur3dq8Fit, self).batch_call(mapped_xs)
+
 
 class MappedPolyFit1D_q10_q_to_nu(Polyfit1D):
     """
@@ -140,6 +188,221 @@ class MappedPolyFit1D_q10_q_to_nu(Polyfit1D):
         return super(MappedPolyFit1D_q10_q_to_nu, self).__call__(mapped_x)
 
 
+def _as_str(value):
+    """ Returns value as str, strings can be read from h5 files as bytes """
+    if isinstance(value, bytes):
+        return value.decode()
+    return str(value)
+
+
+def _scalar(value):
+    """ Returns value, which can be read from h5 files as an array with one
+    element, as float """
+    return float(np.ravel(value)[0])
+
+
+# Kernels that StackedGPRFits can evaluate, and their number of sub kernels
+_STACKED_KERNELS = {
+    'Sum': 2,
+    'Product': 2,
+    'ConstantKernel': 0,
+    'RBF': 0,
+    'WhiteKernel': 0,
+        }
+
+
+def _kernel_signature(kernel):
+    """
+    Returns the structure of a GPR kernel dict as nested tuples of kernel
+    names, or None if it includes kernels that StackedGPRFits can not
+    evaluate.
+    """
+    name = _as_str(kernel['name'])
+    if name not in _STACKED_KERNELS:
+        return None
+    subs = [_kernel_signature(kernel['k%d'%(i+1)])
+            for i in range(_STACKED_KERNELS[name])]
+    if None in subs:
+        return None
+    return (name,) + tuple(subs)
+
+
+def _gpr_signature(node_function):
+    """
+    Returns a key such that GPR fits with the same key can be evaluated
+    together by StackedGPRFits, or None if node_function is not such a fit.
+    """
+    if not isinstance(node_function, pySurrogateFit):
+        return None
+    fit_data = node_function.fit_data
+    if fit_data is None or 'fitType' not in fit_data \
+            or _as_str(fit_data['fitType']) != 'GPR':
+        return None
+    gpr_params = fit_data['GPR_params']
+    kernel = _kernel_signature(gpr_params['kernel_'])
+    if kernel is None:
+        return None
+    dim = np.shape(gpr_params['X_train_'])[1]
+    return (type(node_function), kernel, dim)
+
+
+class _StackedKernel(object):
+    """
+    A kernel of the same structure for many GPR fits, with the
+    hyperparameters of all fits in stacked arrays. Evaluating it at points
+    with shape (N, dim) gives the kernel matrices of all fits, with shape
+    (N, n_fits, n_train).
+    """
+
+    def __init__(self, kernels, X_train):
+        """
+        kernels: The kernel dicts of the fits, which all have the same
+                 structure.
+        X_train: The training points of the fits, padded to the same
+                 number, with shape (n_fits, n_train, dim).
+        """
+        self.name = _as_str(kernels[0]['name'])
+        self.subs = [_StackedKernel([k['k%d'%(i+1)] for k in kernels],
+                                    X_train)
+                     for i in range(_STACKED_KERNELS[self.name])]
+
+        if self.name == 'ConstantKernel':
+            self.constant = np.array([_scalar(k['constant_value'])
+                                      for k in kernels])[None, :, None]
+        elif self.name == 'RBF':
+            n_fits, n_train, dim = X_train.shape
+            length_scale = np.array([np.broadcast_to(
+                np.asarray(k['length_scale'], dtype=float), (dim,))
+                for k in kernels])
+            inv_ls2 = 1./length_scale**2
+            # |z - X|^2/ls^2 = z^2/ls^2 - 2 z X/ls^2 + X^2/ls^2, where the
+            # middle term for all fits is one matrix product
+            self.inv_ls2 = inv_ls2.T
+            self.cross = np.reshape(X_train*inv_ls2[:, None, :],
+                                    (n_fits*n_train, dim)).T
+            self.X_sq = np.sum(X_train**2*inv_ls2[:, None, :], axis=-1)
+
+    def __call__(self, z):
+        if self.name == 'Sum':
+            return self.subs[0](z) + self.subs[1](z)
+        if self.name == 'Product':
+            return self.subs[0](z)*self.subs[1](z)
+        if self.name == 'ConstantKernel':
+            return self.constant
+        if self.name == 'WhiteKernel':
+            # Only adds noise at the training points
+            return 0.
+        n_fits, n_train = self.X_sq.shape
+        sq_dist = (z**2).dot(self.inv_ls2)[:, :, None] \
+            - 2.*z.dot(self.cross).reshape(len(z), n_fits, n_train) \
+            + self.X_sq
+        return np.exp(-0.5*np.maximum(sq_dist, 0.))
+
+
+class _StackedGPRGroup(object):
+    """ GPR fits with the same kernel structure, see StackedGPRFits """
+
+    def __init__(self, fits):
+        self.map_params = fits[0]._map_params
+        data = [f.fit_data for f in fits]
+        gpr = [d['GPR_params'] for d in data]
+        X_trains = [np.asarray(g['X_train_'], dtype=float) for g in gpr]
+        n_train = max(len(X) for X in X_trains)
+        dim = X_trains[0].shape[1]
+
+        # Fits with fewer training points are padded with zero alpha, so
+        # the padding does not contribute
+        X_train = np.zeros((len(fits), n_train, dim))
+        self.alpha = np.zeros((len(fits), n_train))
+        for i, (X, g) in enumerate(zip(X_trains, gpr)):
+            X_train[i, :len(X)] = X
+            self.alpha[i, :len(X)] = np.ravel(g['alpha_'])
+        self.kernel = _StackedKernel([g['kernel_'] for g in gpr], X_train)
+
+        y_train_std = np.array([_scalar(g.get('_y_train_std', 1.))
+                                for g in gpr])
+        y_train_mean = np.array([_scalar(g['_y_train_mean']) for g in gpr])
+        data_std = np.array([_scalar(d['data_std']) for d in data])
+        data_mean = np.array([_scalar(d['data_mean']) for d in data])
+        # fit = data_mean + data_std*(y_train_mean + y_train_std*K.alpha)
+        #       + linear fit
+        self.scale = data_std*y_train_std
+        self.offset = data_mean + data_std*y_train_mean
+
+        self.lin_coef = np.zeros((dim, len(fits)))
+        for i, d in enumerate(data):
+            lin_reg_params = d.get('lin_reg_params')
+            if lin_reg_params is not None:
+                self.lin_coef[:, i] = np.ravel(lin_reg_params['coef_'])
+                self.offset[i] += _scalar(lin_reg_params['intercept_'])
+
+    def __call__(self, z):
+        """ Returns the fits at the mapped parameters z, with shape
+        (N, n_fits) """
+        K = np.broadcast_to(self.kernel(z), (len(z),) + self.alpha.shape)
+        y = np.einsum('nkt,kt->nk', K, self.alpha)
+        return self.offset + self.scale*y + z.dot(self.lin_coef)
+
+
+class StackedGPRFits(object):
+    """
+    Evaluates many GPR fits, such as all the node functions of a surrogate,
+    at once.
+
+    The training points, kernel hyperparameters and alpha vectors of all fits
+    are kept in stacked arrays. Fits whose kernels have the same structure
+    are evaluated together, with one kernel matrix computation per call,
+    which for a batch of parameters involves a single matrix product. This
+    avoids the per-fit overhead of evaluating each fit separately. The
+    supported kernels are sums and products of ConstantKernel, RBF and
+    WhiteKernel. Use stack_gpr_fits to construct this.
+    """
+
+    # Maximum number of kernel matrix entries computed at once
+    max_kernel_size = 2**22
+
+    def __init__(self, node_functions):
+        """
+        node_functions: A list of pySurrogateFit GPR fits, or of NodeFunction
+                        instances holding these.
+        """
+        fits = [getattr(nf, 'node_function', nf) for nf in node_functions]
+        self.n_fits = len(fits)
+        groups = {}
+        for i, fit in enumerate(fits):
+            signature = _gpr_signature(fit)
+            if signature is None:
+                raise ValueError('Node function %s can not be stacked.'%i)
+            groups.setdefault(signature, []).append(i)
+        self._groups = [(np.array(idx), _StackedGPRGroup([fits[i]
+                        for i in idx])) for idx in groups.values()]
+
+    def __call__(self, xs):
+        """
+        Evaluates all fits at each row of xs, which has shape (N, dim).
+        Returns an array with shape (n_fits, N).
+        """
+        xs = np.atleast_2d(xs)
+        res = np.empty((self.n_fits, len(xs)))
+        for idx, group in self._groups:
+            z = np.atleast_2d(np.asarray(group.map_params(xs), dtype=float))
+            step = max(1, self.max_kernel_size//group.alpha.size)
+            for start in range(0, len(z), step):
+                res[idx, start:start+step] = group(z[start:start+step]).T
+        return res
+
+
+def stack_gpr_fits(node_functions):
+    """
+    Returns a StackedGPRFits of node_functions, or None if some of them are
+    not GPR fits that can be stacked.
+    """
+    fits = [getattr(nf, 'node_function', nf) for nf in node_functions]
+    if len(fits) == 0 or any(_gpr_signature(f) is None for f in fits):
+        return None
+    return StackedGPRFits(fits)
+
+
 NODE_CLASSES = {
     "Dummy": DummyNodeFunction,
     "Polyfit1D": Polyfit1D,
@@ -174,5 +437,15 @@ class NodeFunction(SimpleH5Object):
     def __call__(self, x):
         return self.node_function(x)
 
+    def batch_call(self, xs):
+        """
+        Evaluates the node at each row of xs. Node functions that can be
+        evaluated at many points at once should define a batch_call method,
+        otherwise they are called once per row.
+        """
+        if hasattr(self.node_function, 'batch_call'):
+            return self.node_function.batch_call(xs)
+        return np.array([self.node_function(x) for x in xs])
+
     def h5_prepare_subs(self):
         self.node_function = NODE_CLASSES[self.node_class]()
@@ -11,12 +11,14 @@ NOTE: Many of these functions are borrowed from the NR7dq2 python package.
 """
 
 import os
+import threading
 import numpy as np
 import h5py
 from gwsurrogate.precessing_utils import _utils
 import warnings
-from gwtools.harmonics import sYlm
-from gwsurrogate.new.surrogate import _splinterp_Cwrapper
+from gwsurrogate import harmonics as _harmonics
+from gwsurrogate import profiling as _profiling
+from gwsurrogate.new.surrogate import _splinterp_Cwrapper, _real_dtype
 
 
 ###############################################################################
@@ -105,6 +107,7 @@ http://arxiv.org/abs/1302.2919
 
     return matrices
 
+@_profiling.timed('rotation')
 def rotateWaveform(quat, h):
     """
 Transforms a waveform from the coprecessing frame to the inertial frame.
@@ -322,8 +325,7 @@ cubic interpolation. Use get_time_deriv_from_index when possible.
 
         ts = self.t[imin:imin+4]
 
-        dydt = np.array([_splinterp_Cwrapper(np.array([t]), ts, x)[0] \
-                for x in dydts.T])
+        dydt = _splinterp_Cwrapper(np.array([t]), ts, dydts.T)[:, 0]
 
         return dydt
 
@@ -380,6 +382,7 @@ cubic interpolation. Use get_time_deriv_from_index when possible.
 
         return t_ref
 
+    @_profiling.timed('dynamics')
     def __call__(self, q, chiA0, chiB0, init_quat=None, init_orbphase=0.0, \
             t_ref=None, omega_ref=None, omega_low=None):
         """
@@ -698,18 +701,22 @@ def _extract_component_data(h5_group):
 
 def _eval_comp(data, q, chiA, chiB):
     nodes = []
-    for orders, coefs, ni in zip(data['orders'], data['coefs'],
-            data['nodeIndices']):
+    with _profiling.stage('fits'):
+        for orders, coefs, ni in zip(data['orders'], data['coefs'],
+                data['nodeIndices']):
 
-        fit_data = {
-            'bfOrders': orders,
-            'coefs': coefs,
-            }
-        x = np.append(q, np.append(chiA[ni], chiB[ni]))
-        fit_params = _get_fit_params(x)
-        nodes.append(_eval_scalar_fit(fit_data, fit_params))
+            fit_data = {
+                'bfOrders': orders,
+                'coefs': coefs,
+                }
+            x = np.append(q, np.append(chiA[ni], chiB[ni]))
+            fit_params = _get_fit_params(x)
+            nodes.append(_eval_scalar_fit(fit_data, fit_params))
 
-    return np.array(nodes).dot(data['EI_basis'])
+    # Single precision bases give single precision results
+    with _profiling.stage('ei_basis'):
+        return np.array(nodes, dtype=data['EI_basis'].dtype).dot(
+            data['EI_basis'])
 
 def _assemble_mode_pair(rep, rem, imp, imm):
     hplus = rep + 1.j*imp
@@ -725,32 +732,68 @@ def _assemble_mode_pair(rep, rem, imp, imm):
 class CoorbitalWaveformSurrogate:
     """This surrogate models the waveform in the coorbital frame."""
 
-    def __init__(self, h5file):
+    def __init__(self, h5file, ellMax=None, lazy=False, dtype=np.float64):
+        """
+h5file: An open h5py File with the surrogate data.
+ellMax: Load only modes with ell <= ellMax. Default: None, in which case all
+        modes in h5file are loaded.
+lazy:   If True, the data for each ell is read from h5file when it is first
+        evaluated, so h5file should be kept open. Default: False.
+dtype:  Precision of the EI bases and the evaluated modes, np.float32 or
+        np.float64 (or the corresponding complex types). Default: np.float64.
+        """
+        self.dtype = _real_dtype(dtype)
         self.ellMax = 2
         while 'hCoorb_%s_%s_Re+'%(self.ellMax+1, self.ellMax+1) in h5file.keys():
             self.ellMax += 1
+        if ellMax is not None:
+            if ellMax > self.ellMax:
+                raise ValueError('ellMax=%s is greater than the max allowed '
+                    'ell=%s.'%(ellMax, self.ellMax))
+            self.ellMax = ellMax
 
         self.t = h5file['t_coorb'].value
 
         self.data = {}
         self.mode_list = []
         for ell in range(2, self.ellMax+1):
-            # m=0 is different
             self.mode_list.append( (ell,0) )
-            for reim in ['real', 'imag']:
-                group = h5file['hCoorb_%s_0_%s'%(ell, reim)]
-                self.data['%s_0_%s'%(ell, reim)] \
-                        = _extract_component_data(group)
-
             for m in range(1, ell+1):
                 self.mode_list.append( (ell,m) )
                 self.mode_list.append( (ell,-m) )
+
+        self._h5file = h5file
+        self._lazy_lock = threading.Lock()
+        if not lazy:
+            for ell in range(2, self.ellMax+1):
+                self._load_ell(ell)
+
+    def _load_ell(self, ell):
+        """ Reads the data for all modes with this ell from the h5 file. """
+        with self._lazy_lock:
+            if '%s_0_real'%(ell) in self.data:
+                return
+            data = {}
+            # m=0 is different
+            for reim in ['real', 'imag']:
+                group = self._h5file['hCoorb_%s_0_%s'%(ell, reim)]
+                data['%s_0_%s'%(ell, reim)] = _extract_component_data(group)
+
+            for m in range(1, ell+1):
                 for reim in ['Re', 'Im']:
                     for pm in ['+', '-']:
-                        group = h5file['hCoorb_%s_%s_%s%s'%(ell, m, reim, pm)]
+                        group = self._h5file['hCoorb_%s_%s_%s%s'%(ell, m, reim, pm)]
                         tmp_data = _extract_component_data(group)
-                        self.data['%s_%s_%s%s'%(ell, m, reim, pm)] = tmp_data
+                        data['%s_%s_%s%s'%(ell, m, reim, pm)] = tmp_data
+
+            for comp_data in data.values():
+                comp_data['EI_basis'] = comp_data['EI_basis'].astype(
+                    self.dtype, copy=False)
 
+            # Add the m=0 data last, other threads use it to check whether
+            # this ell has been loaded
+            for key in sorted(data.keys(), key=lambda k: '_0_' in k):
+                self.data[key] = data[key]
 
     def __call__(self, q, chiA, chiB, ellMax=4):
         """
@@ -761,9 +804,13 @@ chiA, chiB: The time-dependent spin in the coorbital frame. These should have
 ellMax: The maximum ell mode to evaluate.
         """
         nmodes = ellMax*ellMax + 2*ellMax - 3
-        modes = 1.j*np.zeros((nmodes, len(self.t)))
+        modes = np.zeros((nmodes, len(self.t)),
+            dtype=np.result_type(self.dtype, np.complex64))
 
         for ell in range(2, ellMax+1):
+            if '%s_0_real'%(ell) not in self.data:
+                self._load_ell(ell)
+
             # m=0 is different
             re = _eval_comp(self.data['%s_0_real'%(ell)], q, chiA, chiB)
             im = _eval_comp(self.data['%s_0_imag'%(ell)], q, chiA, chiB)
@@ -806,15 +853,21 @@ def inertial_waveform_modes(t, orbphase, quat, h_coorb):
     return h_inertial
 
 def splinterp_many(t_out, t_in, many_things):
-    return np.array([_splinterp_Cwrapper(t_out, t_in, thing) \
-            for thing in many_things])
+    """ Interpolates each row of many_things, with one spline setup """
+    return _splinterp_Cwrapper(t_out, t_in, np.asarray(many_things))
+
+def _interp_dynamics(t_out, t_in, quat, orbphase, chiA, chiB):
+    """ Interpolates the dynamics, with quat of shape (4, len(t_in)) and
+    chiA, chiB of shape (len(t_in), 3), to t_out with one spline setup.
+    Returns quat, orbphase, chiA, chiB in the same format.
+    """
+    dyn = splinterp_many(t_out, t_in,
+                         np.vstack([quat, orbphase, chiA.T, chiB.T]))
+    return dyn[:4], dyn[4], dyn[5:8].T, dyn[8:11].T
 
 def mode_sum(h_modes, ellMax, theta, phi):
-    coefs = []
-    for ell in range(2, ellMax+1):
-        for m in range(-ell, ell+1):
-            coefs.append(sYlm(-2, ell, m, theta, phi))
-    return np.array(coefs).dot(h_modes)
+    coefs = _harmonics.sYlm_table(ellMax, theta, phi)
+    return _harmonics.mode_sum(list(h_modes), coefs)
 
 def normalize_spin(chi, chi_norm):
     if chi_norm > 0.:
@@ -831,15 +884,33 @@ A wrapper class for the precessing surrogate models.
 See the __call__ method on how to evaluate waveforms.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, ellMax=None, lazy=False, dtype=np.float64):
         """
 Loads the surrogate model data.
 
 filename: The hdf5 file containing the surrogate data."
+ellMax:   Load only the waveform modes with ell <= ellMax. Evaluations are then
+          limited to this ellMax. Default: None, in which case all modes are
+          loaded.
+lazy:     If True, the waveform data for each ell is read when it is first
+          needed, and the hdf5 file is kept open until close() is called.
+          Default: False.
+dtype:    Precision of the waveform, np.float32 (or np.complex64) or
+          np.float64. In single precision the coorbital waveform EI bases are
+          stored, and the waveform modes are returned, in single precision.
+          The dynamics are always evaluated in double precision.
+          Default: np.float64.
         """
         h5file = h5py.File(filename, 'r')
+        self.dtype = _real_dtype(dtype)
         self.dynamics_sur = DynamicsSurrogate(h5file)
-        self.coorb_sur = CoorbitalWaveformSurrogate(h5file)
+        self.coorb_sur = CoorbitalWaveformSurrogate(h5file, ellMax=ellMax,
+            lazy=lazy, dtype=dtype)
+        if lazy:
+            self._h5file = h5file
+        else:
+            h5file.close()
+            self._h5file = None
         self.t_coorb = self.coorb_sur.t
         self.tds = np.append(self.dynamics_sur.t[0:6:2], \
             self.dynamics_sur.t[6:])
@@ -849,6 +920,11 @@ filename: The hdf5 file containing the surrogate data."
 
         self.mode_list = self.coorb_sur.mode_list
 
+    def close(self):
+        """ Closes the hdf5 file kept open when loading with lazy=True. """
+        if self._h5file is not None:
+            self._h5file.close()
+            self._h5file = None
 
     def _check_unused_opts(self, precessing_opts):
         """ Call this at the end of call module to check if all the
@@ -916,7 +992,9 @@ Arguments:
     mode_list:  This should be None, use ellMax instead.
     ellMax:     The maximum ell modes to use. The NRSur7dq4 surrogate model
                 contains modes up to L=4. Using ellMax=2 or ellMax=3 reduces
-                the evaluation time.
+                the evaluation time. Cannot be larger than the ellMax used
+                when loading the model. Default: None, in which case all
+                loaded modes are used.
 
     precessing_opts:
                 A dictionary containing optional parameters for a precessing
@@ -956,9 +1034,131 @@ Returns:
         if par_dict is not None:
             raise ValueError('par_dict should be None for this model')
 
+        h_inertial, t0, ellMax, return_dynamics, dyn = self._sparse_waveform(
+            x, fM_low, fM_ref, ellMax, precessing_opts)
+        quat_dyn, orbphase_dyn, chiA_copr_dyn, chiB_copr_dyn, chiA_norm, \
+            chiB_norm, chiA_copr, chiB_copr, orbphase, quat = dyn
+
+        timesM, do_interp = self._output_times(t0, dtM, timesM)
+
+        if do_interp:
+            h_inertial = self._interp_modes(timesM, h_inertial)
+
+        # Make mode dict
+        h = self._mode_dict(h_inertial, ellMax)
+
+        #  Transform and interpolate spins if needed
+        if return_dynamics:
+
+            if do_interp:
+                ## Interpolate from self.tds to timesM because that is what
+                ## is done in the LAL code.
+                quat, orbphase, chiA_copr, chiB_copr = _interp_dynamics(
+                    timesM, self.tds, quat_dyn, orbphase_dyn, chiA_copr_dyn,
+                    chiB_copr_dyn)
+                chiA_copr = normalize_spin(chiA_copr, chiA_norm)
+                chiB_copr = normalize_spin(chiB_copr, chiB_norm)
+                quat = quat/np.sqrt(np.sum(abs(quat)**2, 0))
+
+            chiA_inertial = transformTimeDependentVector(quat, chiA_copr.T).T
+            chiB_inertial = transformTimeDependentVector(quat, chiB_copr.T).T
+
+            dynamics = {
+                'chiA': chiA_inertial,
+                'chiB': chiB_inertial,
+                'q_copr': quat,
+                'orbphase': orbphase,
+                }
+        else:
+            dynamics = None
+
+        return timesM, h, dynamics
+
+    def call_chunked(self, x, chunk_samples, fM_low=None, fM_ref=None,
+            dtM=None, timesM=None, dfM=None, freqsM=None, mode_list=None,
+            ellMax=None, precessing_opts=None, tidal_opts=None,
+            par_dict=None):
+        """
+Evaluates a precessing surrogate model in chunks of time samples.
+
+Arguments:
+    chunk_samples: Maximum number of time samples in each chunk.
+    All other arguments are the same as for __call__, except that
+    precessing_opts['return_dynamics'] is not allowed.
+
+    The waveform is computed on the sparse domain self.t_coorb, and only
+    interpolated to the output times one chunk at a time. So only the sparse
+    data and the current chunk are held in memory.
+
+Returns:
+    timesM_start, timesM_end, chunks.
+        timesM_start, timesM_end: The first and last time of the full
+            waveform.
+        chunks: A generator of (timesM, h) tuples, where timesM and h are
+            contiguous pieces of the domain and h returned by __call__, in
+            order.
+        """
+        if dfM is not None or freqsM is not None:
+            raise ValueError('Expected dfM and freqsM to be None for a Time'
+                ' domain model')
+
+        if par_dict is not None:
+            raise ValueError('par_dict should be None for this model')
+
+        if precessing_opts is not None \
+                and precessing_opts.get('return_dynamics', False):
+            raise ValueError('return_dynamics is not supported for chunked'
+                ' evaluations')
+
+        h_inertial, t0, ellMax, _, _ = self._sparse_waveform(x, fM_low,
+            fM_ref, ellMax, precessing_opts)
+
+        if (dtM is None) and (timesM is None):
+            timesM = np.copy(self.t_coorb)
+            do_interp = False
+            num_times = len(timesM)
+        else:
+            do_interp = True
+            if dtM is not None:
+                if t0 is None:
+                    t0 = self.t_coorb[0]
+                num_times = int(np.ceil((self.t_coorb[-1] - t0)/dtM))
+            else:
+                self._output_times(t0, dtM, timesM)
+                num_times = len(timesM)
+
+        def times_slice(a, b):
+            if dtM is not None:
+                return t0 + dtM*np.arange(a, b)
+            return timesM[a:b]
+
+        def chunks():
+            for a in range(0, num_times, chunk_samples):
+                b = min(a + chunk_samples, num_times)
+                t = times_slice(a, b)
+                if do_interp:
+                    h_chunk = self._interp_modes(t, h_inertial)
+                else:
+                    h_chunk = h_inertial[:, a:b]
+                yield t, self._mode_dict(h_chunk, ellMax)
+
+        return times_slice(0, 1)[0], times_slice(num_times - 1, num_times)[0], \
+            chunks()
+
+    def _sparse_waveform(self, x, fM_low, fM_ref, ellMax, precessing_opts):
+        """ Evaluates the inertial frame modes on the sparse domain
+        self.t_coorb.
+
+        Returns h_inertial, t0, ellMax, return_dynamics, dyn, where t0 is the
+        start time for the given fM_low (None if fM_low is 0), and dyn holds
+        the dynamics data needed to compute the dynamics output of __call__.
+        """
+        # Copy so that the caller's dict is not modified, and so that a
+        # shared dict can be used from several threads.
         if precessing_opts is None:
             precessing_opts = {}
-
+        else:
+            precessing_opts = dict(precessing_opts)
 
         init_orbphase = precessing_opts.pop('init_orbphase', 0)
         init_quat = precessing_opts.pop('init_quat', None)
@@ -966,9 +1166,10 @@ Returns:
         self._check_unused_opts(precessing_opts)
 
         if ellMax is None:
-            ellMax = 4
-        if ellMax > 4:
-            raise ValueError("NRSur7dq4 only allows ellMax<=4.")
+            ellMax = self.coorb_sur.ellMax
+        if ellMax > self.coorb_sur.ellMax:
+            raise ValueError("NRSur7dq4 only allows ellMax<=%s."%(
+                self.coorb_sur.ellMax))
 
         q, chiA0, chiB0 = x
 
@@ -1003,13 +1204,12 @@ Returns:
         # Interpolate to the coorbital time grid, and transform to coorb frame.
         # Interpolate first since coorbital spins oscillate faster than
         # coprecessing spins
-        chiA_copr = splinterp_many(self.t_coorb, self.tds, chiA_copr_dyn.T).T
-        chiB_copr = splinterp_many(self.t_coorb, self.tds, chiB_copr_dyn.T).T
+        quat, orbphase, chiA_copr, chiB_copr = _interp_dynamics(
+            self.t_coorb, self.tds, quat_dyn, orbphase_dyn, chiA_copr_dyn,
+            chiB_copr_dyn)
         chiA_copr = normalize_spin(chiA_copr, chiA_norm)
         chiB_copr = normalize_spin(chiB_copr, chiB_norm)
-        orbphase = _splinterp_Cwrapper(self.t_coorb, self.tds, orbphase_dyn)
 
-        quat = splinterp_many(self.t_coorb, self.tds, quat_dyn)
         quat = quat/np.sqrt(np.sum(abs(quat)**2, 0))
         chiA_coorb, chiB_coorb = coorb_spins_from_copr_spins(
                 chiA_copr, chiB_copr, orbphase)
@@ -1023,6 +1223,15 @@ Returns:
         h_inertial = inertial_waveform_modes(self.t_coorb, orbphase, quat,
                 h_coorb)
 
+        dyn = (quat_dyn, orbphase_dyn, chiA_copr_dyn, chiB_copr_dyn,
+            chiA_norm, chiB_norm, chiA_copr, chiB_copr, orbphase, quat)
+        return h_inertial, t0, ellMax, return_dynamics, dyn
+
+    def _output_times(self, t0, dtM, timesM):
+        """ Returns the output times and whether the sparse waveform needs
+        to be interpolated to them. t0 is the start time returned by
+        _sparse_waveform.
+        """
         if timesM is not None:
             if timesM[-1] > self.t_coorb[-1] + 0.01:
                 raise Exception("'times' includes times larger than the"
@@ -1031,65 +1240,34 @@ Returns:
                 raise Exception("'times' starts before start of domain. Try"
                     " increasing initial value of times or reducing f_low.")
 
-        return_times = True
         if dtM is None and timesM is None:
             # Use the sparse domain. Python normally copies numpy arrays by
             # reference, so we do a deep copy so as to not overwrite
             # self.t_coorb.
-            timesM = np.copy(self.t_coorb)
-            do_interp = False
-        else:
-            ## Interpolate onto uniform domain if needed
-            do_interp = True
-            if dtM is not None:
-                # If omega_low=0 or None, t0 would have been set to None,
-                # in which case we use the full surrogate length
-                if t0 is None:
-                    t0 = self.t_coorb[0]
-                tf = self.t_coorb[-1]
-                num_times = int(np.ceil((tf - t0)/dtM));
-                timesM = t0 + dtM*np.arange(num_times)
-            else:
-                return_times = False
-
-
-        if do_interp:
-            hre = splinterp_many(timesM, self.t_coorb, np.real(h_inertial))
-            him = splinterp_many(timesM, self.t_coorb, np.imag(h_inertial))
-            h_inertial = hre + 1.j*him
-
-        # Make mode dict
+            return np.copy(self.t_coorb), False
+
+        ## Interpolate onto uniform domain if needed
+        if dtM is not None:
+            # If omega_low=0 or None, t0 would have been set to None,
+            # in which case we use the full surrogate length
+            if t0 is None:
+                t0 = self.t_coorb[0]
+            tf = self.t_coorb[-1]
+            num_times = int(np.ceil((tf - t0)/dtM));
+            timesM = t0 + dtM*np.arange(num_times)
+        return timesM, True
+
+    def _interp_modes(self, timesM, h_inertial):
+        """ Interpolates the sparse inertial frame modes to timesM """
+        h = splinterp_many(timesM, self.t_coorb, h_inertial)
+        return h.astype(np.result_type(self.dtype, np.complex64), copy=False)
+
+    def _mode_dict(self, h_inertial, ellMax):
+        """ Returns a dict of the rows of h_inertial with (ell, m) keys """
         h = {}
         i=0
         for ell in range(2, ellMax+1):
             for m in range(-ell, ell+1):
                 h[(ell, m)] = h_inertial[i]
                 i += 1
-
-        #  Transform and interpolate spins if needed
-        if return_dynamics:
-
-            if do_interp:
-                ## Interpolate from self.tds to timesM because that is what
-                ## is done in the LAL code.
-                chiA_copr = splinterp_many(timesM, self.tds, chiA_copr_dyn.T).T
-                chiB_copr = splinterp_many(timesM, self.tds, chiB_copr_dyn.T).T
-                chiA_copr = normalize_spin(chiA_copr, chiA_norm)
-                chiB_copr = normalize_spin(chiB_copr, chiB_norm)
-                orbphase = _splinterp_Cwrapper(timesM, self.tds, orbphase_dyn)
-                quat = splinterp_many(timesM, self.tds, quat_dyn)
-                quat = quat/np.sqrt(np.sum(abs(quat)**2, 0))
-
-            chiA_inertial = transformTimeDependentVector(quat, chiA_copr.T).T
-            chiB_inertial = transformTimeDependentVector(quat, chiB_copr.T).T
-
-            dynamics = {
-                'chiA': chiA_inertial,
-                'chiB': chiB_inertial,
-                'q_copr': quat,
-                'orbphase': orbphase,
-                }
-        else:
-            dynamics = None
-
-        return timesM, h, dynamics
+        return h
@@ -168,7 +168,7 @@ class SimpleH5Object(object):
         for k in keys:
             #print k
             # TODO: how to block auto-save mechanism?
-            if k != "last_return":
+            if k not in ("last_return", "_last_spline_call"):
               v = getattr(self, k)
               _write_attr(f, k, v)
 
@@ -276,6 +276,15 @@ class H5ObjectDict(SimpleH5Object):
             idx = keys.index(k)
             v._read_h5(f[_list_item_string(idx)])
 
+    def read_item(self, f, k, v):
+        """
+        Loads a single object v for the key k from the h5 group f, which
+        was written by _write_h5, and adds it to the object_dict.
+        """
+        keys = _read_attrs(f)[OBJ_DICT_KEY_STR]
+        v._read_h5(f[_list_item_string(keys.index(k))])
+        self.object_dict[k] = v
+
     def __getitem__(self, k):
         return self.object_dict[k]
 
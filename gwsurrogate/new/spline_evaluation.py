@@ -34,16 +34,6 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-#print("__name__ = %s"%__name__)
-#print("__package__= %s"%__package__)
-
-if __package__ is "" or "None": # py2 and py3 compatible 
-  print("setting __package__ to gwsurrogate.new so relative imports work")
-  __package__="gwsurrogate.new"
-
-print("__name__ = %s"%__name__)
-print("__package__= %s"%__package__)
-
 import numpy as np
 import h5py
 from .saveH5Object import SimpleH5Object
@@ -151,10 +141,12 @@ def memoize_spline_call(func):
        recomputing anything.
 
        A decorator is needed because member variables of TensorSplineGrid
-       are expected to be loaded from an hdf5 file."""
+       are expected to be loaded from an hdf5 file.
 
-    last_call   = [np.nan]
-    last_return = [np.nan, np.nan, np.nan]
+       The last (xvec, result) pair is stored on the instance as a single
+       tuple, which is read and replaced atomically. This keeps separate
+       grids from sharing a cache, and makes concurrent calls from several
+       threads safe without a lock."""
 
     def decorated_function(self,xvec):
 
@@ -168,10 +160,15 @@ def memoize_spline_call(func):
             xvec = np.array([xvec])
             xshape = np.shape(xvec)
 
-        if np.max(np.abs(last_call[0] - xvec)) != 0:
-            last_call[0] = xvec
-            last_return[0], last_return[1], last_return[2] = func(self,xvec)
-        return last_return[0], last_return[1], last_return[2]
+        last = getattr(self, '_last_spline_call', None)
+        if last is not None and np.shape(last[0]) == xshape \
+                and np.max(np.abs(last[0] - xvec)) == 0:
+            return last[1]
+
+        result = func(self,xvec)
+        # Copy xvec so that later changes by the caller don't affect the cache
+        self._last_spline_call = (np.array(xvec, copy=True), result)
+        return result
     return decorated_function
 
 
@@ -29,21 +29,21 @@ THE SOFTWARE.
 
 # adding "_" prefix to potentially unfamiliar module names
 # so they won't show up in gws' tab completion
+import threading
 import numpy as np
+import h5py
 from scipy.interpolate import InterpolatedUnivariateSpline as _iuspline
-from gwtools.harmonics import sYlm as _sYlm
-
-if __package__ is "" or "None": # py2 and py3 compatible
-  print("setting __package__ to gwsurrogate.new so relative imports work")
-  __package__="gwsurrogate.new"
 
 # assumes unique global names
 from .saveH5Object import SimpleH5Object
 from .saveH5Object import H5ObjectList
 from .saveH5Object import H5ObjectDict
-from .nodeFunction import NodeFunction
+from .nodeFunction import NodeFunction, stack_gpr_fits
 from .spline_evaluation import TensorSplineGrid, fast_complex_tensor_spline_eval
 from gwsurrogate import spline_interp_Cwrapper
+from gwsurrogate import harmonics as _harmonics
+from gwsurrogate import profiling as _profiling
+from gwsurrogate import cache as _cache
 from .tidal_functions import UniversalRelationLambda2ToI, \
     UniversalRelationLambda2ToOmega2, UniversalRelationLambda2ToLambda3, \
     UniversalRelationLambda3ToOmega3, UniversalRelationLambda2ToAqm, \
@@ -68,10 +68,18 @@ RECOMBINATION_FUNCS = {
 
 
 def _mode_sum(modes, theta, phi):
-    h = 0.
-    for (ell, m), h_mode in modes.items(): # inefficient in py2
-        h += _sYlm(-2, ell, m, theta, phi) * h_mode
-    return h
+    coefs, _ = _harmonics.mode_sum_coefs(list(modes.keys()), theta, phi)
+    return _harmonics.mode_sum(list(modes.values()), coefs)
+
+
+def _real_dtype(dtype):
+    """Returns float32 or float64, the real type for the precision of
+    dtype, which can be real or complex."""
+    dtype = np.finfo(dtype).dtype
+    if dtype not in [np.float32, np.float64]:
+        raise ValueError('dtype should be one of float32, complex64, float64'
+            ' or complex128, got %s.'%dtype)
+    return dtype
 
 
 def _splinterp(xout, xin, yin, k=3, ext='const'):
@@ -81,20 +89,20 @@ def _splinterp(xout, xin, yin, k=3, ext='const'):
         im = _splinterp(xout, xin, np.imag(yin), k=k, ext=ext)
         return re + 1.j*im
     else:
-        return _iuspline(xin, yin, k=k, ext=ext)(xout)
+        with _profiling.stage('interpolation'):
+            return _iuspline(xin, yin, k=k, ext=ext)(xout)
 
-def _splinterp_Cwrapper(xout, xin, yin):
+def _splinterp_Cwrapper(xout, xin, yin, out=None):
     """Uses gsl splines with a wrapper to interpolate real or complex data.
     Uses natural boundary conditions instead of not-a-knot boundary conditions
-    like InterpolatedUnivariateSpline."""
-    if len(xin) != len(yin):
+    like InterpolatedUnivariateSpline.
+    yin can also have shape (k, len(xin)), in which case all k arrays are
+    interpolated with one spline setup. See spline_interp_Cwrapper.Spline
+    for out."""
+    if len(xin) != np.shape(yin)[-1]:
         raise Exception('Expected x and y input lengths to match.')
-    if np.iscomplexobj(yin):
-        re = _splinterp_Cwrapper(xout, xin, np.real(yin))
-        im = _splinterp_Cwrapper(xout, xin, np.imag(yin))
-        return re + 1.j*im
-    else:
-        return spline_interp_Cwrapper.interpolate(xout, xin, yin)
+    with _profiling.stage('interpolation'):
+        return spline_interp_Cwrapper.interpolate(xout, xin, yin, out=out)
 
 
 class ParamDim(SimpleH5Object):
@@ -266,8 +274,28 @@ class _SingleFunctionSurrogate_NoChecks(SimpleH5Object):
         """
         Evaluates the surrogate at x, returning the result.
         """
-        nodes = np.array([nf(x) for nf in self.node_functions])
-        return nodes.dot(self.ei_basis)
+        with _profiling.stage('fits'):
+            nodes = np.array([nf(x) for nf in self.node_functions])
+        # Single precision bases give single precision results
+        if self.ei_basis.dtype == np.float32:
+            nodes = nodes.astype(np.float32)
+        with _profiling.stage('ei_basis'):
+            return nodes.dot(self.ei_basis)
+
+    def batch_call(self, xs):
+        """
+        Evaluates the surrogate at each row of xs, which has shape (N, dim).
+        Each node function is evaluated at all N points at once, and the
+        EI-basis product is a single matrix product.
+        Returns an array with shape (N, len(domain)).
+        """
+        with _profiling.stage('fits'):
+            nodes = np.array([nf.batch_call(xs)
+                              for nf in self.node_functions])
+        if self.ei_basis.dtype == np.float32:
+            nodes = nodes.astype(np.float32)
+        with _profiling.stage('ei_basis'):
+            return nodes.T.dot(self.ei_basis)
 
     def h5_prepare_subs(self):
         """Setup NodeFunctions before loading them"""
@@ -392,12 +420,25 @@ class _ManyFunctionSurrogate_NoChecks(SimpleH5Object):
         sur_evals = {k: sur(x) for k, sur in self.sur_subs.iteritems()} # inefficient in py2
         return RECOMBINATION_FUNCS[self.combine_func](func_evals, sur_evals)
 
+    def batch_call(self, xs):
+        """
+        Evaluates the surrogate at each row of xs, which has shape (N, dim).
+        Components are evaluated with batch_call, so each recombined result
+        has a leading axis of length N.
+        """
+        func_evals = {k: sur.batch_call(xs) for k, sur in self.func_subs.iteritems()} # inefficient in py2
+        sur_evals = {k: sur.batch_call(xs) for k, sur in self.sur_subs.iteritems()} # inefficient in py2
+        return RECOMBINATION_FUNCS[self.combine_func](func_evals, sur_evals)
+
     def _eval_func(self, x, key):
         return self.func_subs[key](x)
 
     def _eval_sur(self, x, key):
         return self.sur_subs[key](x)
 
+    def _eval_sur_batch(self, xs, key):
+        return self.sur_subs[key].batch_call(xs)
+
 
 class ManyFunctionSurrogate(_ManyFunctionSurrogate_NoChecks):
     """
@@ -597,6 +638,157 @@ class MultiModalSurrogate(ManyFunctionSurrogate):
         return h_modes
 
 
+class _FlatCoorbitalPlan(object):
+    """
+    The data pieces of several modes of an AlignedSpinCoOrbitalFrameSurrogate,
+    flattened for evaluation. The nodes of all data pieces form one stacked
+    node vector, which for GPR node functions is evaluated by a single
+    StackedGPRFits. The EI bases of data pieces with the same dtype and
+    number of nodes are stacked in one block, such that they come from one
+    batched matrix product. The EI bases of the data pieces are replaced by
+    views of the blocks, so the bases are not duplicated.
+
+    A plan for some of the modes is obtained with subset, which shares the
+    blocks of this plan.
+    """
+
+    def __init__(self, subs):
+        """
+        subs: A list of (mode, sub) tuples, where sub is the
+              _ManyFunctionSurrogate_NoChecks of the mode, with only single
+              function components.
+        """
+        self.modes = tuple(mode for mode, _ in subs)
+        node_functions = []
+        pieces = []
+        for mode, sub in subs:
+            for key in sorted(sub.func_keys):
+                func_sub = sub.func_subs[key]
+                start = len(node_functions)
+                node_functions.extend(func_sub.node_functions)
+                pieces.append((mode, key, func_sub,
+                               np.arange(start, len(node_functions))))
+        self.n_nodes = len(node_functions)
+        self.stack = stack_gpr_fits(node_functions)
+        self.node_functions = node_functions
+
+        groups = {}
+        for piece in pieces:
+            group = (piece[2].ei_basis.dtype, len(piece[3]))
+            groups.setdefault(group, []).append(piece)
+        # Each block is (keys, take, basis, rows), where the data piece
+        # keys[i] is nodes[take[i]] times basis[rows[i]], and rows=None
+        # stands for all rows of basis
+        self.blocks = []
+        for (dtype, n), block_pieces in groups.items():
+            num_times = block_pieces[0][2].ei_basis.shape[1]
+            basis = np.empty((len(block_pieces), n, num_times), dtype)
+            for i, (_, _, func_sub, _) in enumerate(block_pieces):
+                basis[i] = func_sub.ei_basis
+                func_sub.ei_basis = basis[i]
+            keys = [(mode, key) for mode, key, _, _ in block_pieces]
+            take = np.array([node_idx for _, _, _, node_idx in block_pieces])
+            self.blocks.append((keys, take, basis, None))
+
+    def subset(self, modes):
+        """
+        Returns a plan for the data pieces of modes, which must be in
+        self.modes. The blocks of this plan are shared, only the node
+        functions of modes are stacked again.
+        """
+        modes = tuple(modes)
+        if modes == self.modes:
+            return self
+        plan = _FlatCoorbitalPlan.__new__(_FlatCoorbitalPlan)
+        plan.modes = modes
+        # Number the nodes of the data pieces of modes in order
+        new_idx = np.full(self.n_nodes, -1)
+        node_functions = []
+        for mode in modes:
+            for keys, take, _, _ in self.blocks:
+                for (piece_mode, _), node_idx in zip(keys, take):
+                    if piece_mode == mode:
+                        new_idx[node_idx] = np.arange(len(node_functions),
+                            len(node_functions) + len(node_idx))
+                        node_functions.extend(self.node_functions[i]
+                                              for i in node_idx)
+        plan.n_nodes = len(node_functions)
+        plan.stack = stack_gpr_fits(node_functions)
+        plan.node_functions = node_functions
+
+        plan.blocks = []
+        for keys, take, basis, _ in self.blocks:
+            rows = [i for i, (mode, _) in enumerate(keys) if mode in modes]
+            if len(rows) == 0:
+                continue
+            plan.blocks.append(([keys[i] for i in rows], new_idx[take[rows]],
+                basis, None if len(rows) == len(keys) else rows))
+        return plan
+
+    def nodes(self, xs):
+        """ Returns the stacked nodes at each row of xs, with shape
+        (n_nodes, len(xs)) """
+        if self.stack is not None:
+            return self.stack(xs)
+        return np.array([nf.batch_call(xs) for nf in self.node_functions])
+
+    def __call__(self, xs, return_nodes=False):
+        """
+        Evaluates the data pieces at each row of xs, which has shape
+        (N, dim). Returns a dict with a dict for each mode, with the data
+        pieces of shape (N, len(domain)). If return_nodes is True, the
+        stacked nodes, which can be passed to evaluate, are returned as
+        well.
+        """
+        with _profiling.stage('fits'):
+            nodes = self.nodes(xs)
+        evals = self.evaluate(nodes, self.blocks)
+        if return_nodes:
+            return evals, nodes
+        return evals
+
+    def evaluate(self, nodes, blocks):
+        """ Returns the data pieces given the stacked nodes, as returned by
+        __call__, and blocks, which are self.blocks or dense_blocks. """
+        evals = {}
+        with _profiling.stage('ei_basis'):
+            for keys, take, basis, rows in blocks:
+                # Single precision bases give single precision results
+                block_nodes = np.swapaxes(nodes[take], 1, 2).astype(
+                    basis.dtype, copy=False)
+                if rows is None:
+                    res = np.matmul(block_nodes, basis)
+                else:
+                    # Only some rows of a shared block are needed
+                    res = [block_nodes[i].dot(basis[row])
+                           for i, row in enumerate(rows)]
+                for (mode, key), data in zip(keys, res):
+                    evals.setdefault(mode, {})[key] = data
+        return evals
+
+    def dense_blocks(self, domain, timesM):
+        """
+        Returns self.blocks with each EI basis interpolated onto timesM,
+        using the last len(domain) samples of the bases, which are at
+        domain. As the interpolation is linear in the data, evaluating the
+        nodes with these blocks is the same as interpolating the data
+        pieces. Only the rows of the blocks used by this plan are
+        interpolated. The returned arrays are read-only.
+        """
+        blocks = []
+        for keys, take, basis, rows in self.blocks:
+            if rows is not None:
+                basis = basis[rows]
+            sparse = basis[:, :, basis.shape[2] - len(domain):]
+            dense = _splinterp_Cwrapper(timesM, domain,
+                sparse.reshape(-1, len(domain)))
+            dense = dense.reshape(basis.shape[:2] + (len(timesM),)).astype(
+                basis.dtype, copy=False)
+            dense.flags.writeable = False
+            blocks.append((keys, take, dense, None))
+        return blocks
+
+
 class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
     """
     A surrogate for coorbital frame multimodal waveforms, where each waveform
@@ -692,6 +884,242 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
         self._h5_data_keys.append('phaseAlignIdx')
         self._h5_data_keys.append('TaylorT3_t_ref')
 
+        if domain is not None:
+            self._set_TaylorT3_factor()
+
+        # Set in load, see there
+        self._load_mode_list = None
+        self._load_ellMax = None
+        self._h5file = None
+        self._lazy_lock = threading.Lock()
+        self.dtype = np.dtype(np.float64)
+        # See _get_flat_plan
+        self._flat_plan = None
+        self._flat_subsets = _cache.BasisCache(max_entries=8)
+        self._flat_lock = threading.Lock()
+        # See enable_dense_basis_cache
+        self._dense_bases = None
+
+    def load(self, filename, mode_list=None, ellMax=None, lazy=False,
+            dtype=np.float64):
+        """Load data from h5 file
+
+        mode_list:  A list of (l, m) modes to load. The (2, 2) mode is always
+                    loaded, since it is needed to transform the other modes
+                    to the inertial frame. Other modes will not be available.
+                    Default: None, in which case all modes are loaded.
+
+        ellMax:     Load only modes with l <= ellMax. At most one of
+                    mode_list and ellMax can be specified. Default: None.
+
+        lazy:       If True, only the (2, 2) mode is read now, and the data
+                    for each of the other modes is read when it is first
+                    evaluated. The h5 file is kept open for this, until
+                    close() is called. Default: False.
+
+        dtype:      Precision of the evaluated waveform. With np.float32 (or
+                    np.complex64) the EI bases are stored in single
+                    precision, and the waveform modes are complex64. The
+                    phase of the (2, 2) mode, which grows large for long
+                    waveforms, is always kept in double precision.
+                    Default: np.float64.
+        """
+        if (mode_list is not None) and (ellMax is not None):
+            raise ValueError("Cannot specify both mode_list and ellMax.")
+        self.dtype = _real_dtype(dtype)
+        self._load_mode_list = mode_list
+        self._load_ellMax = ellMax
+        self._flat_plan = None
+        self._flat_subsets.clear()
+        if self._dense_bases is not None:
+            self._dense_bases.clear()
+        if lazy:
+            self._h5file = h5py.File(filename, 'r')
+            self._read_h5(self._h5file)
+        else:
+            super(AlignedSpinCoOrbitalFrameSurrogate, self).load(filename)
+        for key, sub in self.sur_subs.object_dict.items():
+            self._set_basis_dtype(key, sub)
+        self._set_TaylorT3_factor()
+        if not lazy:
+            # Flatten the loaded data pieces now, see _get_flat_plan
+            self._get_flat_plan(self.mode_list)
+
+    def _set_basis_dtype(self, key, sub):
+        """ Converts the EI bases of the surrogate sub for the data piece
+        key to self.dtype, except for the (2, 2) mode phase.
+        """
+        for k, func_sub in sub.func_subs.object_dict.items():
+            if key == tuple([2, 2]) and k == 'phase':
+                continue
+            func_sub.ei_basis = func_sub.ei_basis.astype(self.dtype,
+                copy=False)
+
+    def h5_prepare_subs(self):
+        """
+        Restricts self.mode_list to the modes requested in load, and sets
+        up the subordinate surrogates that are read now.
+        """
+        super(AlignedSpinCoOrbitalFrameSurrogate, self).h5_prepare_subs()
+
+        available = list(self.mode_list)
+        mode_list = self._get_mode_list(self._load_mode_list,
+            self._load_ellMax)
+        for mode in mode_list:
+            if mode not in available:
+                raise ValueError('Mode %s is not in this surrogate.'%(mode,))
+        # Keep the order of the h5 file, with the (2, 2) mode first
+        self.mode_list = [mode for mode in available \
+            if mode == tuple([2, 2]) or mode in mode_list]
+
+        if self._h5file is None:
+            read_now = self.mode_list
+        else:
+            read_now = [tuple([2, 2])]
+        self.sur_subs = H5ObjectDict({k: _ManyFunctionSurrogate_NoChecks()
+                                      for k in self.sur_keys
+                                      if k in read_now})
+
+    def close(self):
+        """ Closes the h5 file kept open by load with lazy=True. Modes that
+        have not been read yet can no longer be evaluated.
+        """
+        if self._h5file is not None:
+            self._h5file.close()
+            self._h5file = None
+
+    def _get_sur_sub(self, key):
+        """ Returns the surrogate for the data piece key, reading it from the
+        h5 file first if it was not loaded yet.
+        """
+        sur_subs = self.sur_subs.object_dict
+        if key in sur_subs:
+            return sur_subs[key]
+        if key not in self.mode_list:
+            raise ValueError('Mode %s was not loaded, or is not in this '
+                'surrogate.'%(key,))
+        with self._lazy_lock:
+            if key not in sur_subs:
+                if self._h5file is None:
+                    raise Exception('The h5 file of this lazily loaded '
+                        'surrogate has been closed.')
+                sub = _ManyFunctionSurrogate_NoChecks()
+                self.sur_subs.read_item(self._h5file['sur_subs'], key, sub)
+                self._set_basis_dtype(key, sub)
+        return sur_subs[key]
+
+    def _eval_sur(self, x, key):
+        return self._get_sur_sub(key)(x)
+
+    def _eval_sur_batch(self, xs, key):
+        return self._get_sur_sub(key).batch_call(xs)
+
+    def _get_flat_plan(self, mode_list):
+        """ Returns a _FlatCoorbitalPlan of the data pieces of the (2, 2)
+        mode and the modes in mode_list. Returns None if the data pieces are
+        not all single function surrogates.
+
+        A single plan holds the EI bases of all modes that have been read,
+        which is built in load, or rebuilt when a lazily loaded mode is read.
+        The plans for each mode_list are subsets of this plan, so the bases
+        are not duplicated. The most recently used subsets are kept.
+        """
+        modes = tuple([tuple([2, 2])] + [k for k in mode_list
+                                          if k != tuple([2, 2])])
+        def has_modes(plan):
+            return plan is False or ((plan is not None)
+                and all(mode in plan.modes for mode in modes))
+
+        plan = self._flat_plan
+        if not has_modes(plan):
+            with self._flat_lock:
+                plan = self._flat_plan
+                if not has_modes(plan):
+                    plan = self._build_flat_plan(modes)
+        if plan is False:
+            return None
+        # Subsets of a plan that has been rebuilt since are not used
+        entry = self._flat_subsets.get(modes)
+        if entry is None or entry[0] is not plan:
+            entry = (plan, plan.subset(modes))
+            self._flat_subsets.put(modes, entry)
+        return entry[1]
+
+    def _build_flat_plan(self, modes):
+        """ Builds the plan of _get_flat_plan for the modes that have been
+        read and modes, which are read now if needed. Must be called with
+        self._flat_lock held.
+        """
+        for mode in modes:
+            self._get_sur_sub(mode)
+        sur_subs = self.sur_subs.object_dict
+        subs = [(mode, sur_subs[mode]) for mode in self.mode_list
+                if mode in sur_subs]
+        if any(len(sub.sur_keys) > 0 or sub.combine_func != 'identity'
+               for _, sub in subs):
+            plan = False
+        else:
+            plan = _FlatCoorbitalPlan(subs)
+        self._flat_subsets.clear()
+        self._flat_plan = plan
+        return plan
+
+    def enable_dense_basis_cache(self, max_entries=4, max_bytes=None):
+        """
+        Caches the EI bases interpolated onto the uniform time grids of
+        evaluations with dtM. The interpolation is linear in the data, so an
+        evaluation with a cached grid is a product of the nodes with the
+        interpolated bases, and no splines are built. The TaylorT3 part of
+        the (2, 2) phase is evaluated directly on the grid.
+
+        The grid is determined by dtM and the first index of the surrogate
+        domain that is used, which depends on fM_low and the binary. This
+        helps when many evaluations use the same dtM and fM_low=0, or
+        parameters whose waveforms start at the same index. Each grid holds
+        a basis for every node, so the cache can be large for small dtM.
+
+        max_entries:    Maximum number of cached grids. None for no limit.
+                        Default: 4.
+
+        max_bytes:      Maximum total size in bytes of the cached bases.
+                        None for no limit. Default: None.
+
+        Evaluations with the cache agree with those without it up to the
+        interpolation error of the TaylorT3 phase.
+        """
+        self._dense_bases = _cache.BasisCache(max_entries=max_entries,
+            max_bytes=max_bytes)
+
+    def disable_dense_basis_cache(self):
+        """ Removes the cache added by enable_dense_basis_cache """
+        self._dense_bases = None
+
+    def dense_basis_cache_stats(self):
+        """ Returns the statistics of the cache added by
+        enable_dense_basis_cache, or None if it is not enabled.
+        """
+        if self._dense_bases is None:
+            return None
+        return self._dense_bases.stats()
+
+    def _dense_data(self, plan, nodes, x, initIdx, dtM, timesM):
+        """ Returns the (2, 2) mode data pieces and a dict with the data
+        pieces of the other modes on timesM, the uniform grid with step dtM
+        starting at initIdx of the domain, using the dense basis cache.
+        """
+        key = (plan.modes, initIdx, float(dtM), len(timesM))
+        blocks = self._dense_bases.get(key)
+        if blocks is None:
+            blocks = plan.dense_blocks(self.domain[initIdx:], timesM)
+            self._dense_bases.put(key, blocks)
+        evals = plan.evaluate(nodes, blocks)
+        dense_22 = {k: v[0] for k, v in evals.pop(tuple([2, 2])).items()}
+        dense_22['phase'] = dense_22['phase'] \
+            + self._TaylorT3_phase_22(x, timesM)
+        dense_coorb = {mode: {k: v[0] for k, v in h.items()}
+                       for mode, h in evals.items()}
+        return dense_22, dense_coorb
+
     def _search_omega(self, omega22, omega_val):
         """ Find closest index such taht omega22[index] = omega_val
         """
@@ -702,30 +1130,12 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
             idx -= 1
         return idx
 
-    def _coorbital_to_inertial_frame(self, h_coorb, h_22, mode_list, dtM,
-        timesM, fM_low, fM_ref, do_not_align):
-        """ Transforms a dict from Coorbital frame to inertial frame.
-
-            The surrogate data is sparsely sampled, so upsamples to time
-            step dtM if given. This is done in the coorbital frame since
-            the waveform is slowly varying in that frame.
-
-            If fM_low is given, only part of the waveform where frequency of
-            the (2, 2) mode is greater than fM_low is retained.
-
-            if do_not_align = False:
-                Aligns the 22 mode phase to be 0 at fM_ref. This means
-                that at this reference frequency, the heavier BH is roughly on
-                the +ve x axis and the lighter BH is on the -ve x axis.
-            do_not_align should be True only when converting from pySurrogate
-            format to gwsurrogate format as we may want to do some checks that
-            the waveform has not been modified
+    def _get_init_idx(self, domain, phi_22, fM_low, timesM):
+        """ Returns initIdx, omega22_sparse, omega22_peak, where initIdx is
+        the first index of the sparse domain that is needed for the given
+        fM_low or timesM, and omega22_sparse is the (2, 2) mode frequency on
+        the sparse domain up to the peak, which has frequency omega22_peak.
         """
-
-        Amp_22 = h_22[0]['amp']
-        phi_22 = h_22[0]['phase']
-        domain = np.copy(self.domain)
-
         # Get omega22_sparse, the angular frequency of the 22 mode, from the
         # sparse surrogate domain.
         # Use np.diff instead of np.gradient to match the LAL version
@@ -769,7 +1179,107 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
             if timesM is not None:
                 initIdx = np.where(domain > timesM[0])[0][0] - 6
 
-        Amp_22 = Amp_22[initIdx:]
+        return initIdx, omega22_sparse, omega22_peak
+
+    def _coorbital_to_inertial_frame(self, h_coorb, h_22, mode_list, dtM,
+        timesM, fM_low, fM_ref, do_not_align, dense_data=None):
+        """ Transforms a dict from Coorbital frame to inertial frame.
+
+            The surrogate data is sparsely sampled, so upsamples to time
+            step dtM if given. This is done in the coorbital frame since
+            the waveform is slowly varying in that frame.
+
+            If fM_low is given, only part of the waveform where frequency of
+            the (2, 2) mode is greater than fM_low is retained.
+
+            if do_not_align = False:
+                Aligns the 22 mode phase to be 0 at fM_ref. This means
+                that at this reference frequency, the heavier BH is roughly on
+                the +ve x axis and the lighter BH is on the -ve x axis.
+            do_not_align should be True only when converting from pySurrogate
+            format to gwsurrogate format as we may want to do some checks that
+            the waveform has not been modified
+
+            dense_data: None, or a function that takes the first index of
+            the domain that is used and the uniform time array for dtM, and
+            returns the data pieces of the (2, 2) mode and a dict with the
+            data pieces of the other modes on that time array. These are
+            used instead of interpolating, see enable_dense_basis_cache.
+        """
+
+        timesM, phi_22, domain, initIdx, startIdx, dense = \
+            self._inertial_phase(h_22, dtM, timesM, fM_low, fM_ref,
+                do_not_align, dense_data=dense_data)
+        # The sparse domain itself is returned if no interpolation is needed
+        do_interp = timesM is not domain
+
+        Amp_22 = h_22[0]['amp'][initIdx:]
+        if dense is not None:
+            Amp_22 = dense[0]['amp'][startIdx:].astype(self.dtype, copy=False)
+        elif do_interp:
+            Amp_22 = _splinterp_Cwrapper(timesM, domain, Amp_22).astype(
+                self.dtype, copy=False)
+
+        # The rotation factors are computed from the phase in double
+        # precision, then converted to the precision of the waveform
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+
+        h_dict = {}
+        with _profiling.stage('rotation'):
+            for mode in mode_list:
+                if mode == tuple([2, 2]):
+                    h_dict[mode] = Amp_22 * np.exp(-1j*phi_22).astype(
+                        complex_dtype, copy=False)
+                else:
+                    l,m = mode
+                    if dense is not None:
+                        pieces = dense[1][mode]
+                    else:
+                        pieces = h_coorb[mode][0]
+                    h_coorb_lm = 0
+                    if 're' in pieces.keys():
+                        h_coorb_lm += pieces['re'] + 1j * 0
+                    if 'im' in pieces.keys():
+                        h_coorb_lm += 1j*pieces['im']
+
+                    if dense is not None:
+                        # The dense data starts at timesM before the
+                        # truncation at fM_low
+                        h_coorb_lm = h_coorb_lm[startIdx:].astype(
+                            complex_dtype, copy=False)
+                    else:
+                        h_coorb_lm = h_coorb_lm[initIdx:]
+                        if do_interp:
+                            h_coorb_lm = _splinterp_Cwrapper(timesM, domain,
+                                h_coorb_lm).astype(complex_dtype, copy=False)
+
+                    h_dict[mode] = h_coorb_lm * np.exp(
+                        -1j*m*phi_22/2.).astype(complex_dtype, copy=False)
+
+        return timesM, h_dict, None     # None is for dynamics
+
+    def _inertial_phase(self, h_22, dtM, timesM, fM_low, fM_ref,
+        do_not_align, dense_data=None):
+        """ Returns the time samples and the aligned (2, 2) mode phase used
+        by _coorbital_to_inertial_frame, see there for the arguments.
+
+        Returns timesM, phi_22, domain, initIdx, startIdx, dense:
+            domain is the part of the sparse domain from index initIdx on,
+            which is used for interpolation. If dtM and timesM are None,
+            the returned timesM is domain itself. For dtM, timesM starts at
+            index startIdx of the uniform time array, else startIdx is 0.
+            phi_22 is sampled at timesM. dense is None, or the result of
+            dense_data, whose arrays start at index 0 of the uniform time
+            array.
+        """
+        phi_22 = h_22[0]['phase']
+        domain = np.copy(self.domain)
+
+        initIdx, omega22_sparse, omega22_peak = self._get_init_idx(domain,
+            phi_22, fM_low, timesM)
+        if fM_low != 0:
+            omega_low = 2*np.pi*fM_low
+
         phi_22 = phi_22[initIdx:]
         domain = domain[initIdx:]
 
@@ -781,14 +1291,14 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
                 raise Exception("'times' starts before start of domain. Try"
                     " increasing initial value of times or reducing f_low.")
 
+        startIdx = 0
+        dense = None
         if dtM is None and timesM is None:
             # Use the sparse domain
             timesM = domain
             omega22 = omega22_sparse[initIdx:]
-            do_interp = False
         else:
             ## Interpolate onto uniform-domain/timesM if needed
-            do_interp = True
             if dtM is not None:
                 t0 = domain[0]
                 tf = domain[-1]
@@ -798,9 +1308,13 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
                 if timesM[0] < domain[0] or timesM[-1] > domain[-1]:
                     raise Exception('Trying to evaluate at times outside the'
                         ' domain.')
+                dense_data = None
 
-            Amp_22 = _splinterp_Cwrapper(timesM, domain, Amp_22)
-            phi_22 = _splinterp_Cwrapper(timesM, domain, phi_22)
+            if dense_data is not None:
+                dense = dense_data(initIdx, timesM)
+                phi_22 = dense[0]['phase']
+            else:
+                phi_22 = _splinterp_Cwrapper(timesM, domain, phi_22)
 
             # now recompute omega22 with the dense data, but retain only data
             # upto the peak to avoid the noisy part
@@ -812,11 +1326,7 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
             if dtM is not None:
                 if fM_low != 0:
                     startIdx = self._search_omega(omega22, omega_low)
-                else:
-                    # If fM_low is 0, we use the entire waveform
-                    startIdx = 0
 
-                Amp_22 = Amp_22[startIdx:]
                 phi_22 = phi_22[startIdx:]
                 omega22 = omega22[startIdx:]
                 timesM = timesM[startIdx:]
@@ -850,54 +1360,253 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
             # frequency is 0.
             phi_22 += -phi_22[refIdx]
 
-        h_dict = {}
+        return timesM, phi_22, domain, initIdx, startIdx, dense
+
+    def _search_omega_dense(self, times_phase, num_times, omega_val, start,
+        chunk_samples):
+        """ Same as _search_omega on omega22 computed from the dense phase,
+        omega22 = diff(phi_22)/diff(timesM) restricted to timesM <= 0, but
+        only looking at indices >= start. times_phase(a, b) should return the
+        dense times and phase for indices a to b-1.
+
+        The dense phase is only computed for chunk_samples samples at a time,
+        so that the dense data is never held in memory.
+        """
+        prev = None
+        for a in range(start, num_times - 1, chunk_samples):
+            b = min(a + chunk_samples + 1, num_times)
+            t, phi = times_phase(a, b)
+            omega = np.diff(phi)/np.diff(t)
+            omega = omega[t[:-1] <= 0]
+            idx = np.where(omega > omega_val)[0]
+            if len(idx) > 0:
+                idx = idx[0]
+                if idx > 0:
+                    prev = omega[idx-1]
+                if (prev is not None) \
+                        and (abs(prev - omega_val) < abs(omega[idx] - omega_val)):
+                    idx -= 1
+                return a + idx
+            if len(omega) < b - a - 1:
+                break
+            prev = omega[-1]
+        raise ValueError('Frequency %g not reached before the peak.'
+            %(omega_val/(2*np.pi)))
+
+    def _coorbital_to_inertial_frame_chunks(self, h_coorb, h_22, mode_list,
+        dtM, timesM, fM_low, fM_ref, chunk_samples):
+        """ Same as _coorbital_to_inertial_frame, but the dense waveform is
+        computed in chunks of chunk_samples samples. See call_chunked.
+        """
+        if (dtM is None) and (timesM is None):
+            # The sparse domain is used, there is nothing to gain from
+            # chunking
+            timesM, h_dict, _ = self._coorbital_to_inertial_frame(h_coorb,
+                h_22, mode_list, dtM, timesM, fM_low, fM_ref, False)
+
+            def chunks():
+                for a in range(0, len(timesM), chunk_samples):
+                    yield timesM[a:a+chunk_samples], dict(
+                        (k, v[a:a+chunk_samples]) for k, v in h_dict.items())
+
+            return timesM[0], timesM[-1], chunks()
+
+        Amp_22 = h_22[0]['amp']
+        phi_22 = h_22[0]['phase']
+        domain = np.copy(self.domain)
+
+        initIdx, _, omega22_peak = self._get_init_idx(domain, phi_22, fM_low,
+            timesM)
+
+        Amp_22 = Amp_22[initIdx:]
+        phi_22 = phi_22[initIdx:]
+        domain = domain[initIdx:]
+
+        if dtM is not None:
+            t0 = domain[0]
+            num_times = int(np.ceil((domain[-1] - t0)/dtM))
+
+            def dense_times(a, b):
+                return t0 + dtM*np.arange(a, b)
+        else:
+            if timesM[0] < domain[0] or timesM[-1] > domain[-1]:
+                raise Exception('Trying to evaluate at times outside the'
+                    ' domain.')
+            num_times = len(timesM)
+
+            def dense_times(a, b):
+                return timesM[a:b]
+
+        def times_phase(a, b):
+            t = dense_times(a, b)
+            return t, _splinterp_Cwrapper(t, domain, phi_22)
+
+        # Truncate data so that only freqs above omega_low are retained
+        # If timesM are already given, we don't need to truncate data
+        startIdx = 0
+        if (dtM is not None) and (fM_low != 0):
+            startIdx = self._search_omega_dense(times_phase, num_times,
+                2*np.pi*fM_low, 0, chunk_samples)
+
+        # Get reference index where waveform needs to be aligned.
+        if (abs(fM_ref-fM_low) < 1e-13) and (dtM is not None):
+            refIdx = startIdx
+        else:
+            omega_ref = 2*np.pi*fM_ref
+            if omega_ref > omega22_peak:
+                raise ValueError('f_ref is higher than the peak frequency')
+            refIdx = self._search_omega_dense(times_phase, num_times,
+                omega_ref, startIdx, chunk_samples)
+        phi_ref = times_phase(refIdx, refIdx + 1)[1][0]
+
+        h_coorb_sparse = {}
         for mode in mode_list:
-            if mode == tuple([2, 2]):
-                h_dict[mode] = Amp_22 * np.exp(-1j*phi_22)
-            else:
-                l,m = mode
+            if mode != tuple([2, 2]):
                 h_coorb_lm = 0
                 if 're' in h_coorb[mode][0].keys():
                     h_coorb_lm += h_coorb[mode][0]['re'] + 1j * 0
                 if 'im' in h_coorb[mode][0].keys():
                     h_coorb_lm += 1j*h_coorb[mode][0]['im']
-
-                h_coorb_lm = h_coorb_lm[initIdx:]
-                if do_interp:
-                    h_coorb_lm = _splinterp_Cwrapper(timesM,domain,h_coorb_lm)
-
-                h_dict[mode] = h_coorb_lm * np.exp(-1j*m*phi_22/2.)
-
-        return timesM, h_dict, None     # None is for dynamics
+                h_coorb_sparse[mode] = h_coorb_lm[initIdx:]
+
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+
+        def chunks():
+            for a in range(startIdx, num_times, chunk_samples):
+                t, phi = times_phase(a, min(a + chunk_samples, num_times))
+                amp = _splinterp_Cwrapper(t, domain, Amp_22).astype(
+                    self.dtype, copy=False)
+                phi += -phi_ref
+
+                h_dict = {}
+                with _profiling.stage('rotation'):
+                    for mode in mode_list:
+                        if mode == tuple([2, 2]):
+                            h_dict[mode] = amp * np.exp(-1j*phi).astype(
+                                complex_dtype, copy=False)
+                        else:
+                            l, m = mode
+                            h_coorb_lm = _splinterp_Cwrapper(t, domain,
+                                h_coorb_sparse[mode]).astype(complex_dtype,
+                                copy=False)
+                            h_dict[mode] = h_coorb_lm * np.exp(
+                                -1j*m*phi/2.).astype(complex_dtype,
+                                copy=False)
+                yield t, h_dict
+
+        return dense_times(startIdx, startIdx + 1)[0], \
+            dense_times(num_times - 1, num_times)[0], chunks()
 
     def _set_TaylorT3_factor(self):
         """ Sets a term used in the 0 PN TaylorT3 phase. See Eq.43 of
         arxiv.1812.07865.
-        """
-        # Set only once
-        if self.TaylorT3_factor_without_eta is None:
-            # TaylorT3_t_ref is arbitrary. This is where the phase diverges,
-            # so we choose it much after ringdown. This matches what was used
-            # in the construction of the surrogate. See discussion near Eq.43
-            # of arxiv.1812.07865
-            theta_without_eta = ((self.TaylorT3_t_ref -self.domain)/5)**(-1./8)
-            self.TaylorT3_factor_without_eta = -2./theta_without_eta**5
 
-    def _TaylorT3_phase_22(self, x):
+        This is called once the domain is known (in __init__ or load), so
+        that evaluation never modifies the surrogate and a single instance
+        can be shared between threads.
+        """
+        # TaylorT3_t_ref is arbitrary. This is where the phase diverges,
+        # so we choose it much after ringdown. This matches what was used
+        # in the construction of the surrogate. See discussion near Eq.43
+        # of arxiv.1812.07865
+        theta_without_eta = ((self.TaylorT3_t_ref -self.domain)/5)**(-1./8)
+        self.TaylorT3_factor_without_eta = -2./theta_without_eta**5
+
+    def _TaylorT3_phase_22(self, x, timesM=None):
         """ 0 PN TaylorT3 phase. See Eq.43 of arxiv.1812.07865
+        x can also have shape (N, 3), in which case the phase for each
+        row is returned with shape (N, len(domain)).
+        If timesM is given, the phase is evaluated at timesM instead of the
+        domain, with the same alignment.
         """
 
-        q, chi1z, chi2z = x
+        q, chi1z, chi2z = np.transpose(x)
         eta = q/(1.+q)**2
 
+        if timesM is not None:
+            factor = -2.*((self.TaylorT3_t_ref - timesM)/5)**(5./8) \
+                - self.TaylorT3_factor_without_eta[self.phaseAlignIdx]
+            return np.multiply.outer(1./eta**(3./8), factor)
+
         # 0PN TaylorT3 phase
-        phi22_T3 = 1./eta**(3./8) * self.TaylorT3_factor_without_eta
+        phi22_T3 = np.multiply.outer(1./eta**(3./8),
+                                     self.TaylorT3_factor_without_eta)
 
         # Align at phaseAlignIdx
-        phi22_T3 -= phi22_T3[self.phaseAlignIdx]
+        phi22_T3 -= phi22_T3[..., self.phaseAlignIdx, None]
 
         return phi22_T3
 
+    def _get_mode_list(self, mode_list, ellMax):
+        """ Returns the list of modes to evaluate given the mode_list and
+        ellMax arguments of __call__.
+        """
+        if mode_list is None:
+            mode_list = self.mode_list
+        if ellMax is not None:
+            if ellMax > np.max(np.array(self.mode_list).T[0]):
+                raise ValueError('ellMax is greater than max allowed ell.')
+            include_modes = np.array(self.mode_list).T[0] <= ellMax
+            mode_list = [self.mode_list[idx]
+                    for idx in range(len(self.mode_list))
+                    if include_modes[idx]]
+        return mode_list
+
+    def _eval_coorbital_batch(self, xs, mode_list, return_nodes=False):
+        """ Evaluates the coorbital frame data pieces at each row of xs.
+
+        Returns h_22, h_coorb in the same format as used in __call__, except
+        that every data piece has a leading axis of length len(xs). The
+        TaylorT3 contribution is added to the (2, 2) phase.
+        If return_nodes is True, also returns the stacked nodes of the
+        _FlatCoorbitalPlan, or None if there is no such plan.
+        """
+        plan = self._get_flat_plan(mode_list)
+        nodes = None
+        if plan is not None:
+            evals, nodes = plan(xs, return_nodes=True)
+            h_22 = (evals.pop(tuple([2, 2])), {})
+            h_coorb = {mode: (v, {}) for mode, v in evals.items()}
+        else:
+            h_22 = self._eval_sur_batch(xs, tuple([2, 2]))
+            h_coorb = {k: self._eval_sur_batch(xs, k) for k in mode_list \
+                            if k != tuple([2,2])}
+        h_22[0]['phase'] += self._TaylorT3_phase_22(xs)
+        if return_nodes:
+            return h_22, h_coorb, nodes
+        return h_22, h_coorb
+
+    def _eval_coorbital(self, x, mode_list, return_nodes=False):
+        """ Evaluates the coorbital frame data pieces at x.
+
+        Returns h_22, h_coorb as used in __call__. The TaylorT3 contribution
+        is added to the (2, 2) phase. The data pieces are evaluated
+        together, see _get_flat_plan. If return_nodes is True, also returns
+        the stacked nodes, see _eval_coorbital_batch.
+        """
+        if self._get_flat_plan(mode_list) is not None:
+            h_22, h_coorb, nodes = self._eval_coorbital_batch(
+                np.atleast_2d(x), mode_list, return_nodes=True)
+            first = lambda h: ({k: v[0] for k, v in h[0].items()}, {})
+            h_22 = first(h_22)
+            h_coorb = {k: first(h) for k, h in h_coorb.items()}
+            if return_nodes:
+                return h_22, h_coorb, nodes
+            return h_22, h_coorb
+
+        # At this stage the phase of the (2,2) mode is the residual after
+        # removing the TaylorT3 part (see. Eq.44 of arxiv.1812.07865)
+        h_22 = self._eval_sur(x, tuple([2, 2]))
+
+        # Get the TaylorT3 part and add to get the actual phase
+        h_22[0]['phase'] += self._TaylorT3_phase_22(x)
+
+        h_coorb = {k: self._eval_sur(x, k) for k in mode_list \
+                        if k != tuple([2,2])}
+        if return_nodes:
+            return h_22, h_coorb, None
+        return h_22, h_coorb
+
 
     def __call__(self, x, fM_low=None, fM_ref=None, dtM=None,
             timesM=None, dfM=None, freqsM=None, mode_list=None, ellMax=None,
@@ -977,35 +1686,275 @@ class AlignedSpinCoOrbitalFrameSurrogate(ManyFunctionSurrogate):
             raise ValueError('Expected freqsM to be None for a Time domain'
                 ' model')
 
-        if mode_list is None:
-            mode_list = self.mode_list
-        if ellMax is not None:
-            if ellMax > np.max(np.array(self.mode_list).T[0]):
-                raise ValueError('ellMax is greater than max allowed ell.')
-            include_modes = np.array(self.mode_list).T[0] <= ellMax
-            mode_list = [self.mode_list[idx]
-                    for idx in range(len(self.mode_list))
-                    if include_modes[idx]]
+        mode_list = self._get_mode_list(mode_list, ellMax)
 
         if par_dict is not None:
             raise ValueError('par_dict should be None for this model')
 
         # always evaluate the (2,2) mode, the other modes neeed this
         # for transformation from coorbital to inertial frame
+        h_22, h_coorb, nodes = self._eval_coorbital(x, mode_list,
+            return_nodes=True)
 
-        # At this stage the phase of the (2,2) mode is the residual after
-        # removing the TaylorT3 part (see. Eq.44 of arxiv.1812.07865)
-        h_22 = self._eval_sur(x, tuple([2, 2]))
+        dense_data = None
+        if self._dense_bases is not None and dtM is not None \
+                and nodes is not None:
+            plan = self._get_flat_plan(mode_list)
+            dense_data = lambda initIdx, times: self._dense_data(plan, nodes,
+                x, initIdx, dtM, times)
 
-        # Get the TaylorT3 part and add to get the actual phase
-        self._set_TaylorT3_factor()
-        h_22[0]['phase'] += self._TaylorT3_phase_22(x)
+        return self._coorbital_to_inertial_frame(h_coorb, h_22, \
+            mode_list, dtM, timesM, fM_low, fM_ref, do_not_align,
+            dense_data=dense_data)
 
-        h_coorb = {k: self._eval_sur(x, k) for k in mode_list \
-                        if k != tuple([2,2])}
+    def _use_fused_mode_sum(self, dtM, timesM):
+        """ Returns True if fused_mode_sum can be used with these options.
+        Without interpolation there is nothing to fuse, and with the dense
+        basis cache no splines are built.
+        """
+        return ((dtM is not None) or (timesM is not None)) \
+            and (self._dense_bases is None)
+
+    def fused_mode_sum(self, x, coefs_func, scale=1.,
+            return_polarizations=False, get_out=None, fM_low=None,
+            fM_ref=None, dtM=None, timesM=None, dfM=None, freqsM=None,
+            mode_list=None, ellMax=None, precessing_opts=None,
+            tidal_opts=None, par_dict=None):
+        """
+    Evaluates a weighted sum over the inertial frame modes returned by
+    __call__, such as the complex strain in some direction, without
+    computing the modes.
 
-        return self._coorbital_to_inertial_frame(h_coorb, h_22, \
-            mode_list, dtM, timesM, fM_low, fM_ref, do_not_align)
+    The data pieces are interpolated from the sparse domain, rotated to the
+    inertial frame and summed by a compiled kernel in one pass over the time
+    samples, see spline_interp_Cwrapper.Spline.rotated_sum. Only the aligned
+    (2, 2) mode phase, which sets the time samples and the rotation, is
+    computed separately.
+
+    coefs_func :    A function that takes the list of modes and returns
+                    coefs, coefs_neg, as harmonics.mode_sum_coefs. The sum
+                    is scale*(coefs.dot(h) + coefs_neg.dot(h.conjugate())),
+                    where h are the modes.
+
+    return_polarizations : If True, return [h.real, -h.imag] instead of the
+                    complex sum h, which are hplus and hcross if h is the
+                    complex strain.
+
+    get_out :       A function that takes the shape of the result and returns
+                    the array it is written to. Default: None, in which
+                    case a new array is returned.
+
+    Either dtM or timesM must be given, all other arguments are the same as
+    for __call__.
+
+    Returns timesM, h:
+        timesM : time array in units of M.
+        h : The complex sum, or its polarizations, at timesM.
+        """
+        if dfM is not None or freqsM is not None:
+            raise ValueError('Expected dfM and freqsM to be None for a Time'
+                ' domain model')
+        if par_dict is not None:
+            raise ValueError('par_dict should be None for this model')
+        if (dtM is None) and (timesM is None):
+            raise ValueError('Either dtM or timesM must be given.')
+
+        mode_list = self._get_mode_list(mode_list, ellMax)
+        h_22, h_coorb = self._eval_coorbital(x, mode_list)
+
+        timesM, phi_22, domain, initIdx, _, _ = self._inertial_phase(h_22,
+            dtM, timesM, fM_low, fM_ref, False)
+
+        # Every mode is (re + i im) exp(-i m phi_22/2) on the sparse domain,
+        # with re = Amp_22, im = 0 and m = 2 for the (2, 2) mode
+        rows = []
+        pieces = []
+        for mode in mode_list:
+            if mode == tuple([2, 2]):
+                data = dict(re=h_22[0]['amp'])
+            else:
+                data = h_coorb[mode][0]
+            idx = []
+            for key in ['re', 'im']:
+                if key in data.keys():
+                    idx.append(len(rows))
+                    rows.append(data[key][initIdx:])
+                else:
+                    idx.append(None)
+            pieces.append((mode, idx))
+
+        coefs, coefs_neg = coefs_func(mode_list)
+        coefs = np.asarray(coefs)*scale
+        coefs_neg = np.asarray(coefs_neg)*scale
+
+        # With c = coefs[i] and n = coefs_neg[i], the real and imaginary
+        # parts of c*h + n*conj(h) are linear in those of h
+        sign = -1. if return_polarizations else 1.
+        terms = []
+        for (mode, (re, im)), c, n in zip(pieces, coefs, coefs_neg):
+            terms.append((re, im, mode[1], (c.real + n.real,
+                n.imag - c.imag, sign*(c.imag + n.imag),
+                sign*(c.real - n.real))))
+        # The rotation is computed once for each m
+        terms.sort(key=lambda term: term[2])
+
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+        if return_polarizations:
+            shape = (2, len(timesM))
+            dtype = np.finfo(complex_dtype).dtype
+            kernel_dtype = np.float64
+        else:
+            shape = (len(timesM),)
+            dtype = complex_dtype
+            kernel_dtype = np.complex128
+
+        out = None
+        if get_out is not None:
+            out = get_out(shape)
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        h = out
+        if (out.dtype != kernel_dtype) or (out.strides[-1] != out.itemsize):
+            h = np.empty(shape, dtype=kernel_dtype)
+
+        with _profiling.stage('rotation'):
+            spline = spline_interp_Cwrapper.Spline(domain, np.array(rows))
+            spline.rotated_sum(timesM, phi_22, terms, out=h)
+        if h is not out:
+            out[...] = h
+        return timesM, out
+
+    def sparse_data(self, x, mode_list=None, ellMax=None):
+        """
+    Evaluates the fits and empirical interpolants of the coorbital frame
+    data pieces at x, on the sparse surrogate domain. These do not depend
+    on fM_low, fM_ref, dtM or timesM, so the result can be passed to
+    call_sparse for many of these options, for example when only the total
+    mass changes.
+
+    mode_list, ellMax : The modes to evaluate, see __call__.
+        """
+        mode_list = self._get_mode_list(mode_list, ellMax)
+        x_sur = self._base_params(x)
+
+        h_22, h_coorb = self._eval_coorbital(x_sur, mode_list)
+        return dict(x=np.array(x), mode_list=mode_list, h_22=h_22,
+                    h_coorb=h_coorb)
+
+    def call_sparse(self, sparse, fM_low=None, fM_ref=None, dtM=None,
+            timesM=None, dfM=None, freqsM=None, mode_list=None, ellMax=None,
+            precessing_opts=None, tidal_opts=None, par_dict=None):
+        """
+    Same as __call__, but starts from the data returned by sparse_data,
+    instead of evaluating the fits. The modes in mode_list and ellMax must
+    have been evaluated by sparse_data.
+        """
+        if dfM is not None or freqsM is not None:
+            raise ValueError('Expected dfM and freqsM to be None for a Time'
+                ' domain model')
+        if par_dict is not None:
+            raise ValueError('par_dict should be None for this model')
+
+        if mode_list is None and ellMax is None:
+            mode_list = sparse['mode_list']
+        else:
+            mode_list = self._get_mode_list(mode_list, ellMax)
+            if not set(mode_list).issubset(sparse['mode_list']):
+                raise ValueError('mode_list includes modes that were not'
+                    ' evaluated in sparse_data.')
+
+        # Copies, as the transformation can modify the phase in place
+        h_22 = (dict((k, np.copy(v)) for k, v in sparse['h_22'][0].items()),
+                sparse['h_22'][1])
+        h_coorb = dict((k, sparse['h_coorb'][k]) for k in mode_list
+                       if k != tuple([2, 2]))
+        return self._inertial_from_sparse(sparse['x'], h_coorb, h_22,
+            mode_list, dtM, timesM, fM_low, fM_ref)
+
+    def _base_params(self, x):
+        """ Returns the parameters of x used by the fits """
+        return x
+
+    def _inertial_from_sparse(self, x, h_coorb, h_22, mode_list, dtM,
+        timesM, fM_low, fM_ref):
+        """ Calls _coorbital_to_inertial_frame for call_sparse """
+        return self._coorbital_to_inertial_frame(h_coorb, h_22, mode_list,
+            dtM, timesM, fM_low, fM_ref, False)
+
+    def call_chunked(self, x, chunk_samples, fM_low=None, fM_ref=None,
+            dtM=None, timesM=None, dfM=None, freqsM=None, mode_list=None,
+            ellMax=None, precessing_opts=None, tidal_opts=None,
+            par_dict=None):
+        """
+    Evaluates the dimensionless surrogate modes in chunks of time samples.
+
+    chunk_samples : Maximum number of time samples in each chunk.
+
+    All other arguments are the same as for __call__. Only the sparse
+    surrogate data and the current chunk are held in memory, so this can be
+    used for waveforms that are too long to be held in memory at once.
+
+    Returns timesM_start, timesM_end, chunks:
+        timesM_start, timesM_end : The first and last time of the full
+            waveform, in units of M.
+        chunks : A generator of (timesM, h) tuples, where timesM and h are
+            contiguous pieces of the timesM and h returned by __call__, in
+            order.
+        """
+        if dfM is not None or freqsM is not None:
+            raise ValueError('Expected dfM and freqsM to be None for a Time'
+                ' domain model')
+
+        mode_list = self._get_mode_list(mode_list, ellMax)
+
+        if par_dict is not None:
+            raise ValueError('par_dict should be None for this model')
+
+        h_22, h_coorb = self._eval_coorbital(x, mode_list)
+
+        return self._coorbital_to_inertial_frame_chunks(h_coorb, h_22,
+            mode_list, dtM, timesM, fM_low, fM_ref, chunk_samples)
+
+    def batch_call(self, xs, fM_low=None, fM_ref=None, dtM=None,
+            timesM=None, dfM=None, freqsM=None, mode_list=None, ellMax=None,
+            precessing_opts=None, tidal_opts=None, par_dict=None,
+            do_not_align=False):
+        """
+    Evaluates the dimensionless surrogate modes at many parameters.
+
+    xs :            Array with shape (N, dim), each row is an x as accepted by
+                    __call__.
+
+    All other arguments are the same as for __call__, and are shared by all
+    N evaluations. The fits and EI-basis products of all data pieces are
+    evaluated for all rows at once, only the transformation to the
+    inertial frame is done separately for each row.
+
+    Returns a list of N (timesM, h, dynamics) tuples, each the same as
+    returned by __call__.
+        """
+        if dfM is not None:
+            raise ValueError('Expected dfM to be None for a Time domain model')
+        if freqsM is not None:
+            raise ValueError('Expected freqsM to be None for a Time domain'
+                ' model')
+
+        mode_list = self._get_mode_list(mode_list, ellMax)
+
+        if par_dict is not None:
+            raise ValueError('par_dict should be None for this model')
+
+        xs = np.atleast_2d(xs)
+        h_22, h_coorb = self._eval_coorbital_batch(xs, mode_list)
+
+        res = []
+        for i in range(len(xs)):
+            h_22_i = ({k: v[i] for k, v in h_22[0].items()}, {})
+            h_coorb_i = {mode: ({k: v[i] for k, v in h[0].items()}, {})
+                         for mode, h in h_coorb.items()}
+            res.append(self._coorbital_to_inertial_frame(h_coorb_i, h_22_i,
+                mode_list, dtM, timesM, fM_low, fM_ref, do_not_align))
+        return res
 
 class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate):
     """
@@ -1030,6 +1979,36 @@ class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate
     and NOT the peak of the tidally spliced waveform
     """
 
+    def _use_fused_mode_sum(self, dtM, timesM):
+        return False
+
+    def fused_mode_sum(self, x, coefs_func, **kwargs):
+        # The tidal splicing is done on the inertial frame modes
+        raise ValueError('fused_mode_sum is not supported for tidal models.')
+
+    def enable_dense_basis_cache(self, max_entries=4, max_bytes=None):
+        raise ValueError('The dense basis cache is not supported for tidal'
+            ' models.')
+
+    def _base_params(self, x):
+        """ The last two parameters are the tidal parameters and are not a
+        part of the base surrogate model """
+        return x[:-2]
+
+    def _inertial_from_sparse(self, x, h_coorb, h_22, mode_list, dtM,
+        timesM, fM_low, fM_ref):
+        """ Calls _coorbital_to_inertial_frame for call_sparse. The tidal
+        splicing also needs x. """
+        return self._coorbital_to_inertial_frame(h_coorb, h_22, mode_list,
+            dtM, timesM, fM_low, fM_ref, False, x)
+
+    def call_chunked(self, x, chunk_samples, **kwargs):
+        """ Chunked evaluations are not supported for this model, as the
+        tidal splicing needs the full waveform.
+        """
+        raise NotImplementedError('Chunked evaluation is not supported for'
+            ' tidal models.')
+
     def _coorbital_to_inertial_frame(self, h_coorb, h_22, mode_list, dtM,
         timesM, fM_low, fM_ref, do_not_align, x):
         """ Transforms a dict from Coorbital frame to inertial frame.
@@ -1349,6 +2328,11 @@ class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate
                 h_dict[mode] = (h_coorb_lm_amp + h_coorb_lm_tid) \
                         * np.exp((-1j*m/2.)*phi_22+1j*h_coorb_lm_phase)
 
+        # The tidal corrections are done in double precision
+        complex_dtype = np.result_type(self.dtype, np.complex64)
+        for mode in h_dict.keys():
+            h_dict[mode] = h_dict[mode].astype(complex_dtype, copy=False)
+
         return timesM, h_dict, None     # None is for dynamics
 
     def __call__(self, x, fM_low=None, fM_ref=None, dtM=None,
@@ -1431,15 +2415,7 @@ class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate
             raise ValueError('Expected freqsM to be None for a Time domain'
                 ' model')
 
-        if mode_list is None:
-            mode_list = self.mode_list
-        if ellMax is not None:
-            if ellMax > np.max(np.array(self.mode_list).T[0]):
-                raise ValueError('ellMax is greater than max allowed ell.')
-            include_modes = np.array(self.mode_list).T[0] <= ellMax
-            mode_list = [self.mode_list[idx]
-                    for idx in range(len(self.mode_list))
-                    if include_modes[idx]]
+        mode_list = self._get_mode_list(mode_list, ellMax)
 
         # The last to parameters are the tidal parameters and are not a part of
         # the base surrogate model
@@ -1447,20 +2423,47 @@ class AlignedSpinCoOrbitalFrameSurrogateTidal(AlignedSpinCoOrbitalFrameSurrogate
 
         # always evaluate the (2,2) mode, the other modes neeed this
         # for transformation from coorbital to inertial frame
+        h_22, h_coorb = self._eval_coorbital(x_sur, mode_list)
 
-        # At this stage the phase of the (2,2) mode is the residual after
-        # removing the TaylorT3 part (see. Eq.44 of arxiv.1812.07865)
-        h_22 = self._eval_sur(x_sur, tuple([2, 2]))
+        return self._coorbital_to_inertial_frame(h_coorb, h_22, \
+            mode_list, dtM, timesM, fM_low, fM_ref, do_not_align, x)
 
-        # Get the TaylorT3 part and add to get the actual phase
-        self._set_TaylorT3_factor()
-        h_22[0]['phase'] += self._TaylorT3_phase_22(x_sur)
+    def batch_call(self, xs, fM_low=None, fM_ref=None, dtM=None,
+            timesM=None, dfM=None, freqsM=None, mode_list=None, ellMax=None,
+            precessing_opts=None, tidal_opts=None, par_dict=None,
+            do_not_align=False):
+        """
+    Evaluates the dimensionless surrogate modes at many parameters.
 
-        h_coorb = {k: self._eval_sur(x_sur, k) for k in mode_list \
-                        if k != tuple([2,2])}
+    xs :            Array with shape (N, dim), each row is an x as accepted by
+                    __call__.
 
-        return self._coorbital_to_inertial_frame(h_coorb, h_22, \
-            mode_list, dtM, timesM, fM_low, fM_ref, do_not_align, x)
+    All other arguments are the same as for __call__. Returns a list of N
+    (timesM, h, dynamics) tuples, each the same as returned by __call__.
+        """
+        if par_dict is not None:
+            raise ValueError('Expected par_dict to be None.')
+        if dfM is not None:
+            raise ValueError('Expected dfM to be None for a Time domain model')
+        if freqsM is not None:
+            raise ValueError('Expected freqsM to be None for a Time domain'
+                ' model')
+
+        mode_list = self._get_mode_list(mode_list, ellMax)
+
+        # The last to parameters are the tidal parameters and are not a part of
+        # the base surrogate model
+        xs = np.atleast_2d(xs)
+        h_22, h_coorb = self._eval_coorbital_batch(xs[:, :-2], mode_list)
+
+        res = []
+        for i in range(len(xs)):
+            h_22_i = ({k: v[i] for k, v in h_22[0].items()}, {})
+            h_coorb_i = {mode: ({k: v[i] for k, v in h[0].items()}, {})
+                         for mode, h in h_coorb.items()}
+            res.append(self._coorbital_to_inertial_frame(h_coorb_i, h_22_i,
+                mode_list, dtM, timesM, fM_low, fM_ref, do_not_align, xs[i]))
+        return res
 
 
 
@@ -169,6 +169,9 @@ static PyObject *eval_fit(PyObject *self, PyObject *args) {
     n = PyArray_DIMS(coefs)[0];
     res = 0.0;
 
+    // Only raw C arrays are used below, so other python threads can run
+    Py_BEGIN_ALLOW_THREADS
+
     // Compute all needed powers
     for (i=0; i <= q_max_bfOrder; i++){        // power of q parameter
         x_powers[i] = ipow(q_fit_offset + q_fit_slope*x_data[0], i);
@@ -192,6 +195,8 @@ static PyObject *eval_fit(PyObject *self, PyObject *args) {
         res += coef_data[i]*prod;
     }
 
+    Py_END_ALLOW_THREADS
+
     return Py_BuildValue("d", res);
 }
 
@@ -409,6 +414,9 @@ static PyObject *ab4_dy(PyObject *self, PyObject *args) {
     k4_data = (double *) PyArray_DATA(k4);
     res_data = (double *) PyArray_DATA(res);
 
+    // Only raw C arrays are used below, so other python threads can run
+    Py_BEGIN_ALLOW_THREADS
+
     // Various time intervals
     dt12 = dt1 + dt2;
     dt123 = dt12 + dt3;
@@ -438,6 +446,8 @@ static PyObject *ab4_dy(PyObject *self, PyObject *args) {
         res_data[i] = dt4 * (A + dt4 * (0.5*B + dt4*( C/3.0 + dt4*0.25*D)));
     }
 
+    Py_END_ALLOW_THREADS
+
     // Sum up contributions
     return PyArray_Return(res);
 }
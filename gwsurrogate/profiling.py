@@ -0,0 +1,199 @@
+""" Opt-in timing of the stages of surrogate evaluations.
+
+While a Profiler is active, the wall time and number of calls of each stage
+of all evaluations are recorded:
+
+    >>> from gwsurrogate import profiling
+    >>> with profiling.Profiler() as prof:
+    ...     sur(q, chiA0, chiB0, f_low=20, dt=1./4096, M=60, dist_mpc=100,
+    ...         units='mks', inclination=0.4)
+    >>> prof.stats['interpolation']['calls']
+    >>> print(prof.report())
+
+The stages are:
+    param_checks:   Checks of the binary parameters.
+    fits:           Evaluation of the fits at the empirical nodes.
+    ei_basis:       Products of the nodes with the empirical interpolation
+                    bases.
+    dynamics:       Integration of the dynamics ODE of precessing models.
+    interpolation:  Spline interpolation, such as onto the output times.
+    rotation:       Transformation from the coorbital frame to the inertial
+                    frame.
+    taper:          Tapering the start or end of the waveform.
+    mode_sum:       Sum over modes with the spin-weighted spherical harmonics.
+    fft:            Fourier transforms for frequency domain output.
+
+Stages can be nested, for example interpolation is done during the dynamics
+integration. The 'time' of a stage includes its nested stages, 'self_time'
+excludes them. Unlike cProfile, only the stages are timed, so the overhead
+is small, and nothing is timed when no Profiler is active. """
+
+from __future__ import division # for python 2
+
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@umassd.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma, Kevin Barkett"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import functools
+import threading
+import time
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+# Active profilers, and a lock for modifying this list
+_profilers = []
+_profilers_lock = threading.Lock()
+
+# Stack of the active stages of each thread, for the self times
+_local = threading.local()
+
+
+class _NullStage(object):
+    """ Does nothing, used when no Profiler is active """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    """ Times a stage, and records it with all active profilers """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.nested_time = 0.
+        self.t0 = _timer()
+        return self
+
+    def __exit__(self, *args):
+        elapsed = _timer() - self.t0
+        stack = _local.stack
+        stack.pop()
+        if stack:
+            stack[-1].nested_time += elapsed
+        for prof in list(_profilers):
+            prof._record(self.name, elapsed, elapsed - self.nested_time)
+        return False
+
+
+def stage(name):
+    """ Returns a context manager that times the enclosed code as the given
+    stage, if a Profiler is active. """
+    if not _profilers:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def timed(name):
+    """ Decorator that times each call of a function as the given stage """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profilers:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Profiler(object):
+    """
+    Records the wall time and number of calls of each evaluation stage,
+    see the module docstring. Use as a context manager, or call start() and
+    stop(). Stages of evaluations in all threads are recorded while the
+    Profiler is active.
+
+    stats:  Dict with a dict for each stage that has been called, with keys
+            'calls', 'time' and 'self_time'. Times are in seconds.
+    """
+
+    def __init__(self, callback=None):
+        """
+        callback: Optional function, called as callback(stage, elapsed) at
+                  the end of each stage, where elapsed is the wall time of
+                  the stage in seconds. This is called from the evaluating
+                  thread, and should be fast.
+        """
+        self.callback = callback
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def _record(self, name, elapsed, self_time):
+        with self._lock:
+            entry = self.stats.get(name)
+            if entry is None:
+                entry = self.stats[name] = {'calls': 0, 'time': 0.,
+                                            'self_time': 0.}
+            entry['calls'] += 1
+            entry['time'] += elapsed
+            entry['self_time'] += self_time
+        if self.callback is not None:
+            self.callback(name, elapsed)
+
+    def start(self):
+        """ Starts recording """
+        with _profilers_lock:
+            if self not in _profilers:
+                _profilers.append(self)
+        return self
+
+    def stop(self):
+        """ Stops recording """
+        with _profilers_lock:
+            if self in _profilers:
+                _profilers.remove(self)
+
+    def reset(self):
+        """ Clears the recorded stats """
+        with self._lock:
+            self.stats = {}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+        return False
+
+    def report(self):
+        """ Returns a table of the stats, sorted by self time """
+        lines = ['%-15s %8s %12s %12s' % ('stage', 'calls', 'time [ms]',
+                                          'self [ms]')]
+        for name, entry in sorted(self.stats.items(),
+                                  key=lambda x: -x[1]['self_time']):
+            lines.append('%-15s %8d %12.3f %12.3f' % (name, entry['calls'],
+                1e3*entry['time'], 1e3*entry['self_time']))
+        return '\n'.join(lines)
@@ -0,0 +1,249 @@
+""" Reduced order quadrature (ROQ) of likelihood inner products.
+
+A single function surrogate (see _SingleFunctionSurrogate_NoChecks) models a
+function as h(x; t) = sum_i c_i(x) B_i(t), where the nodes c_i(x) are given
+by the node functions and B_i is the empirical interpolation basis. For
+fixed data d and noise PSD, the noise weighted inner products are then
+    <d|h> = Re sum_i c_i L_i,                L_i = <d|B_i>,
+    <h|h> = Re sum_ij conj(c_i) Q_ij c_j,    Q_ij = <B_i|B_j>.
+The weights L and Q only depend on the data, the PSD and the basis, so they
+are computed once. Each likelihood evaluation then only evaluates the
+n_nodes node functions and does O(n_nodes^2) operations, instead of
+generating the waveform and doing an inner product over the whole data
+segment. This is exact up to rounding, as the only approximations, the
+interpolation of the basis onto the data times and the FFT, are linear.
+
+This applies to functions that are linear in the strain, such as the
+complex modes of single mode or multimodal surrogates, but not to data
+pieces like an amplitude or a phase.
+
+Inner products are computed in the frequency domain with the convention of
+the fourier module, htilde(f) = int h(t) exp(-2 pi i f t) dt, as
+    <a|b> = Re 2 sum_f conj(atilde(f)) btilde(f) df / S(|f|),
+summed over the positive and negative FFT frequencies with
+f_min <= |f| <= f_max, where S is the one sided PSD. For real a and b this
+is the usual 4 Re int_f_min^f_max conj(atilde) btilde / S df, and complex
+time series, such as h = hplus - i hcross, are allowed.
+"""
+
+from __future__ import division # for python 2
+
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@umassd.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma, Kevin Barkett"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import numpy as np
+
+from . import profiling as _profiling
+from . import spline_interp_Cwrapper as _spline_interp_Cwrapper
+from .new.nodeFunction import stack_gpr_fits
+
+try:
+    from scipy import fft as _fft
+except ImportError:
+    # scipy < 1.4
+    from numpy import fft as _fft
+
+
+def _time_step(times):
+    """ Returns the step of the uniformly sampled times """
+    times = np.asarray(times)
+    if times.ndim != 1 or len(times) < 2:
+        raise ValueError("Expected a 1d array of at least 2 times.")
+    dt = (times[-1] - times[0])/(len(times) - 1)
+    if np.max(np.abs(np.diff(times) - dt)) > 1e-6*dt:
+        raise ValueError("The times must be uniformly sampled.")
+    return dt
+
+
+def frequency_weights(num, dt, psd, f_min=0., f_max=None):
+    """
+    Returns the weights W of the inner product of time series with num
+    samples and time step dt, such that
+        <a|b> = Re sum(conj(atilde) * btilde * W),
+    where atilde = dt*fft(a), with the FFT frequencies in the usual order
+    k/(num dt) for k = 0, 1, ..., num/2, then negative frequencies.
+
+    psd:    The one sided PSD, as a function of an array of frequencies
+            f >= 0, or an array at the frequencies
+            np.fft.rfftfreq(num, dt). The PSD must be positive between
+            f_min and f_max, an infinite PSD gives zero weight.
+    f_min, f_max: Frequency range of the inner product. f_max=None for no
+            upper limit. Default: 0, None.
+    """
+    df = 1./(num*dt)
+    k = np.arange(num)
+    abs_freqs = np.minimum(k, num - k)*df
+    if callable(psd):
+        psd = np.asarray(psd(abs_freqs), dtype=float)
+    else:
+        psd = np.asarray(psd, dtype=float)
+        if psd.shape != (num//2 + 1,):
+            raise ValueError("Expected a PSD with %d samples, at the "
+                "frequencies np.fft.rfftfreq(%d, dt)."%(num//2 + 1, num))
+        psd = psd[np.minimum(k, num - k)]
+
+    band = abs_freqs >= f_min
+    if f_max is not None:
+        band &= abs_freqs <= f_max
+    if np.any(~(psd[band] > 0)):
+        raise ValueError("The PSD must be positive in [f_min, f_max].")
+    weights = np.zeros(num)
+    weights[band] = 2.*df/psd[band]
+    return weights
+
+
+def inner_product(a, b, times, psd, f_min=0., f_max=None):
+    """
+    Returns the inner product <a|b> of two time series sampled at the
+    uniformly spaced times, see frequency_weights for the arguments. This is
+    the direct computation that ROQ replaces.
+    """
+    dt = _time_step(times)
+    weights = frequency_weights(len(times), dt, psd, f_min=f_min,
+                                f_max=f_max)
+    atilde = dt*_fft.fft(a)
+    btilde = dt*_fft.fft(b)
+    return np.real(np.sum(np.conj(atilde)*btilde*weights))
+
+
+def roq_weights(ei_basis, domain, times, data, psd, f_min=0., f_max=None):
+    """
+    Returns the ROQ weights L, Q of an empirical interpolation basis, such
+    that for h = nodes.dot(ei_basis)
+        <data|h> = Re nodes.dot(L),
+        <h|h> = Re conj(nodes).dot(Q).dot(nodes).
+
+    ei_basis:   Real or complex basis with shape (n_nodes, len(domain)).
+    domain:     The increasing samples of the basis. The basis is
+                interpolated onto times with splines, and is zero at
+                times outside the domain.
+    times:      The uniformly spaced times of the data.
+    data:       The data time series, real or complex, sampled at times.
+    psd, f_min, f_max: See frequency_weights.
+
+    The interpolated basis and its Fourier transform, with shape
+    (n_nodes, len(times)), are held in memory while the weights are built.
+    """
+    times = np.asarray(times, dtype=float)
+    dt = _time_step(times)
+    num = len(times)
+    if np.shape(data) != (num,):
+        raise ValueError("Expected data with the same length as times.")
+    weights = frequency_weights(num, dt, psd, f_min=f_min, f_max=f_max)
+
+    ei_basis = np.asarray(ei_basis)
+    basis_dtype = np.result_type(ei_basis.dtype, np.float64)
+    basis = np.zeros((len(ei_basis), num), dtype=basis_dtype)
+    inside = (times >= domain[0]) & (times <= domain[-1])
+    if np.any(inside):
+        with _profiling.stage('interpolation'):
+            basis[:, inside] = _spline_interp_Cwrapper.interpolate(
+                times[inside], domain, ei_basis.astype(basis_dtype))
+
+    with _profiling.stage('fft'):
+        basis_tilde = dt*_fft.fft(basis, axis=-1)
+        data_tilde = dt*_fft.fft(data)
+    del basis
+
+    L = basis_tilde.dot(np.conj(data_tilde)*weights)
+    Q = (np.conj(basis_tilde)*weights).dot(basis_tilde.T)
+    return L, Q
+
+
+class ROQ(object):
+    """
+    Reduced order quadrature of the inner products <d|h> and <h|h> of a
+    single function surrogate h with fixed data d, see the module docstring.
+    """
+
+    def __init__(self, sur, times, data, psd, f_min=0., f_max=None,
+            domain=None):
+        """
+        sur:    A _SingleFunctionSurrogate_NoChecks or SingleFunctionSurrogate,
+                whose ei_basis and node_functions are used.
+        times, data, psd, f_min, f_max: See roq_weights.
+        domain: The domain of the basis. Default: None, in which case
+                sur.domain is used. The components of a ManyFunctionSurrogate
+                have no domain of their own, use the domain of the
+                ManyFunctionSurrogate.
+        """
+        if domain is None:
+            domain = getattr(sur, 'domain', None)
+            if domain is None:
+                raise ValueError("sur has no domain, domain must be given.")
+        self.sur = sur
+        self.node_functions = list(sur.node_functions)
+        self.L, self.Q = roq_weights(sur.ei_basis, domain, times, data, psd,
+            f_min=f_min, f_max=f_max)
+        self._stack = stack_gpr_fits(self.node_functions)
+
+    def _check_params(self, x):
+        """ Nudges x into the parameter space of a SingleFunctionSurrogate,
+        as done by its __call__ """
+        param_space = getattr(self.sur, 'param_space', None)
+        if param_space is not None:
+            x = param_space.nudge_params(x)
+        return x
+
+    def nodes(self, x):
+        """ Returns the nodes at x, with shape (n_nodes,) """
+        x = self._check_params(x)
+        with _profiling.stage('fits'):
+            return np.array([nf(x) for nf in self.node_functions])
+
+    def batch_nodes(self, xs):
+        """ Returns the nodes at each row of xs, with shape (N, n_nodes) """
+        xs = np.array([self._check_params(x) for x in np.atleast_2d(xs)])
+        with _profiling.stage('fits'):
+            if self._stack is not None:
+                return self._stack(xs).T
+            return np.array([nf.batch_call(xs)
+                             for nf in self.node_functions]).T
+
+    def inner_products_from_nodes(self, nodes):
+        """
+        Returns <d|h>, <h|h> for h = nodes.dot(ei_basis). nodes can also
+        have shape (N, n_nodes), in which case arrays of length N are
+        returned.
+        """
+        nodes = np.asarray(nodes)
+        dh = np.real(nodes.dot(self.L))
+        hh = np.real(np.sum(np.conj(nodes)*nodes.dot(self.Q.T), axis=-1))
+        return dh, hh
+
+    def inner_products(self, x):
+        """ Returns <d|h>, <h|h> for the surrogate evaluated at x """
+        return self.inner_products_from_nodes(self.nodes(x))
+
+    def batch_inner_products(self, xs):
+        """ Returns arrays of <d|h>, <h|h> for each row of xs """
+        return self.inner_products_from_nodes(self.batch_nodes(xs))
+
+    def log_likelihood(self, x):
+        """ Returns <d|h> - <h|h>/2, the log likelihood up to a term that
+        does not depend on x """
+        dh, hh = self.inner_products(x)
+        return dh - 0.5*hh
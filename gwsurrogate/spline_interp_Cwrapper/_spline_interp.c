@@ -1,4 +1,6 @@
 #include <stdio.h>
+#include <stdlib.h>
+#include <math.h>
 #include <gsl/gsl_spline.h>
 
 void spline_interp(long data_size, long out_size, \
@@ -20,3 +22,272 @@ void spline_interp(long data_size, long out_size, \
     gsl_spline_free(spline);
     gsl_interp_accel_free(acc);
 }
+
+
+/* Natural cubic splines of one or more data arrays on the same grid.
+ *
+ * The spline coefficients are computed with the same arithmetic as the
+ * gsl_interp_cspline type used by spline_interp above, so the results are
+ * the same. The tridiagonal system only depends on the grid, so its
+ * factorization is computed once in spline_multi_alloc, and used for each
+ * data array in spline_multi_set_data. The spline can be evaluated any
+ * number of times, each point is located once for all data arrays.
+ */
+
+typedef struct {
+    long size;          // number of grid points, at least 3
+    double *x;          // grid, copy of the data_x given to alloc
+    double *alpha;      // diagonal of D in the L.D.L^t factorization
+    double *gamma;      // lower diagonal of L
+    double *inv_h;      // 1/(x[i+1] - x[i]), as in gsl cspline
+    int uniform;        // nonzero if the grid is uniformly spaced
+    double inv_dx;      // 1/spacing, if uniform
+    long nrhs;          // number of data arrays
+    double *y;          // data, shape (nrhs, size)
+    double *c;          // spline coefficients, shape (nrhs, size)
+} spline_multi;
+
+
+void spline_multi_free(spline_multi *s) {
+    if (s == NULL) return;
+    free(s->x);
+    free(s->alpha);
+    free(s->gamma);
+    free(s->inv_h);
+    free(s->y);
+    free(s->c);
+    free(s);
+}
+
+
+spline_multi *spline_multi_alloc(long size, const double *data_x) {
+    // Returns NULL if size < 3, data_x is not increasing, or out of memory
+    long i;
+    long sys_size = size - 2;
+    spline_multi *s;
+    double dx, spacing;
+
+    if (size < 3) return NULL;
+    for (i = 0; i < size - 1; i++) {
+        if (!(data_x[i + 1] > data_x[i])) return NULL;
+    }
+
+    s = calloc(1, sizeof(spline_multi));
+    if (s == NULL) return NULL;
+    s->size = size;
+    s->x = malloc(size*sizeof(double));
+    s->alpha = malloc(sys_size*sizeof(double));
+    s->gamma = malloc(sys_size*sizeof(double));
+    s->inv_h = malloc((size - 1)*sizeof(double));
+    if (s->x == NULL || s->alpha == NULL || s->gamma == NULL
+            || s->inv_h == NULL) {
+        spline_multi_free(s);
+        return NULL;
+    }
+
+    for (i = 0; i < size; i++) s->x[i] = data_x[i];
+    for (i = 0; i < size - 1; i++) s->inv_h[i] = 1.0/(data_x[i + 1] - data_x[i]);
+
+    // L.D.L^t factorization of the symmetric tridiagonal matrix with
+    // diag[i] = 2 (h_i + h_{i+1}) and offdiag[i] = h_{i+1}, as in
+    // gsl_linalg_solve_symm_tridiag
+    s->alpha[0] = 2.0*((data_x[2] - data_x[1]) + (data_x[1] - data_x[0]));
+    for (i = 1; i < sys_size; i++) {
+        double h_i = data_x[i + 1] - data_x[i];
+        double h_ip1 = data_x[i + 2] - data_x[i + 1];
+        s->gamma[i - 1] = h_i/s->alpha[i - 1];
+        s->alpha[i] = 2.0*(h_ip1 + h_i) - h_i*s->gamma[i - 1];
+    }
+
+    // Grids with a constant spacing, up to rounding, locate points with
+    // arithmetic instead of a search
+    spacing = (data_x[size - 1] - data_x[0])/(size - 1);
+    s->uniform = 1;
+    for (i = 0; i < size - 1; i++) {
+        dx = data_x[i + 1] - data_x[i];
+        if (fabs(dx - spacing) > 1e-10*spacing) {
+            s->uniform = 0;
+            break;
+        }
+    }
+    s->inv_dx = 1.0/spacing;
+    return s;
+}
+
+
+int spline_multi_set_data(spline_multi *s, long nrhs, const double *data_y) {
+    // data_y has shape (nrhs, size). Returns 0 on success, -1 if out of
+    // memory.
+    long size = s->size;
+    long sys_size = size - 2;
+    long r, i;
+
+    if (nrhs != s->nrhs) {
+        free(s->y);
+        free(s->c);
+        s->nrhs = 0;
+        s->y = malloc(nrhs*size*sizeof(double));
+        s->c = malloc(nrhs*size*sizeof(double));
+        if (s->y == NULL || s->c == NULL) return -1;
+        s->nrhs = nrhs;
+    }
+
+    for (r = 0; r < nrhs; r++) {
+        const double *ya = data_y + r*size;
+        double *y = s->y + r*size;
+        double *c = s->c + r*size;
+        for (i = 0; i < size; i++) y[i] = ya[i];
+
+        // Right hand side as in gsl cspline_init, stored in c[1:size-1]
+        for (i = 0; i < sys_size; i++) {
+            c[i + 1] = 3.0*((ya[i + 2] - ya[i + 1])*s->inv_h[i + 1]
+                            - (ya[i + 1] - ya[i])*s->inv_h[i]);
+        }
+
+        // Solve with the factorization, as gsl_linalg_solve_symm_tridiag
+        c[0] = 0.0;
+        c[size - 1] = 0.0;
+        if (sys_size == 1) {
+            c[1] = c[1]/s->alpha[0];
+            continue;
+        }
+        for (i = 1; i < sys_size; i++) c[i + 1] -= s->gamma[i - 1]*c[i];
+        for (i = 0; i < sys_size; i++) c[i + 1] /= s->alpha[i];
+        for (i = sys_size - 2; i >= 0; i--) c[i + 1] -= s->gamma[i]*c[i + 2];
+    }
+    return 0;
+}
+
+
+static long spline_multi_find(const spline_multi *s, double x, long guess) {
+    // Returns i such that x[i] <= x < x[i+1], or size - 2 if x == x[size-1],
+    // as gsl_interp_bsearch
+    const double *xa = s->x;
+    long lo, hi;
+
+    if (s->uniform) {
+        guess = (long) ((x - xa[0])*s->inv_dx);
+    }
+    if (guess < 0) guess = 0;
+    if (guess > s->size - 2) guess = s->size - 2;
+
+    if (x < xa[guess]) {
+        lo = 0;
+        hi = guess;
+    } else if (x >= xa[guess + 1] && guess < s->size - 2) {
+        lo = guess;
+        hi = s->size - 1;
+    } else {
+        return guess;
+    }
+    while (hi > lo + 1) {
+        long i = (hi + lo)/2;
+        if (xa[i] > x) {
+            hi = i;
+        } else {
+            lo = i;
+        }
+    }
+    return lo;
+}
+
+
+static inline double spline_multi_value(const spline_multi *s, long r,
+        long index, double dx, double delx) {
+    // Data array r at x[index] + delx, as in gsl cspline_eval
+    const double *y = s->y + r*s->size;
+    const double *c = s->c + r*s->size;
+    double dy = y[index + 1] - y[index];
+    double c_i = c[index];
+    double c_ip1 = c[index + 1];
+    double b_i = (dy/dx) - dx*(c_ip1 + 2.0*c_i)/3.0;
+    double d_i = (c_ip1 - c_i)/(3.0*dx);
+    return y[index] + delx*(b_i + delx*(c_i + delx*d_i));
+}
+
+
+int spline_multi_eval(const spline_multi *s, long out_size,
+        const double *out_x, double *out_y, const long *row_offsets,
+        long out_step) {
+    // Evaluates all data arrays at out_x. Data array r is written to
+    // out_y[row_offsets[r] + out_step*j] for j < out_size. Returns 0 on
+    // success, -1 if some out_x are outside the grid.
+    long j, r;
+    long index = 0;
+    long size = s->size;
+
+    for (j = 0; j < out_size; j++) {
+        double x = out_x[j];
+        double x_lo, dx, delx;
+        if (!(x >= s->x[0] && x <= s->x[size - 1])) return -1;
+        index = spline_multi_find(s, x, index);
+        x_lo = s->x[index];
+        dx = s->x[index + 1] - x_lo;
+        delx = x - x_lo;
+
+        for (r = 0; r < s->nrhs; r++) {
+            out_y[row_offsets[r] + out_step*j] =
+                spline_multi_value(s, r, index, dx, delx);
+        }
+    }
+    return 0;
+}
+
+
+int spline_multi_rotated_sum(const spline_multi *s, long out_size,
+        const double *out_x, const double *phase, long num_terms,
+        const long *rows_re, const long *rows_im, const double *m,
+        const double *coefs, double *out_re, double *out_im,
+        long out_step) {
+    // Evaluates, in one pass over out_x, a weighted sum of the complex
+    // arrays h_k = (y_re + i y_im) exp(-i m[k] phase[j]/2) for k <
+    // num_terms, where y_re and y_im are the data arrays rows_re[k] and
+    // rows_im[k] at out_x[j], or zero for a row of -1. With hr, hi the real
+    // and imaginary parts of h_k and a, b, c, d = coefs[4k:4k+4],
+    //     out_re[out_step*j] = sum_k a hr + b hi,
+    //     out_im[out_step*j] = sum_k c hr + d hi.
+    // The rotation is only recomputed when m changes between consecutive
+    // terms. Returns 0 on success, -1 if some out_x are outside the grid.
+    long j, k;
+    long index = 0;
+    long size = s->size;
+
+    for (j = 0; j < out_size; j++) {
+        double x = out_x[j];
+        double x_lo, dx, delx;
+        double sum_re = 0.0, sum_im = 0.0;
+        double cos_m = 1.0, sin_m = 0.0;
+        double prev_m = 0.0;
+        if (!(x >= s->x[0] && x <= s->x[size - 1])) return -1;
+        index = spline_multi_find(s, x, index);
+        x_lo = s->x[index];
+        dx = s->x[index + 1] - x_lo;
+        delx = x - x_lo;
+
+        for (k = 0; k < num_terms; k++) {
+            const double *w = coefs + 4*k;
+            double y_re = 0.0, y_im = 0.0;
+            double hr, hi;
+            if (m[k] != prev_m) {
+                double angle = m[k]*phase[j]/2.0;
+                cos_m = cos(angle);
+                sin_m = sin(angle);
+                prev_m = m[k];
+            }
+            if (rows_re[k] >= 0) {
+                y_re = spline_multi_value(s, rows_re[k], index, dx, delx);
+            }
+            if (rows_im[k] >= 0) {
+                y_im = spline_multi_value(s, rows_im[k], index, dx, delx);
+            }
+            // (y_re + i y_im)*(cos_m - i sin_m)
+            hr = y_re*cos_m + y_im*sin_m;
+            hi = y_im*cos_m - y_re*sin_m;
+            sum_re += w[0]*hr + w[1]*hi;
+            sum_im += w[2]*hr + w[3]*hi;
+        }
+        out_re[out_step*j] = sum_re;
+        out_im[out_step*j] = sum_im;
+    }
+    return 0;
+}
@@ -1,10 +1,10 @@
 import ctypes
-from ctypes import c_double, c_long, POINTER, util
+from ctypes import c_double, c_int, c_long, c_void_p, POINTER, util
 import numpy as np
 import os
 from glob import glob
 
-def _load_spline_interp(dll_path,function_name):
+def _load_spline_interp(dll_path):
 
     cblas_path = util.find_library('cblas')
     if cblas_path is None:
@@ -19,39 +19,242 @@ def _load_spline_interp(dll_path,function_name):
     func.argtypes = [c_long, c_long,
         POINTER(c_double), POINTER(c_double),
         POINTER(c_double), POINTER(c_double)]
-    return func
-
-dll_dir = os.path.dirname(os.path.realpath(__file__))
-dll_path_glob = '%s/_spline_interp*so'%dll_dir
-spline_libs = glob(dll_path_glob)
-if len(spline_libs) == 0:
-  all_files = glob('%s/*'%dll_dir)
-  msg = '_spline_interp library not found! Searched in path %s which has files...\n'%dll_dir
-  for all_file in all_files:
-    msg += all_file+"\n"
-  raise Exception(msg)
-elif len(spline_libs) > 1:
-  raise Exception('there should be only one _spline_interp library!')
-else:
-  #c_interp = _load_spline_interp('%s/_spline_interp.so'%dll_dir, 'spline_interp')
-  c_interp = _load_spline_interp(spline_libs[0], 'spline_interp')
-
-def interpolate(xnew, x, y):
-
-    if min(xnew) < min(x) or max(xnew) > max(x):
-        raise Exception('Extrapolation not allowed')
-
-    x = x.astype('float64')
-    y = y.astype('float64')
-    xnew = xnew.astype('float64')
-
-    x_p = x.ctypes.data_as(POINTER(c_double))
-    y_p = y.ctypes.data_as(POINTER(c_double))
-    xnew_p = xnew.ctypes.data_as(POINTER(c_double))
-
-    ynew  = np.zeros(xnew.shape[0])
-    ynew_p = ynew.ctypes.data_as(POINTER(c_double))
-
-    c_interp(x.shape[0],xnew.shape[0],x_p,y_p,xnew_p,ynew_p)
-
-    return ynew
+
+    dll.spline_multi_alloc.restype = c_void_p
+    dll.spline_multi_alloc.argtypes = [c_long, POINTER(c_double)]
+    dll.spline_multi_set_data.restype = c_int
+    dll.spline_multi_set_data.argtypes = [c_void_p, c_long, POINTER(c_double)]
+    dll.spline_multi_eval.restype = c_int
+    dll.spline_multi_eval.argtypes = [c_void_p, c_long, POINTER(c_double),
+        POINTER(c_double), POINTER(c_long), c_long]
+    dll.spline_multi_rotated_sum.restype = c_int
+    dll.spline_multi_rotated_sum.argtypes = [c_void_p, c_long,
+        POINTER(c_double), POINTER(c_double), c_long, POINTER(c_long),
+        POINTER(c_long), POINTER(c_double), POINTER(c_double),
+        POINTER(c_double), POINTER(c_double), c_long]
+    dll.spline_multi_free.restype = None
+    dll.spline_multi_free.argtypes = [c_void_p]
+    return dll
+
+def _find_spline_lib():
+  """ Returns the path to the compiled _spline_interp library """
+  dll_dir = os.path.dirname(os.path.realpath(__file__))
+  dll_path_glob = '%s/_spline_interp*so'%dll_dir
+  spline_libs = glob(dll_path_glob)
+  if len(spline_libs) == 0:
+    all_files = glob('%s/*'%dll_dir)
+    msg = '_spline_interp library not found! Searched in path %s which has files...\n'%dll_dir
+    for all_file in all_files:
+      msg += all_file+"\n"
+    raise Exception(msg)
+  elif len(spline_libs) > 1:
+    raise Exception('there should be only one _spline_interp library!')
+  return spline_libs[0]
+
+# The library is loaded on first use, as finding cblas can take a while
+_dll = None
+c_interp = None
+
+def _get_dll():
+  global _dll, c_interp
+  if _dll is None:
+    _dll = _load_spline_interp(_find_spline_lib())
+    c_interp = _dll.spline_interp
+  return _dll
+
+def _get_c_interp():
+  _get_dll()
+  return c_interp
+
+def _double_p(arr):
+  return arr.ctypes.data_as(POINTER(c_double))
+
+
+class Spline(object):
+  """
+  Natural cubic splines of one or more data arrays on the same grid x.
+
+  These give the same results as the gsl cspline used by the
+  spline_interp function, but the tridiagonal system for the grid is
+  factorized once, and used for all data arrays and for any new data set
+  with set_data. Each evaluation point is located once for all data arrays,
+  using arithmetic instead of a search if the grid is uniform. The spline is
+  kept until the object is deleted, so it can be evaluated many times.
+
+  Complex data is evaluated in the same pass as its real and imaginary
+  parts, and results can be written into given output arrays.
+
+  Evaluating a spline from several threads is safe, but set_data should
+  not be called while it is evaluated.
+  """
+
+  def __init__(self, x, y=None):
+    """
+    x: Increasing 1d array with at least 3 points.
+    y: Data, see set_data. Default: None, in which case set_data has to be
+       called before evaluating.
+    """
+    self._dll = None
+    self._handle = None
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    if x.ndim != 1:
+      raise ValueError('Expected a 1d grid.')
+    self.x = x
+    self._dll = _get_dll()
+    self._handle = self._dll.spline_multi_alloc(len(x), _double_p(x))
+    if self._handle is None:
+      raise ValueError('Expected an increasing grid with at least 3 points.')
+    self.shape = None
+    self.is_complex = False
+    if y is not None:
+      self.set_data(y)
+
+  def __del__(self):
+    if self._handle is not None:
+      self._dll.spline_multi_free(self._handle)
+      self._handle = None
+
+  def set_data(self, y):
+    """
+    Sets the data to interpolate, reusing the factorization for the grid.
+
+    y: Array with shape (len(x),) or (k, len(x)), real or complex. The last
+       axis is along the grid.
+    """
+    y = np.asarray(y)
+    if y.shape[-1:] != self.x.shape or y.ndim > 2:
+      raise ValueError('Expected data with shape (len(x),) or'
+                       ' (k, len(x)).')
+    self.shape = y.shape[:-1]
+    self.is_complex = np.iscomplexobj(y)
+    y = np.reshape(y, (-1, len(self.x)))
+    if self.is_complex:
+      # The real and imaginary parts of each array are consecutive rows
+      y = np.stack([y.real, y.imag], axis=1).reshape(-1, len(self.x))
+    y = np.ascontiguousarray(y, dtype=np.float64)
+    if self._dll.spline_multi_set_data(self._handle, len(y),
+                                       _double_p(y)) != 0:
+      raise MemoryError('Could not allocate the spline data.')
+    self._nrhs = len(y)
+
+  def __call__(self, xnew, out=None):
+    """
+    Evaluates the splines at xnew, which should lie within the grid.
+
+    out: Array in which to write the result, with the shape of the data
+         with the last axis replaced by len(xnew), C-contiguous, and dtype
+         float64 or complex128 for complex data. Default: None, in which case
+         a new array is returned.
+    """
+    if self.shape is None:
+      raise ValueError('No data was set.')
+    xnew = np.ascontiguousarray(xnew, dtype=np.float64)
+    num = len(xnew)
+    shape = self.shape + (num,)
+    dtype = np.complex128 if self.is_complex else np.float64
+    if out is None:
+      out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape or out.dtype != dtype \
+        or not out.flags.c_contiguous:
+      raise ValueError('Expected a C-contiguous out array with shape %s and'
+                       ' dtype %s.'%(shape, np.dtype(dtype).name))
+
+    rows = np.arange(self._nrhs)
+    if self.is_complex:
+      # Row 2*i is the real part of array i, row 2*i+1 its imaginary part,
+      # which are interleaved in the complex output
+      offsets = (rows//2)*2*num + rows%2
+      step = 2
+    else:
+      offsets = rows*num
+      step = 1
+    offsets = np.ascontiguousarray(offsets, dtype=c_long)
+
+    status = self._dll.spline_multi_eval(self._handle, num, _double_p(xnew),
+        out.ctypes.data_as(POINTER(c_double)),
+        offsets.ctypes.data_as(POINTER(c_long)), step)
+    if status != 0:
+      raise Exception('Extrapolation not allowed')
+    return out
+
+  def rotated_sum(self, xnew, phase, terms, out=None):
+    """
+    Evaluates a weighted sum of rotated complex splines at xnew, in one pass
+    over xnew and without intermediate arrays for the terms.
+
+    Each term is a tuple (re, im, m, coefs), where re and im are indices of
+    real data arrays, or None for zero, and coefs = (a, b, c, d). With
+    h = (y[re] + i y[im]) exp(-i m phase/2) at xnew, the term adds
+    a h.real + b h.imag to the real part of the result, and
+    c h.real + d h.imag to its imaginary part.
+
+    phase: Array with the same length as xnew.
+    out:   Complex128 array with shape (len(xnew),), or float64 array with
+           shape (2, len(xnew)) whose rows are the real and imaginary parts,
+           C-contiguous. Default: None, in which case a new complex array is
+           returned.
+
+    Terms with equal m should be consecutive, as the rotation is only
+    recomputed when m changes.
+    """
+    if self.shape is None:
+      raise ValueError('No data was set.')
+    if self.is_complex:
+      raise ValueError('Expected real data arrays.')
+    xnew = np.ascontiguousarray(xnew, dtype=np.float64)
+    phase = np.ascontiguousarray(phase, dtype=np.float64)
+    num = len(xnew)
+    if phase.shape != xnew.shape:
+      raise ValueError('Expected phase with the same shape as xnew.')
+
+    if out is None:
+      out = np.empty(num, dtype=np.complex128)
+    if out.shape == (num,) and out.dtype == np.complex128 \
+        and out.flags.c_contiguous:
+      out_re = out.ctypes.data
+      out_im = out_re + out.itemsize//2
+      step = 2
+    elif out.shape == (2, num) and out.dtype == np.float64 \
+        and out.flags.c_contiguous:
+      out_re = out[0].ctypes.data
+      out_im = out[1].ctypes.data
+      step = 1
+    else:
+      raise ValueError('Expected a C-contiguous complex128 out array with'
+                       ' shape (%d,) or float64 with shape (2, %d).'%(num, num))
+
+    for re, im, _, _ in terms:
+      for row in (re, im):
+        if row is not None and not 0 <= row < self._nrhs:
+          raise ValueError('Invalid data array index %s.'%row)
+    rows_re = np.array([-1 if t[0] is None else t[0] for t in terms],
+                       dtype=c_long)
+    rows_im = np.array([-1 if t[1] is None else t[1] for t in terms],
+                       dtype=c_long)
+    m = np.array([t[2] for t in terms], dtype=np.float64)
+    coefs = np.ascontiguousarray([t[3] for t in terms],
+                                 dtype=np.float64).reshape(-1, 4)
+    if len(coefs) != len(terms):
+      raise ValueError('Expected 4 coefficients for each term.')
+
+    status = self._dll.spline_multi_rotated_sum(self._handle, num,
+        _double_p(xnew), _double_p(phase), len(terms),
+        rows_re.ctypes.data_as(POINTER(c_long)),
+        rows_im.ctypes.data_as(POINTER(c_long)), _double_p(m),
+        _double_p(coefs), ctypes.cast(out_re, POINTER(c_double)),
+        ctypes.cast(out_im, POINTER(c_double)), step)
+    if status != 0:
+      raise Exception('Extrapolation not allowed')
+    return out
+
+
+def interpolate(xnew, x, y, out=None):
+    """
+    Interpolates y, given at x, to xnew with a natural cubic spline.
+
+    y can have shape (len(x),) or (k, len(x)), and be real or complex, in
+    which case all arrays are interpolated with one spline setup. The result
+    has the shape of y with the last axis replaced by len(xnew), and is
+    written into out if given, see Spline.
+    """
+    return Spline(x, y)(xnew, out=out)
@@ -44,15 +44,33 @@ from gwsurrogate.new.surrogate import ParamDim, ParamSpace
 
 import warnings
 import os
+import importlib
+import threading
+import weakref
 
 from .new import surrogate as new_surrogate
 from .new import precessing_surrogate
 from . import catalog
+from . import cache as _cache
+from . import fourier as _fourier
+from . import harmonics as _harmonics
+from . import profiling as _profiling
 
-try:
-  import matplotlib.pyplot as plt
-except:
-  print("Cannot load matplotlib.")
+class _LazyModule(object):
+  """ Stands in for a module that is only imported when one of its
+  attributes is first used. """
+
+  def __init__(self, name):
+    self._name = name
+    self._module = None
+
+  def __getattr__(self, attr):
+    if self._module is None:
+      self._module = importlib.import_module(self._name)
+    return getattr(self._module, attr)
+
+# matplotlib is slow to import and only needed for plotting
+plt = _LazyModule('matplotlib.pyplot')
 
 try:
   import h5py
@@ -60,6 +78,11 @@ try:
 except ImportError:
   h5py_enabled = False
 
+try:
+  import threadpoolctl as _threadpoolctl
+except ImportError:
+  _threadpoolctl = None
+
 
 # needed to search for single mode surrogate directories 
 def _list_folders(path,prefix):
@@ -1338,6 +1361,498 @@ def CompareSingleModeSurrogate(sur1,sur2):
 
 
 
+#### Helpers for SurrogateEvaluator.map, which evaluates surrogates in a
+#### pool of worker processes. Each worker loads its own copy of the model
+#### once, in _map_worker_init.
+
+# The surrogate loaded in a worker process
+_map_worker_surrogate = None
+
+def _map_worker_init(sur_class, h5filename, load_kwargs, max_threads):
+    """ Loads the surrogate once per worker process. """
+    global _map_worker_surrogate
+    # The BLAS/OpenMP libraries are already loaded at this point, in forked
+    # workers even initialized, so their thread pools are limited at run time
+    if (max_threads is not None) and (_threadpoolctl is not None):
+        _threadpoolctl.threadpool_limits(limits=max_threads)
+    _map_worker_surrogate = sur_class(h5filename, **load_kwargs)
+
+def _map_worker_eval(task):
+    """ Evaluates the surrogate loaded by _map_worker_init """
+    args, kwargs = task
+    return _map_worker_surrogate(*args, **kwargs)
+
+
+class EvaluationPlan(object):
+    """
+    A callable that evaluates a SurrogateEvaluator with fixed evaluation
+    options. Construct this with SurrogateEvaluator.make_plan.
+
+    The options are validated and converted to dimensionless units once, and
+    the sYlm coefficients used for the sum over modes are computed for the
+    first evaluation and reused afterwards. Each evaluation then only does
+    the work that depends on the binary parameters.
+    """
+
+    def __init__(self, sur, M=None, dist_mpc=None, f_low=None, f_ref=None,
+            dt=None, df=None, times=None, freqs=None, mode_list=None,
+            ellMax=None, inclination=None, phi_ref=0, precessing_opts=None,
+            par_dict=None, units='dimensionless', skip_param_checks=False,
+            taper_end_duration=None, return_polarizations=False):
+        """ See SurrogateEvaluator.__call__ for the arguments. """
+
+        if not skip_param_checks:
+            sur._check_evaluation_opts(M, dist_mpc, f_low, f_ref, dt, df,
+                times, freqs, mode_list, ellMax, units, taper_end_duration)
+
+        if return_polarizations and (inclination is None):
+            raise ValueError("inclination must be specified with "
+                "return_polarizations.")
+
+        self.sur = sur
+        self.skip_param_checks = skip_param_checks
+        self.precessing_opts = precessing_opts
+        self.par_dict = par_dict
+        self.inclination = inclination
+        self.phi_ref = phi_ref
+        self.taper_end_duration = taper_end_duration
+        self.return_polarizations = return_polarizations
+        # Copies, so that the plan is not affected if the caller modifies
+        # these arrays later
+        if times is not None:
+            times = np.array(times)
+        if freqs is not None:
+            freqs = np.array(freqs)
+        self.times = times
+        self.freqs = freqs
+
+        # Get scalings from dimensionless units to mks units
+        self.amp_scale, self.t_scale = sur._get_unit_scalings(units, M,
+            dist_mpc)
+
+        # If f_ref is not given, we set it to f_low.
+        if f_ref is None:
+            f_ref = f_low
+
+        # Get dimensionless step size or times/freqs and reference time/freq
+        t_scale = self.t_scale
+        self.dimless_opts = dict(
+            fM_low=f_low*t_scale,
+            fM_ref=f_ref*t_scale,
+            dtM=None if dt is None else dt/t_scale,
+            timesM=None if times is None else times/t_scale,
+            dfM=None if df is None else df*t_scale,
+            freqsM=None if freqs is None else freqs*t_scale,
+            mode_list=mode_list,
+            ellMax=ellMax,
+            par_dict=par_dict,
+            )
+
+        # Frequency domain waveforms from a time domain model
+        self.fourier_plan, self._fourier_index = sur._get_fourier_plan(
+            self.dimless_opts)
+
+        # For nonprecessing systems get the m<0 modes from the m>0 modes.
+        self.fake_neg_modes = not sur.keywords['Precessing']
+
+        # sYlm coefficients for each tuple of modes that has been summed over
+        self._mode_sum_coefs = {}
+
+        # Time domain sums over modes can be done by the dimensionless
+        # surrogate without computing the modes, see _evaluate_fused
+        self._fused_mode_sum = (inclination is not None) \
+            and (taper_end_duration is None) \
+            and (self.fourier_plan is None) \
+            and (sur._domain_type == 'Time') \
+            and hasattr(sur._sur_dimless, '_use_fused_mode_sum')
+
+        # All options that affect the result, used in keys for sur's cache.
+        # The key is only computed when a cache is used, see _get_opts_key,
+        # as hashing times or freqs takes time.
+        self._opts = (M, dist_mpc, f_low, f_ref, dt, df, self.times,
+            self.freqs, mode_list, ellMax, inclination, phi_ref,
+            precessing_opts, par_dict, units, skip_param_checks,
+            taper_end_duration, return_polarizations)
+        self._opts_key = None
+
+    def _mode_sum(self, h_modes, scale=1., out=None):
+        """ Sums over h_modes at (inclination, pi/2 - phi_ref), following
+            the LAL convention, and multiplies by scale. The sum is written
+            to out if given. See SurrogateEvaluator._mode_sum.
+        """
+        modes = tuple(h_modes.keys())
+        coefs = self._get_mode_sum_coefs(modes)
+        return _harmonics.mode_sum([h_modes[mode] for mode in modes],
+            coefs[0], coefs[1], scale=scale, out=out)
+
+    def _get_mode_sum_coefs(self, modes):
+        """ Returns the sYlm coefficients coefs, coefs_neg used by _mode_sum
+            for the tuple modes.
+        """
+        coefs = self._mode_sum_coefs.get(modes)
+        if coefs is None:
+            coefs = self.sur._mode_sum_coefs(modes, self.inclination,
+                np.pi/2 - self.phi_ref, fake_neg_modes=self.fake_neg_modes)
+            self._mode_sum_coefs[modes] = coefs
+        return coefs
+
+    def _out_view(self, out, shape, complex_result=True):
+        """ Returns the part of out used for a result with the given shape.
+            out can be longer than needed along its last axis.
+        """
+        if (out.shape[:-1] != shape[:-1]) or (out.shape[-1] < shape[-1]):
+            raise ValueError("Expected out with shape %s, with at least %d "
+                "samples along the last axis, got %s."%(str(shape[:-1]),
+                shape[-1], str(out.shape)))
+        if complex_result and not np.iscomplexobj(out):
+            raise ValueError("Expected a complex out array.")
+        return out[..., :shape[-1]]
+
+    def _write_out(self, h, out, scale):
+        """ Writes scale*h to out, where h is an array or a dict of modes.
+            For a dict, each mode is a row of out, and a dict of these rows
+            is returned. Else the part of out holding h is returned.
+        """
+        if type(h) == dict:
+            num = len(next(iter(h.values())))
+            rows = self._out_view(out, (len(h), num))
+            for i, h_mode in enumerate(h.values()):
+                np.multiply(h_mode, scale, out=rows[i])
+            return dict(zip(h.keys(), rows))
+        view = self._out_view(out, h.shape, np.iscomplexobj(h))
+        np.multiply(h, scale, out=view)
+        return view
+
+    def __call__(self, q, chiA0, chiB0, tidal_opts=None, out=None):
+        """
+    Evaluates the surrogate. See SurrogateEvaluator.__call__ for the
+    arguments and return values.
+        """
+        sur = self.sur
+        chiA0 = np.array(chiA0)
+        chiB0 = np.array(chiB0)
+
+        cache = sur._cache
+        disk_cache = sur._disk_cache
+        if cache is None and disk_cache is None:
+            return self._evaluate(q, chiA0, chiB0, tidal_opts, out)
+
+        res = self._cached_evaluate(q, chiA0, chiB0, tidal_opts)
+        if out is not None:
+            res = (res[0], self._write_out(res[1], out, 1.), res[2])
+        return res
+
+    def _get_opts_key(self):
+        """ Returns the hashable key of the options of this plan, which is
+            computed on first use.
+        """
+        if self._opts_key is None:
+            self._opts_key = _cache.hashable_key(self._opts)
+        return self._opts_key
+
+    def _cached_evaluate(self, q, chiA0, chiB0, tidal_opts):
+        """ Evaluates the surrogate, looking for the result in sur's caches
+            first.
+        """
+        sur = self.sur
+        cache = sur._cache
+        disk_cache = sur._disk_cache
+
+        if cache is not None:
+            round_params = cache.round_params
+        else:
+            round_params = disk_cache.round_params
+        q = round_params(q)
+        chiA0 = round_params(chiA0)
+        chiB0 = round_params(chiB0)
+        if tidal_opts is not None:
+            tidal_opts = dict((k, round_params(v))
+                              for k, v in tidal_opts.items())
+        key = (self._get_opts_key(),
+               _cache.hashable_key((q, chiA0, chiB0, tidal_opts)))
+
+        # Look in memory first, then on disk
+        if cache is not None:
+            res = cache.get(key)
+            if res is not None:
+                return res
+        if disk_cache is not None:
+            res = disk_cache.get(key)
+            if res is not None:
+                if cache is not None:
+                    cache.put(key, res)
+                return res
+
+        res = self._evaluate(q, chiA0, chiB0, tidal_opts)
+        if disk_cache is not None:
+            disk_cache.put(key, res)
+        if cache is not None:
+            cache.put(key, res)
+        return res
+
+    def _evaluate(self, q, chiA0, chiB0, tidal_opts, out=None):
+        """ Evaluates the surrogate without using the cache. """
+        sur = self.sur
+
+        # sanity checks including extrapolation checks
+        if not self.skip_param_checks:
+            sur._check_params(q, chiA0, chiB0, self.precessing_opts,
+                tidal_opts, self.par_dict)
+
+        x = sur._get_intrinsic_parameters(q, chiA0, chiB0,
+            self.precessing_opts, tidal_opts, self.par_dict)
+
+        if self._fused_mode_sum and sur._sur_dimless._use_fused_mode_sum(
+                self.dimless_opts['dtM'], self.dimless_opts['timesM']):
+            return self._evaluate_fused(x, tidal_opts, out)
+
+        # Get waveform modes and domain in dimensionless units
+        domain, h, dynamics = sur._sur_dimless(x,
+            precessing_opts=self.precessing_opts, tidal_opts=tidal_opts,
+            **self.dimless_opts)
+
+        return self._from_dimless(domain, h, dynamics, out)
+
+    def _evaluate_fused(self, x, tidal_opts, out=None):
+        """ Returns the same as _from_dimless for a time domain sum over
+            modes without taper, but the interpolation, the rotation to the
+            inertial frame and the sum are done in one pass by the
+            dimensionless surrogate. See
+            AlignedSpinCoOrbitalFrameSurrogate.fused_mode_sum.
+        """
+        get_out = None
+        if out is not None:
+            get_out = lambda shape: self._out_view(out, shape,
+                complex_result=not self.return_polarizations)
+
+        domain, h = self.sur._sur_dimless.fused_mode_sum(x,
+            lambda modes: self._get_mode_sum_coefs(tuple(modes)),
+            scale=self.amp_scale,
+            return_polarizations=self.return_polarizations, get_out=get_out,
+            precessing_opts=self.precessing_opts, tidal_opts=tidal_opts,
+            **self.dimless_opts)
+
+        domain = domain * self.t_scale
+        if (self.times is not None) and not np.array_equal(domain,
+                self.times):
+            raise Exception("times were given as input but returned "
+                "domain somehow does not match.")
+        return domain, h, None
+
+    def _from_dimless(self, domain, h, dynamics, out=None):
+        """ Returns the final domain, h, dynamics from the dimensionless
+            domain and modes: tapers, sums over modes, Fourier transforms
+            and rescales to physical units as needed.
+        """
+        sur = self.sur
+
+        # taper the last portion of the waveform, regardless of whether or not
+        # this corresponds to inspiral, merger, or ringdown.
+        if self.taper_end_duration is not None:
+            with _profiling.stage('taper'):
+                h_tapered = {}
+                for mode, hlm in h.items():
+                    # NOTE: we use a roll on window [domain[0]-100,
+                    # domain[0]-50] to trick the window function into not
+                    # tapering the beginning of h
+                    h_tapered[mode] = _gwutils.windowWaveform(domain, hlm, \
+                        domain[0]-100, domain[0]-50, \
+                        domain[-1] - self.taper_end_duration, domain[-1], \
+                        windowType="planck")
+
+            h = h_tapered
+
+        # Scaling of the waveform to physical units. Frequency domain
+        # waveforms need an extra factor of t_scale.
+        amp_scale = self.amp_scale
+        if self.fourier_plan is not None:
+            amp_scale *= self.t_scale
+            num_taper = _fourier.taper_length(h[(2,2)])
+
+        # sum over modes to get complex strain if inclination is given. The
+        # rescaling is done in the sum, and time domain waveforms are
+        # written directly to out.
+        out_written = False
+        if self.inclination is not None:
+            direct = (out is not None) and (self.fourier_plan is None)
+            h_out = None
+            if direct and not self.return_polarizations:
+                h_out = self._out_view(out, (len(domain),))
+            h = self._mode_sum(h, scale=amp_scale, out=h_out)
+            amp_scale = 1.
+
+            # h = hplus - i hcross
+            if self.return_polarizations:
+                if direct:
+                    h_pol = self._out_view(out, (2, len(domain)),
+                        complex_result=False)
+                    h_pol[0] = h.real
+                    np.negative(h.imag, out=h_pol[1])
+                    h = h_pol
+                else:
+                    h = np.array([h.real, -h.imag])
+            out_written = direct
+
+        if self.fourier_plan is not None:
+            # Frequency domain waveform, the domain is already in physical
+            # units
+            h = sur._fourier_transform(self.fourier_plan, domain, h,
+                num_taper, self._fourier_index)
+            if self.freqs is not None:
+                domain = self.freqs.copy()
+            else:
+                domain = self.fourier_plan.freqs / self.t_scale
+        else:
+            # Rescale domain to physical units. This is not done in place,
+            # as the domain can be the plan's own timesM/freqsM.
+            if sur._domain_type == 'Time':
+                domain = domain * self.t_scale
+            elif sur._domain_type == 'Frequency':
+                domain = domain / self.t_scale
+            else:
+                raise Exception('Invalid _domain_type.')
+
+        # Assuming times/freqs were specified, so they must be the same
+        # when returning
+        if (self.times is not None):
+            if not np.array_equal(domain, self.times):
+                raise Exception("times were given as input but returned "
+                    "domain somehow does not match.")
+        if (self.freqs is not None):
+            if not np.array_equal(domain, self.freqs):
+                raise Exception("freqs were given as input but returned "
+                    "domain somehow does not match.")
+
+        # Rescale waveform to physical units
+        if (out is not None) and not out_written:
+            h = self._write_out(h, out, amp_scale)
+        elif amp_scale != 1:
+            if type(h) == dict:
+                h.update((x, y*amp_scale) for x, y in h.items())
+            else:
+                h *= amp_scale
+
+        return domain, h, dynamics
+
+    def iter_chunks(self, q, chiA0, chiB0, chunk_samples=2**20,
+            tidal_opts=None):
+        """
+    Evaluates the surrogate in chunks of time samples. See
+    SurrogateEvaluator.iter_chunks for the arguments and return values.
+        """
+        sur = self.sur
+        if sur._domain_type != 'Time' or self.fourier_plan is not None:
+            raise ValueError("iter_chunks is only supported for time domain "
+                "waveforms.")
+        if chunk_samples < 1:
+            raise ValueError("chunk_samples should be positive.")
+
+        chiA0 = np.array(chiA0)
+        chiB0 = np.array(chiB0)
+        if not self.skip_param_checks:
+            sur._check_params(q, chiA0, chiB0, self.precessing_opts,
+                tidal_opts, self.par_dict)
+
+        x = sur._get_intrinsic_parameters(q, chiA0, chiB0,
+            self.precessing_opts, tidal_opts, self.par_dict)
+
+        # The sparse data is evaluated here, so that errors are raised now
+        # rather than when the first chunk is requested
+        t_start, t_end, chunks = sur._sur_dimless.call_chunked(x,
+            chunk_samples, precessing_opts=self.precessing_opts,
+            tidal_opts=tidal_opts, **self.dimless_opts)
+        return self._scaled_chunks(t_start, t_end, chunks)
+
+    def _scaled_chunks(self, t_start, t_end, chunks):
+        """ Applies the taper, sum over modes and rescaling of _evaluate to
+            each (domain, h) chunk in dimensionless units. t_start and t_end
+            are the first and last times of the full waveform, which are
+            needed for the taper.
+        """
+        for domain, h in chunks:
+            if self.taper_end_duration is not None:
+                # The window is evaluated pointwise, so this is the same as
+                # tapering the full waveform, see _evaluate
+                with _profiling.stage('taper'):
+                    h = dict((mode, _gwutils.windowWaveform(domain, hlm,
+                        t_start-100, t_start-50,
+                        t_end - self.taper_end_duration, t_end,
+                        windowType="planck")) for mode, hlm in h.items())
+
+            if self.inclination is not None:
+                h = self._mode_sum(h, scale=self.amp_scale)
+                if self.return_polarizations:
+                    h = np.array([h.real, -h.imag])
+            elif self.amp_scale != 1:
+                h.update((x, y*self.amp_scale) for x, y in h.items())
+
+            yield domain * self.t_scale, h
+
+
+
+class MassRescaler(object):
+    """
+    Produces waveforms in physical units for many total masses and distances
+    from a single evaluation of the surrogate fits, for fixed intrinsic
+    parameters q, chiA0, chiB0. Construct this with
+    SurrogateEvaluator.rescaler.
+
+    The fits and empirical interpolants are evaluated once, on the sparse
+    surrogate domain, in dimensionless units. Each call then only does the
+    transformation to the inertial frame and the interpolation onto the
+    requested time samples, which depend on M through f_low and dt.
+    """
+
+    def __init__(self, sur, q, chiA0, chiB0, mode_list=None, ellMax=None,
+            precessing_opts=None, tidal_opts=None, par_dict=None,
+            skip_param_checks=False):
+        """ See SurrogateEvaluator.rescaler for the arguments. """
+        if not hasattr(sur._sur_dimless, 'sparse_data'):
+            raise NotImplementedError("Mass rescaling is not supported for "
+                "%s."%sur.name)
+
+        chiA0 = np.array(chiA0)
+        chiB0 = np.array(chiB0)
+        if not skip_param_checks:
+            sur._check_params(q, chiA0, chiB0, precessing_opts, tidal_opts,
+                par_dict)
+
+        self.sur = sur
+        self.mode_list = mode_list
+        self.ellMax = ellMax
+        self.precessing_opts = precessing_opts
+        self.par_dict = par_dict
+        self.skip_param_checks = skip_param_checks
+
+        x = sur._get_intrinsic_parameters(q, chiA0, chiB0, precessing_opts,
+            tidal_opts, par_dict)
+        self._sparse = sur._sur_dimless.sparse_data(x, mode_list=mode_list,
+            ellMax=ellMax)
+
+    def __call__(self, M, dist_mpc, f_low=None, f_ref=None, dt=None,
+            df=None, times=None, freqs=None, inclination=None, phi_ref=0,
+            taper_end_duration=None, return_polarizations=False, out=None):
+        """
+    Returns domain, h, dynamics in mks units for total mass M (in solar
+    masses) and distance dist_mpc (in megaparsecs). The other arguments are
+    the same as for SurrogateEvaluator.__call__, with f_low, f_ref, df and
+    freqs in Hz, and dt and times in seconds. The result is the same as
+    sur(q, chiA0, chiB0, M=M, dist_mpc=dist_mpc, units='mks', **kwargs).
+        """
+        plan = EvaluationPlan(self.sur, M=M, dist_mpc=dist_mpc, f_low=f_low,
+            f_ref=f_ref, dt=dt, df=df, times=times, freqs=freqs,
+            mode_list=self.mode_list, ellMax=self.ellMax,
+            inclination=inclination, phi_ref=phi_ref,
+            precessing_opts=self.precessing_opts, par_dict=self.par_dict,
+            units='mks', skip_param_checks=self.skip_param_checks,
+            taper_end_duration=taper_end_duration,
+            return_polarizations=return_polarizations)
+
+        domain, h, dynamics = self.sur._sur_dimless.call_sparse(self._sparse,
+            precessing_opts=self.precessing_opts, **plan.dimless_opts)
+        return plan._from_dimless(domain, h, dynamics, out)
+
+
 class SurrogateEvaluator(object):
     """
     Class to load and evaluate generic surrogate models.
@@ -1386,6 +1901,10 @@ class SurrogateEvaluator(object):
         self.soft_param_lims = soft_param_lims
         self.hard_param_lims = hard_param_lims
 
+        # Caches of evaluations in memory and on disk, see enable_cache
+        self._cache = None
+        self._disk_cache = None
+
         print('Loaded %s model'%self.name)
 
 
@@ -1447,6 +1966,7 @@ class SurrogateEvaluator(object):
                 self.keywords[key] = default_keywords[key]
 
 
+    @_profiling.timed('param_checks')
     def _check_params(self, q, chiA0, chiB0, precessing_opts, tidal_opts,
             par_dict):
         """ Checks that the parameters are valid.
@@ -1456,18 +1976,23 @@ class SurrogateEvaluator(object):
             If these are None, skips the checks.
 
             Also some sanity checks for precessing and tidal models.
+
+            q, chiA0 and chiB0 can also be arrays with shapes (N,), (N, 3)
+            and (N, 3), in which case all N parameters are checked at once.
         """
         ## Allow violations within this value.
         # Sometimes, chi can be 1+1e-16 due to machine precision limitations,
         # this will ignore such cases
         grace = 1e-14
 
-        chiAmag = np.linalg.norm(chiA0)
-        chiBmag = np.linalg.norm(chiB0)
+        chiAmag = np.max(np.linalg.norm(chiA0, axis=-1))
+        chiBmag = np.max(np.linalg.norm(chiB0, axis=-1))
+        qMin_given = np.min(q)
+        qMax_given = np.max(q)
 
         if not self.keywords['Precessing']:
-            if (np.linalg.norm(chiA0[:2]) > grace
-                    or np.linalg.norm(chiB0[:2]) > grace):
+            if (np.max(np.linalg.norm(chiA0[..., :2], axis=-1)) > grace
+                    or np.max(np.linalg.norm(chiB0[..., :2], axis=-1)) > grace):
                 raise Exception('Got precessing spins for a nonprecessing '
                     'model')
 
@@ -1491,9 +2016,11 @@ class SurrogateEvaluator(object):
         if self.hard_param_lims is not None:
             qMax = self.hard_param_lims[0]
             chiMax = self.hard_param_lims[1]
-            if q > qMax + grace or q < 0.99:
+            if qMax_given > qMax + grace or qMin_given < 0.99:
+                q_bad = qMax_given if qMax_given > qMax + grace \
+                    else qMin_given
                 raise Exception('Mass ratio q=%.4f is outside allowed '
-                    'range: 1<=q<=%.4f'%(q, qMax))
+                    'range: 1<=q<=%.4f'%(q_bad, qMax))
             if chiAmag > chiMax + grace:
                 raise Exception('Spin magnitude of BhA=%.4f is outside '
                     'allowed range: chi<=%.4f'%(chiAmag, chiMax))
@@ -1504,9 +2031,9 @@ class SurrogateEvaluator(object):
         if self.soft_param_lims is not None:
             qMax = self.soft_param_lims[0]
             chiMax = self.soft_param_lims[1]
-            if q > qMax:
+            if qMax_given > qMax:
                 warnings.warn('Mass ratio q=%.4f is outside training '
-                    'range: 1<=q<=%.4f'%(q, qMax))
+                    'range: 1<=q<=%.4f'%(qMax_given, qMax))
             if chiAmag > chiMax:
                 warnings.warn('Spin magnitude of BhA=%.4f is outside '
                     'training range: chi<=%.4f'%(chiAmag, chiMax))
@@ -1516,22 +2043,123 @@ class SurrogateEvaluator(object):
 
 
 
+    def _check_evaluation_opts(self, M, dist_mpc, f_low, f_ref, dt, df,
+            times, freqs, mode_list, ellMax, units, taper_end_duration):
+        """ Sanity checks for the arguments of __call__ that do not depend on
+            the binary parameters. See __call__ for the arguments.
+        """
+        if (M is None) ^ (dist_mpc is None):
+            raise ValueError("Either specify both M and dist_mpc, or "
+                    "neither")
+
+        if (M is not None) ^ (units == 'mks'):
+            raise ValueError("M/dist_mpc must be specified if and only if"
+                " units='mks'")
+
+        if (dt is not None) and (self._domain_type != 'Time'):
+            raise ValueError("%s is not a Time domain model, cannot "
+                    "specify dt"%self.name)
+
+        if (times is not None) and (self._domain_type != 'Time'):
+            raise ValueError("%s is not a Time domain model, cannot "
+                    "specify times"%self.name)
+
+        # Time domain models give frequency domain waveforms through an
+        # FFT of the waveform sampled with time step dt
+        if ((df is not None) or (freqs is not None)) \
+                and (self._domain_type == 'Time'):
+            if times is not None:
+                raise ValueError("Cannot specify times with df/freqs, use "
+                    "dt.")
+            if dt is None:
+                raise ValueError("%s is a Time domain model, dt must be "
+                    "specified with df/freqs"%self.name)
+
+        if (dt is not None) and (times is not None):
+            raise ValueError("Cannot specify both dt and times.")
+
+        if (df is not None) and (freqs is not None):
+            raise ValueError("Cannot specify both df and freqs.")
+
+        if (f_low is None):
+            raise ValueError("f_low must be specified.")
+
+        if (f_ref is not None) and (f_ref < f_low):
+            raise ValueError("f_ref cannot be lower than f_low.")
+
+        if (mode_list is not None) and (ellMax is not None):
+            raise ValueError("Cannot specify both mode_list and ellMax.")
+
+        if (mode_list is not None) and self.keywords['Precessing']:
+            raise ValueError("mode_list is not allowed for precessing "
+                    "models, use ellMax instead.")
+
+        if (taper_end_duration is not None) and self._domain_type !='Time':
+            raise ValueError("%s is not a Time domain model, cannot taper")
+
+
+    def _get_unit_scalings(self, units, M, dist_mpc):
+        """ Returns amp_scale, t_scale, the scalings from dimensionless units
+            to the requested units for the waveform amplitude and time.
+        """
+        if units == 'dimensionless':
+            amp_scale = 1.0
+            t_scale = 1.0
+        elif units == 'mks':
+            amp_scale = \
+                M*_gwtools.Msuninsec*_gwtools.c/(1e6*dist_mpc*_gwtools.PC_SI)
+            t_scale = _gwtools.Msuninsec * M
+        else:
+            raise Exception('Invalid units')
+        return amp_scale, t_scale
+
+
+    def _get_fourier_plan(self, dimless_opts):
+        """ For a time domain model with dfM or freqsM in dimless_opts,
+            returns the FourierPlan used to get the frequency domain waveform
+            from the time domain waveform, and the indices of freqsM in its
+            output (None if freqsM is not given). dfM and freqsM are then set
+            to None in dimless_opts. Returns None, None otherwise.
+        """
+        dfM = dimless_opts['dfM']
+        freqsM = dimless_opts['freqsM']
+        if self._domain_type != 'Time' or (dfM is None and freqsM is None):
+            return None, None
+
+        index = None
+        if freqsM is not None:
+            if len(freqsM) < 2:
+                raise ValueError("Expected at least two freqs.")
+            # freqs are on a grid with spacing df
+            dfM = np.min(np.diff(np.unique(freqsM)))
+        fourier_plan = _fourier.get_plan(dimless_opts['dtM'], dfM)
+        if freqsM is not None:
+            index = fourier_plan.select(freqsM)
+
+        dimless_opts['dfM'] = None
+        dimless_opts['freqsM'] = None
+        return fourier_plan, index
+
+
+    def _fourier_transform(self, fourier_plan, domain, h, num_taper, index):
+        """ Fourier transforms h (a dict of modes or an array, with time as
+            the last axis) sampled at the uniformly spaced times domain.
+            The first num_taper samples are tapered. See fourier.FourierPlan.
+        """
+        if type(h) == dict:
+            return dict((mode, fourier_plan(domain[0], h_mode, num_taper,
+                index)) for mode, h_mode in h.items())
+        return fourier_plan(domain[0], h, num_taper, index)
+
+
     def _mode_sum(self, h_modes, theta, phi, fake_neg_modes=False):
         """ Sums over h_modes at a given theta, phi.
             If fake_neg_modes = True, deduces m<0 modes from m>0 modes.
             If fake_neg_modes = True, m<0 modes should not be in h_modes.
         """
-        h = 0.
-        for (ell, m), h_mode in h_modes.items(): # inefficient in py2
-            h += _sYlm(-2, ell, m, theta, phi) * h_mode
-            if fake_neg_modes:
-                if m > 0:
-                    h += _sYlm(-2, ell, -m, theta, phi) \
-                        * (-1)**ell * h_mode.conjugate()
-                elif m < 0:
-                    # Looks like this m<0 mode exits, we should be using that.
-                    raise Exception('Expected only m>0 modes.')
-        return h
+        coefs, coefs_neg = self._mode_sum_coefs(list(h_modes.keys()), theta,
+            phi, fake_neg_modes=fake_neg_modes)
+        return _harmonics.mode_sum(list(h_modes.values()), coefs, coefs_neg)
 
 
     def __call__(self, q, chiA0, chiB0, M=None, dist_mpc=None, f_low=None,
@@ -1539,7 +2167,7 @@ class SurrogateEvaluator(object):
         mode_list=None, ellMax=None, inclination=None, phi_ref=0,
         precessing_opts=None, tidal_opts=None, par_dict=None,
         units='dimensionless', skip_param_checks=False,
-        taper_end_duration=None):
+        taper_end_duration=None, return_polarizations=False, out=None):
         """
     INPUT
     =====
@@ -1584,7 +2212,8 @@ class SurrogateEvaluator(object):
 
                 WARNING: Using f_low=0 with a small dt (like 0.1M) can lead to
                 very expensive evaluation for hybridized surrogates like
-                NRHybSur3dq8.
+                NRHybSur3dq8. If the waveform does not fit in memory, use
+                iter_chunks.
 
     f_ref:      Frequency used to set the reference epoch at which the
                 reference frame is defined and the spins are specified.
@@ -1607,6 +2236,17 @@ class SurrogateEvaluator(object):
                 should be in seconds (Hertz) if units = 'mks'. Do not specify
                 times/freqs if using dt/df.
 
+                Time domain models can also return a frequency domain
+                waveform, if both dt and df (or freqs) are given. The time
+                domain waveform, sampled with step dt, is tapered over the
+                first 2 cycles of the (2,2) mode, zero-padded to N = 1/(df dt)
+                samples, which must be an integer, and Fourier transformed.
+                The returned frequencies are k*df, with -N/2 <= k < N/2, as
+                the waveform is complex. The waveform duration must be at
+                most 1/df. The Fourier transform follows the convention
+                htilde(f) = int h(t) exp(-2 pi i f t) dt, which is in units
+                of M if units = 'dimensionless', and seconds if units = 'mks'.
+                See gwsurrogate.fourier.
 
     times, freqs:
                 Array of time/frequency samples at which to evaluate the
@@ -1615,6 +2255,8 @@ class SurrogateEvaluator(object):
                 M (cycles/M) if units = 'dimensionless', should be in
                 seconds (Hertz) if units = 'mks'. Do not specify dt/df if
                 using times/freqs. Default None.
+                For time domain models freqs requires dt, and must be integer
+                multiples of their smallest spacing df, see dt, df above.
 
     ellMax:     Maximum ell index for modes to include. All available m
                 indicies for each ell will be included automatically.
@@ -1709,6 +2351,24 @@ class SurrogateEvaluator(object):
                 When set to None, no taper is applied
                 Default: None.
 
+    return_polarizations:
+                If True, h is returned as an array [hplus, hcross] with shape
+                (2, len(domain)) instead of the complex strain. For time
+                domain waveforms this is real. Requires inclination.
+                Default: False.
+
+    out:        A preallocated array into which h is written, to avoid
+                allocating new arrays for each evaluation. Its shape must
+                be (len(domain),) if inclination is given, (2, len(domain))
+                if return_polarizations is True, and (num_modes,
+                len(domain)) otherwise. The last axis can be longer than
+                len(domain), in which case only its first len(domain)
+                samples are used. out must be complex, except for time
+                domain polarizations. The returned h is then a view of out,
+                or for modes a dictionary of views of the rows of out, in
+                the same order as the modes returned without out.
+                Default: None.
+
     RETURNS
     =====
 
@@ -1734,6 +2394,9 @@ class SurrogateEvaluator(object):
                     deduced from the m>0 modes. To see if a model is precessing
                     check self.keywords.
 
+                    If return_polarizations is True, the array
+                    [hplus, hcross] at the same point.
+
                     Else, h is a dictionary of available modes with (l, m)
                     tuples as keys. For example, h22 = h[(2,2)].
 
@@ -1773,149 +2436,599 @@ class SurrogateEvaluator(object):
         diagram.
         """
 
-        chiA0 = np.array(chiA0)
-        chiB0 = np.array(chiB0)
+        plan = self.make_plan(M=M, dist_mpc=dist_mpc, f_low=f_low,
+            f_ref=f_ref, dt=dt, df=df, times=times, freqs=freqs,
+            mode_list=mode_list, ellMax=ellMax, inclination=inclination,
+            phi_ref=phi_ref, precessing_opts=precessing_opts,
+            par_dict=par_dict, units=units,
+            skip_param_checks=skip_param_checks,
+            taper_end_duration=taper_end_duration,
+            return_polarizations=return_polarizations)
+        return plan(q, chiA0, chiB0, tidal_opts=tidal_opts, out=out)
 
-        # Sanity checks
-        if not skip_param_checks:
 
-            if (M is None) ^ (dist_mpc is None):
-                raise ValueError("Either specify both M and dist_mpc, or "
-                        "neither")
+    def close(self):
+        """ Closes the hdf5 file kept open when the model is loaded with
+            lazy=True. Data that has not been read yet can no longer be used.
+        """
+        if hasattr(self._sur_dimless, 'close'):
+            self._sur_dimless.close()
+
+
+    def enable_dense_basis_cache(self, max_entries=4, max_bytes=None):
+        """
+    Caches the empirical interpolation bases interpolated onto the uniform
+    time grids used with dt, so that repeated evaluations with the same
+    time step do not build splines. The grids are in units of M, so with
+    units='mks' they are shared by evaluations with the same dt and M. This
+    helps most when the time step does not change and f_low=0, or the
+    waveforms start at the same time. Each cached grid
+    holds one array of the waveform length per empirical node, so this can
+    take a lot of memory for small dt.
+
+    INPUT
+    =====
+    max_entries:    Maximum number of cached time grids. None for no limit.
+                    Default: 4.
+
+    max_bytes:      Maximum total size in bytes of the cached bases. None
+                    for no limit. Default: None.
+
+    Only supported for NRHybSur3dq8. Use disable_dense_basis_cache to remove
+    the cache.
+        """
+        if not hasattr(self._sur_dimless, 'enable_dense_basis_cache'):
+            raise ValueError('The dense basis cache is not supported for'
+                ' %s.'%self.name)
+        self._sur_dimless.enable_dense_basis_cache(max_entries=max_entries,
+            max_bytes=max_bytes)
+
+
+    def disable_dense_basis_cache(self):
+        """ Removes the cache added by enable_dense_basis_cache. """
+        if hasattr(self._sur_dimless, 'disable_dense_basis_cache'):
+            self._sur_dimless.disable_dense_basis_cache()
+
+
+    def enable_cache(self, max_entries=128, max_bytes=None,
+            param_decimals=None, directory=None, max_disk_bytes=None,
+            mmap=True):
+        """
+    Caches the results of evaluations, so that evaluating the same binary
+    with the same options again returns the earlier result. This applies to
+    __call__ and to plans from make_plan.
+
+    Results are cached in memory, and optionally also in a directory.
+    The directory can be shared by many processes and jobs, for example
+    on a shared filesystem of a cluster. Its entries are only used by
+    models with identical h5 files.
+
+    INPUT
+    =====
+    max_entries:    Maximum number of evaluations cached in memory. None for
+                    no limit. 0 to only cache on disk. Default: 128.
+
+    max_bytes:      Maximum total size in bytes of the waveforms cached in
+                    memory. None for no limit. Default: None.
+
+    param_decimals: If not None, q, chiA0, chiB0 and the tidal parameters
+                    are rounded to this many decimals before evaluation, so
+                    binaries that agree after rounding share a cache entry.
+                    Default: None.
+
+    directory:      Directory for the disk cache. Default: None, in which
+                    case results are only cached in memory.
+
+    max_disk_bytes: Maximum total size in bytes of the disk cache. The least
+                    recently used entries are removed when this is exceeded.
+                    None for no limit. Default: None.
+
+    mmap:           If True, results from the disk cache are read-only
+                    memory maps of the cached files. Default: True.
+
+    Replaces any existing caches. Use cache_stats for the hit/miss
+    statistics and disable_cache to remove the caches.
+        """
+        if max_entries == 0:
+            if directory is None:
+                raise ValueError("max_entries=0 requires a directory.")
+            memory_cache = None
+        else:
+            memory_cache = _cache.WaveformCache(max_entries=max_entries,
+                max_bytes=max_bytes, param_decimals=param_decimals)
+
+        if directory is None:
+            disk_cache = None
+        else:
+            # Identify the model by the contents of its data file
+            h5filename = getattr(self, 'h5filename', None)
+            if h5filename is None:
+                model_hash = self.name
+            else:
+                model_hash = '%s-%s'%(self.name, _cache.file_md5(h5filename))
+            disk_cache = _cache.DiskWaveformCache(directory, model_hash,
+                max_bytes=max_disk_bytes, mmap=mmap,
+                param_decimals=param_decimals)
+
+        self._cache = memory_cache
+        self._disk_cache = disk_cache
+
+
+    def disable_cache(self):
+        """ Removes the caches added by enable_cache. Files in the disk
+            cache are kept.
+        """
+        self._cache = None
+        self._disk_cache = None
+
+
+    def cache_stats(self):
+        """ Returns a dict with the hits, misses, evictions, entries and
+            nbytes of the memory cache. If there is a disk cache, the same
+            statistics for it are under the key 'disk'. Returns None if
+            there are no caches.
+        """
+        if self._cache is None and self._disk_cache is None:
+            return None
+        stats = {}
+        if self._cache is not None:
+            stats.update(self._cache.stats())
+        if self._disk_cache is not None:
+            stats['disk'] = self._disk_cache.stats()
+        return stats
+
+
+    def make_plan(self, M=None, dist_mpc=None, f_low=None, f_ref=None,
+        dt=None, df=None, times=None, freqs=None, mode_list=None,
+        ellMax=None, inclination=None, phi_ref=0, precessing_opts=None,
+        par_dict=None, units='dimensionless', skip_param_checks=False,
+        taper_end_duration=None, return_polarizations=False):
+        """
+    Returns an EvaluationPlan, a callable that evaluates the surrogate with
+    fixed evaluation options. Use this when evaluating many binaries with
+    the same options, for example in parameter estimation:
+
+        >>> plan = sur.make_plan(f_low=20, dt=1./4096, M=60, dist_mpc=100,
+        ...     units='mks', inclination=0.4)
+        >>> t, h, dyn = plan(q, chiA0, chiB0)
+
+    The options are validated and converted to dimensionless units once,
+    when the plan is made, rather than on every evaluation.
+
+    INPUT
+    =====
+    All arguments are the same as for __call__.
+
+    RETURNS
+    =====
+    plan:       An EvaluationPlan. plan(q, chiA0, chiB0, tidal_opts=None,
+                out=None) returns the same domain, h, dynamics as
+                self(q, chiA0, chiB0, tidal_opts=tidal_opts, out=out,
+                **kwargs), where kwargs are the arguments given to make_plan.
+        """
+        return EvaluationPlan(self, M=M, dist_mpc=dist_mpc, f_low=f_low,
+            f_ref=f_ref, dt=dt, df=df, times=times, freqs=freqs,
+            mode_list=mode_list, ellMax=ellMax, inclination=inclination,
+            phi_ref=phi_ref, precessing_opts=precessing_opts,
+            par_dict=par_dict, units=units,
+            skip_param_checks=skip_param_checks,
+            taper_end_duration=taper_end_duration,
+            return_polarizations=return_polarizations)
+
+
+    def iter_chunks(self, q, chiA0, chiB0, chunk_samples=2**20,
+            tidal_opts=None, **kwargs):
+        """
+    Evaluates the surrogate in contiguous chunks of time samples, for time
+    domain waveforms that are too long to be held in memory at once, such as
+    with f_low=0 and a small dt:
 
-            if (M is not None) ^ (units == 'mks'):
-                raise ValueError("M/dist_mpc must be specified if and only if"
-                    " units='mks'")
+        >>> for t, h in sur.iter_chunks(q, chiA0, chiB0, f_low=0, dt=0.1,
+        ...         inclination=0.4, chunk_samples=2**16):
+        ...     write(t, h)
 
-            if (dt is not None) and (self._domain_type != 'Time'):
-                raise ValueError("%s is not a Time domain model, cannot "
-                        "specify dt"%self.name)
+    Only the sparse surrogate data and the current chunk are held in memory.
+    Concatenating the chunks gives the same domain and h as __call__.
 
-            if (times is not None) and (self._domain_type != 'Time'):
-                raise ValueError("%s is not a Time domain model, cannot "
-                        "specify times"%self.name)
+    INPUT
+    =====
+    q, chiA0, chiB0, tidal_opts: The same as for __call__.
+    chunk_samples:  Maximum number of time samples in each chunk.
+                    Default: 2**20.
+    kwargs:         Evaluation options, the same as for make_plan. df, freqs
+                    and out are not supported, and neither is
+                    precessing_opts['return_dynamics'].
 
-            if (df is not None) and (self._domain_type != 'Frequency'):
-                raise ValueError("%s is not a Frequency domain model, cannot"
-                    " specify df"%self.name)
+    RETURNS
+    =====
+    A generator of (domain, h) tuples, where domain and h are contiguous
+    pieces of the domain and h returned by __call__, in order.
 
-            if (freqs is not None) and (self._domain_type != 'Frequency'):
-                raise ValueError("%s is not a Frequency domain model, cannot"
-                    " specify freqs"%self.name)
+    Chunked evaluation is not supported for NRHybSur3dq8Tidal.
+        """
+        return self.make_plan(**kwargs).iter_chunks(q, chiA0, chiB0,
+            chunk_samples=chunk_samples, tidal_opts=tidal_opts)
 
-            if (dt is not None) and (times is not None):
-                raise ValueError("Cannot specify both dt and times.")
 
-            if (df is not None) and (freqs is not None):
-                raise ValueError("Cannot specify both df and freqs.")
+    def rescaler(self, q, chiA0, chiB0, mode_list=None, ellMax=None,
+            precessing_opts=None, tidal_opts=None, par_dict=None,
+            skip_param_checks=False):
+        """
+    Returns a MassRescaler, a callable that gives waveforms in mks units for
+    many total masses and distances, with the surrogate fits evaluated only
+    once for these q, chiA0, chiB0. Use this for scans over the total mass:
 
-            if (f_low is None):
-                raise ValueError("f_low must be specified.")
+        >>> resc = sur.rescaler(q, chiA0, chiB0)
+        >>> for M in masses:
+        ...     t, h, dyn = resc(M, 100, f_low=20, dt=1./4096,
+        ...         inclination=0.4)
 
-            if (f_ref is not None) and (f_ref < f_low):
-                raise ValueError("f_ref cannot be lower than f_low.")
+    resc(M, dist_mpc, **kwargs) returns the same as
+    self(q, chiA0, chiB0, M=M, dist_mpc=dist_mpc, units='mks', **kwargs).
 
-            if (mode_list is not None) and (ellMax is not None):
-                raise ValueError("Cannot specify both mode_list and ellMax.")
+    Only supported for the aligned-spin models, as the dynamics of
+    precessing models depend on f_low and f_ref.
 
-            if (mode_list is not None) and self.keywords['Precessing']:
-                raise ValueError("mode_list is not allowed for precessing "
-                        "models, use ellMax instead.")
+    INPUT
+    =====
+    All arguments are the same as for __call__.
 
-            if (taper_end_duration is not None) and self._domain_type !='Time':
-                raise ValueError("%s is not a Time domain model, cannot taper")
+    RETURNS
+    =====
+    resc:       A MassRescaler.
+        """
+        return MassRescaler(self, q, chiA0, chiB0, mode_list=mode_list,
+            ellMax=ellMax, precessing_opts=precessing_opts,
+            tidal_opts=tidal_opts, par_dict=par_dict,
+            skip_param_checks=skip_param_checks)
+
+
+    def map(self, param_iterable, workers=None, chunksize=1, max_threads=1,
+            mp_context=None, **kwargs):
+        """
+    Evaluates the surrogate for many binaries using a pool of worker
+    processes. Each worker loads the model from self.h5filename once, when
+    it starts.
+
+    INPUT
+    =====
+    param_iterable: An iterable of parameters. Each element is either a
+                (q, chiA0, chiB0) tuple, or a dictionary of keyword arguments
+                for __call__ that includes q, chiA0 and chiB0.
+
+    workers:    Number of worker processes. Default: None, in which case
+                the number of CPUs is used.
+
+    chunksize:  Number of evaluations sent to a worker at once. Larger
+                values reduce the communication overhead for large
+                param_iterables. Default: 1.
+
+    max_threads: Maximum number of BLAS/OpenMP threads in each worker. Set
+                to None to not limit the threads. Default: 1, which avoids
+                oversubscribing the CPUs when each worker uses
+                multithreaded numpy operations. The limit is set with
+                threadpoolctl, without it there is no limit and a warning
+                is issued.
+
+    mp_context: A multiprocessing context for the workers, for example
+                multiprocessing.get_context('spawn'). Default: None, in
+                which case the default start method is used.
+
+    kwargs:     Keyword arguments for __call__ shared by all evaluations,
+                for example f_low, dt or units. Keys given in an element of
+                param_iterable take precedence.
+
+    RETURNS
+    =====
+    A list with one (domain, h, dynamics) tuple per element of
+    param_iterable, in the same order. See __call__.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        tasks = []
+        for params in param_iterable:
+            if type(params) == dict:
+                task_kwargs = dict(kwargs)
+                task_kwargs.update(params)
+                tasks.append(((), task_kwargs))
+            else:
+                tasks.append((tuple(params), kwargs))
+
+        if (max_threads is not None) and (_threadpoolctl is None):
+            warnings.warn('threadpoolctl is not installed, so the threads of '
+                'the workers are not limited to max_threads.')
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                initializer=_map_worker_init,
+                initargs=(self.__class__, self.h5filename,
+                    self._load_kwargs, max_threads)) as executor:
+            return list(executor.map(_map_worker_eval, tasks,
+                chunksize=chunksize))
+
+
+    def _mode_sum_coefs(self, modes, theta, phi, fake_neg_modes=False):
+        """ Returns coefs, coefs_neg such that the sum over modes at a given
+            theta, phi is coefs.dot(h) + coefs_neg.dot(h.conjugate()), where
+            h is an array of modes ordered as in modes. See _mode_sum.
+            theta and phi can also be 1d arrays, in which case coefs and
+            coefs_neg have shape (len(modes), len(theta)).
+        """
+        return _harmonics.mode_sum_coefs(modes, theta, phi,
+            fake_neg_modes=fake_neg_modes)
+
+
+    def project_modes(self, h, inclination, phi_ref=0,
+            return_polarizations=False):
+        """
+    Sums over the modes h, as returned by __call__ when inclination is None,
+    for many orientations at once:
+
+        >>> t, h_modes, _ = sur(q, chiA0, chiB0, f_low=20, dt=1./4096, M=60,
+        ...     dist_mpc=100, units='mks')
+        >>> h = sur.project_modes(h_modes, inclinations, phi_refs)
+
+    The modes are evaluated only once, and the sum over modes for all
+    orientations is a single matrix product. h[i] is the same as the h
+    returned by __call__ with inclination=inclinations[i] and
+    phi_ref=phi_refs[i].
+
+    INPUT
+    =====
+    h :         Dictionary of waveform modes with (ell, m) keys, as returned
+                by __call__ or evaluate_batch with inclination=None.
+    inclination, phi_ref:
+                Arrays of inclination angles and orbital phases, see
+                __call__. These are broadcast against each other, so either
+                can be a float. Default phi_ref: 0.
+    return_polarizations:
+                If True, return hplus and hcross instead of
+                h = hplus - i hcross. Default: False.
+
+    RETURNS
+    =====
+    An array with shape (N, len(domain)), where N is the number of
+    orientations, or (N, 2, len(domain)) if return_polarizations is True.
+        """
+        inclination, phi_ref = np.broadcast_arrays(
+            np.atleast_1d(inclination), np.atleast_1d(phi_ref))
+        if inclination.ndim != 1:
+            raise ValueError("Expected inclination and phi_ref to be floats "
+                "or 1d arrays.")
+        if type(h) != dict:
+            raise ValueError("Expected a dict of modes, as returned with "
+                "inclination=None.")
+
+        modes = tuple(h.keys())
+        fake_neg_modes = not self.keywords['Precessing']
+
+        # (N, num_modes) matrices of sYlm coefficients, see _mode_sum_coefs
+        coefs, coefs_neg = self._mode_sum_coefs(modes, inclination,
+            np.pi/2 - phi_ref, fake_neg_modes=fake_neg_modes)
+        coefs = coefs.T
+        coefs_neg = coefs_neg.T
+
+        # complex64 for single precision models
+        dtype = np.result_type(np.complex64, *[h[mode].dtype
+                                               for mode in modes])
+        with _profiling.stage('mode_sum'):
+            h_modes = np.array([h[mode] for mode in modes], dtype=dtype)
+            res = coefs.astype(dtype).dot(h_modes)
+
+            # Only the modes with m>0 contribute through their conjugates
+            has_neg = np.any(coefs_neg != 0, axis=0)
+            if np.any(has_neg):
+                res += coefs_neg[:, has_neg].astype(dtype).dot(
+                    h_modes[has_neg].conjugate())
+
+        # h = hplus - i hcross
+        if return_polarizations:
+            return np.stack([res.real, -res.imag], axis=1)
+        return res
+
+
+    def evaluate_batch(self, q, chiA0, chiB0, M=None, dist_mpc=None,
+        f_low=None, f_ref=None, dt=None, df=None, times=None, freqs=None,
+        mode_list=None, ellMax=None, inclination=None, phi_ref=0,
+        precessing_opts=None, tidal_opts=None, par_dict=None,
+        units='dimensionless', skip_param_checks=False,
+        taper_end_duration=None):
+        """
+    Evaluates the surrogate for N binaries at once.
+
+    Parameter checks and unit conversions are done once for the whole
+    batch. If the dimensionless surrogate supports batch evaluation (as for
+    NRHybSur3dq8), the fits and empirical interpolant products are evaluated
+    for all N binaries together, otherwise the dimensionless surrogate is
+    evaluated once per binary.
+
+    INPUT
+    =====
+    q :         Array of N mass ratios, mA/mB >= 1.
+    chiA0, chiB0:
+                Arrays of dimensionless spin vectors with shape (N, 3), see
+                __call__ for conventions.
+
+    tidal_opts: Same as for __call__, but the values of Lambda1 and Lambda2
+                can also be arrays of length N.
+
+    All other arguments are the same as for __call__, and are shared by all
+    N binaries.
+
+    RETURNS
+    =====
+
+    domain, h, modes, dynamics
+
+    domain :    If all N waveforms share the same domain, a single array of
+                time/frequency samples. Else a list of N such arrays. This
+                is always a single array if times/freqs are given, and for
+                time domain models with f_low = 0.
+
+    h :         If all N waveforms share the same domain, an array with
+                shape (N, len(modes), len(domain)), or shape (N, len(domain))
+                if inclination is given.
+                Else a list of N arrays with shape (len(modes),
+                len(domain[i])), or (len(domain[i]),) if inclination is given.
+
+    modes :     List of (ell, m) tuples labelling the modes axis of h. For
+                nonprecessing models this includes only the m>=0 modes, the
+                m<0 modes can be deduced from these.
+                None if inclination is given.
+
+    dynamics:   A list of N dynamics, each as returned by __call__.
+        """
+
+        q = np.atleast_1d(np.asarray(q, dtype=float))
+        chiA0 = np.atleast_2d(np.asarray(chiA0, dtype=float))
+        chiB0 = np.atleast_2d(np.asarray(chiB0, dtype=float))
+        num = len(q)
+        if q.ndim != 1 or chiA0.shape != (num, 3) or chiB0.shape != (num, 3):
+            raise ValueError("Expected q with shape (N,) and chiA0, chiB0 "
+                "with shape (N, 3).")
+
+        # Sanity checks, done once for all N binaries
+        if not skip_param_checks:
+
+            self._check_evaluation_opts(M, dist_mpc, f_low, f_ref, dt, df,
+                times, freqs, mode_list, ellMax, units, taper_end_duration)
 
             # more sanity checks including extrapolation checks
             self._check_params(q, chiA0, chiB0, precessing_opts, tidal_opts,
                     par_dict)
 
+        def get_tidal_opts(i):
+            if tidal_opts is None:
+                return None
+            return {k: (v[i] if np.ndim(v) > 0 else v)
+                    for k, v in tidal_opts.items()}
 
-        x = self._get_intrinsic_parameters(q, chiA0, chiB0, precessing_opts,
-            tidal_opts, par_dict)
-
+        xs = [self._get_intrinsic_parameters(q[i], chiA0[i], chiB0[i],
+            precessing_opts, get_tidal_opts(i), par_dict) for i in range(num)]
 
         # Get scalings from dimensionless units to mks units
-        if units == 'dimensionless':
-            amp_scale = 1.0
-            t_scale = 1.0
-        elif units == 'mks':
-            amp_scale = \
-                M*_gwtools.Msuninsec*_gwtools.c/(1e6*dist_mpc*_gwtools.PC_SI)
-            t_scale = _gwtools.Msuninsec * M
-        else:
-            raise Exception('Invalid units')
+        amp_scale, t_scale = self._get_unit_scalings(units, M, dist_mpc)
 
         # If f_ref is not given, we set it to f_low.
         if f_ref is None:
             f_ref = f_low
 
-        # Get dimensionless step size or times/freqs and reference time/freq
-        dtM = None if dt is None else dt/t_scale
-        timesM = None if times is None else times/t_scale
-        dfM = None if df is None else df*t_scale
-        freqsM = None if freqs is None else freqs*t_scale
-
+        dimless_opts = dict(
+            fM_low=f_low*t_scale,
+            fM_ref=f_ref*t_scale,
+            dtM=None if dt is None else dt/t_scale,
+            timesM=None if times is None else times/t_scale,
+            dfM=None if df is None else df*t_scale,
+            freqsM=None if freqs is None else freqs*t_scale,
+            mode_list=mode_list,
+            ellMax=ellMax,
+            par_dict=par_dict,
+            )
+
+        # Frequency domain waveforms from a time domain model
+        fourier_plan, fourier_index = self._get_fourier_plan(dimless_opts)
 
         # Get waveform modes and domain in dimensionless units
-        fM_low = f_low*t_scale
-        fM_ref = f_ref*t_scale
-        domain, h, dynamics = self._sur_dimless(x, fM_low=fM_low,
-            fM_ref=fM_ref, dtM=dtM, timesM=timesM, dfM=dfM,
-            freqsM=freqsM, mode_list=mode_list, ellMax=ellMax,
-            precessing_opts=precessing_opts, tidal_opts=tidal_opts,
-            par_dict=par_dict)
+        if hasattr(self._sur_dimless, 'batch_call'):
+            res = self._sur_dimless.batch_call(np.array(xs),
+                precessing_opts=precessing_opts, tidal_opts=tidal_opts,
+                **dimless_opts)
+        else:
+            res = []
+            for i in range(num):
+                # The dimensionless surrogate may modify precessing_opts
+                opts_i = None if precessing_opts is None \
+                    else dict(precessing_opts)
+                res.append(self._sur_dimless(xs[i], precessing_opts=opts_i,
+                    tidal_opts=get_tidal_opts(i), **dimless_opts))
+
+        domains = [r[0] for r in res]
+        dynamics = [r[2] for r in res]
+        modes = list(res[0][1].keys())
+        shared_domain = all(np.array_equal(d, domains[0]) for d in domains)
+
+        # Stack the modes, so that the rest is done with array operations
+        if shared_domain:
+            domains = domains[:1]
+            h = [np.array([[r[1][mode] for mode in modes] for r in res])]
+        else:
+            h = [np.array([r[1][mode] for mode in modes]) for r in res]
 
-        # taper the last portion of the waveform, regardless of whether or not
-        # this corresponds to inspiral, merger, or ringdown.
+        # taper the last portion of the waveform, see __call__
         if taper_end_duration is not None:
-            h_tapered = {}
-            for mode, hlm in h.items():
-                # NOTE: we use a roll on window [domain[0]-100, domain[0]-50]
-                # to trick the window function into not tapering the beginning
-                # of h
-                h_tapered[mode] = _gwutils.windowWaveform(domain, hlm, \
-                    domain[0]-100, domain[0]-50, \
-                    domain[-1] - taper_end_duration, domain[-1], \
+            for i, domain in enumerate(domains):
+                window = _gwutils.windowWaveform(domain,
+                    np.ones(len(domain)), domain[0]-100, domain[0]-50,
+                    domain[-1] - taper_end_duration, domain[-1],
                     windowType="planck")
-
-            h = h_tapered
+                h[i] = h[i] * window
+
+        if fourier_plan is not None:
+            # Number of samples to taper at the start of each waveform
+            idx22 = modes.index((2,2))
+            if shared_domain:
+                num_taper = [_fourier.taper_length(h22)
+                             for h22 in h[0][:, idx22]]
+            else:
+                num_taper = [_fourier.taper_length(hi[idx22]) for hi in h]
 
         # sum over modes to get complex strain if inclination is given
         if inclination is not None:
             # For nonprecessing systems get the m<0 modes from the m>0 modes.
             fake_neg_modes = not self.keywords['Precessing']
 
-            # Follows the LAL convention (see help text)
-            h = self._mode_sum(h, inclination, np.pi/2 - phi_ref,
-                    fake_neg_modes=fake_neg_modes)
-
-        # Rescale domain to physical units
-        if self._domain_type == 'Time':
-            domain *= t_scale
-        elif self._domain_type == 'Frequency':
-            domain /= t_scale
+            # Follows the LAL convention (see help text of __call__)
+            coefs, coefs_neg = self._mode_sum_coefs(modes, inclination,
+                np.pi/2 - phi_ref, fake_neg_modes=fake_neg_modes)
+            # complex64 for single precision models
+            dtype = np.result_type(np.complex64, h[0].dtype)
+            coefs = coefs.astype(dtype, copy=False)
+            coefs_neg = coefs_neg.astype(dtype, copy=False)
+            for i in range(len(h)):
+                hsum = np.tensordot(coefs, h[i], axes=(0, -2))
+                if fake_neg_modes:
+                    hsum += np.tensordot(coefs_neg.conjugate(), h[i],
+                        axes=(0, -2)).conjugate()
+                h[i] = hsum
+            modes = None
+
+        if fourier_plan is not None:
+            # Frequency domain waveforms, which all share the same domain
+            if shared_domain:
+                h = [np.array([fourier_plan(domains[0][0], h[0][i],
+                    num_taper[i], fourier_index) for i in range(num)])]
+            else:
+                h = [np.array([fourier_plan(domain[0], hi, num_taper[i],
+                    fourier_index) for i, (domain, hi)
+                    in enumerate(zip(domains, h))])]
+                shared_domain = True
+            if freqs is not None:
+                domains = [np.array(freqs)]
+            else:
+                domains = [fourier_plan.freqs / t_scale]
+            amp_scale = amp_scale * t_scale
         else:
-            raise Exception('Invalid _domain_type.')
+            # Rescale domain to physical units
+            if self._domain_type == 'Time':
+                domains = [domain * t_scale for domain in domains]
+            elif self._domain_type == 'Frequency':
+                domains = [domain / t_scale for domain in domains]
+            else:
+                raise Exception('Invalid _domain_type.')
 
-        # Assuming times/freqs were specified, so they must be the same
-        # when returning
-        if (times is not None):
-            if not np.array_equal(domain, times):
-                raise Exception("times were given as input but returned "
-                    "domain somehow does not match.")
-        if (freqs is not None):
-            if not np.array_equal(domain, freqs):
-                raise Exception("freqs were given as input but returned "
-                    "domain somehow does not match.")
+        if (times is not None) and not np.array_equal(domains[0], times):
+            raise Exception("times were given as input but returned "
+                "domain somehow does not match.")
+        if (freqs is not None) and not np.array_equal(domains[0], freqs):
+            raise Exception("freqs were given as input but returned "
+                "domain somehow does not match.")
 
         # Rescale waveform to physical units
         if amp_scale != 1:
-            if type(h) == dict:
-                h.update((x, y*amp_scale) for x, y in h.items())
-            else:
-                h *= amp_scale
+            h = [hi * amp_scale for hi in h]
 
-        return domain, h, dynamics
+        if shared_domain:
+            return domains[0], h[0], modes, dynamics
+        return domains, h, modes, dynamics
 
 
 
@@ -1948,8 +3061,12 @@ See the __call__ method on how to evaluate waveforms.
 In the __call__ method, x must have format x = [q, chi1z, chi2z].
     """
 
-    def __init__(self, h5filename):
+    def __init__(self, h5filename, mode_list=None, ellMax=None, lazy=False,
+            dtype=np.float64):
+        """ See LoadSurrogate for mode_list, ellMax, lazy and dtype. """
         self.h5filename = h5filename
+        self._load_kwargs = {'mode_list': mode_list, 'ellMax': ellMax,
+                             'lazy': lazy, 'dtype': dtype}
         domain_type = 'Time'
         keywords = {
             'Precessing': False,
@@ -1976,7 +3093,7 @@ In the __call__ method, x must have format x = [q, chi1z, chi2z].
         passed to self._sur_dimless() in the __call__ function of this class.
         """
         sur = new_surrogate.AlignedSpinCoOrbitalFrameSurrogate()
-        sur.load(self.h5filename)
+        sur.load(self.h5filename, **self._load_kwargs)
         return sur
 
     def _get_intrinsic_parameters(self, q, chiA0, chiB0, precessing_opts,
@@ -2026,8 +3143,12 @@ See the __call__ method on how to evaluate waveforms.
 In the __call__ method, x must have format x = [q, chi1z, chi2z].
     """
 
-    def __init__(self, h5filename):
+    def __init__(self, h5filename, mode_list=None, ellMax=None, lazy=False,
+            dtype=np.float64):
+        """ See LoadSurrogate for mode_list, ellMax, lazy and dtype. """
         self.h5filename = h5filename
+        self._load_kwargs = {'mode_list': mode_list, 'ellMax': ellMax,
+                             'lazy': lazy, 'dtype': dtype}
         domain_type = 'Time'
         keywords = {
             'Tidal': True,
@@ -2054,7 +3175,7 @@ In the __call__ method, x must have format x = [q, chi1z, chi2z].
         passed to self._sur_dimless() in the __call__ function of this class.
         """
         sur = new_surrogate.AlignedSpinCoOrbitalFrameSurrogateTidal()
-        sur.load(self.h5filename)
+        sur.load(self.h5filename, **self._load_kwargs)
         return sur
 
     def _get_intrinsic_parameters(self, q, chiA0, chiB0, precessing_opts,
@@ -2105,8 +3226,15 @@ See the __call__ method on how to evaluate waveforms.
 In the __call__ method, x must have format x = [q, chi1, chi2].
     """
 
-    def __init__(self, h5filename):
+    def __init__(self, h5filename, mode_list=None, ellMax=None, lazy=False,
+            dtype=np.float64):
+        """ See LoadSurrogate for mode_list, ellMax, lazy and dtype. """
+        if mode_list is not None:
+            raise ValueError("mode_list is not allowed for precessing "
+                    "models, use ellMax instead.")
         self.h5filename = h5filename
+        self._load_kwargs = {'mode_list': mode_list, 'ellMax': ellMax,
+                             'lazy': lazy, 'dtype': dtype}
         domain_type = 'Time'
         keywords = {
             'Precessing': True,
@@ -2132,7 +3260,10 @@ In the __call__ method, x must have format x = [q, chi1, chi2].
         passed to self._sur_dimless() in the __call__ function of this class.
         See NRHybSur3dq8 for an example.
         """
-        sur = precessing_surrogate.PrecessingSurrogate(self.h5filename)
+        sur = precessing_surrogate.PrecessingSurrogate(self.h5filename,
+            ellMax=self._load_kwargs['ellMax'],
+            lazy=self._load_kwargs['lazy'],
+            dtype=self._load_kwargs['dtype'])
         return sur
 
     def _get_intrinsic_parameters(self, q, chiA0, chiB0, precessing_opts,
@@ -2158,6 +3289,52 @@ SURROGATE_CLASSES = {
 #    "SpEC_q1_10_NoSpin_nu5thDegPoly_exclude_2_0.h5":EvaluateSurrogate # model SpEC_q1_10_NoSpin
         }
 
+#### Models loaded by LoadSurrogate, so that loading the same model file again
+#### in the same process returns the same object instead of a new copy.
+#### Entries are weak references, a model is freed as usual once nothing else
+#### refers to it. Keys are (surrogate_name, path, mtime, size, mode_list,
+#### ellMax, dtype), see _registry_key.
+_loaded_surrogates = weakref.WeakValueDictionary()
+_loaded_surrogates_lock = threading.Lock()
+
+def _registry_key(surrogate_name, h5filename, mode_list, ellMax, dtype):
+    """ Key of a loaded model in _loaded_surrogates. A modified or replaced
+    model file gives a different key. """
+    path = os.path.realpath(h5filename)
+    st = os.stat(path)
+    if mode_list is not None:
+        mode_list = tuple(sorted(tuple(mode) for mode in mode_list))
+    return (surrogate_name, path, st.st_mtime, st.st_size, mode_list, ellMax,
+            np.finfo(dtype).dtype.name)
+
+def release(name=None):
+    """ Removes models from the registry used by LoadSurrogate, so that the
+    next LoadSurrogate call reads the model from disk again.
+
+    INPUT
+    =====
+    name: Surrogate name (e.g. 'NRSur7dq4') or path to the hdf5 file of the
+          models to release. Default: None, in which case all models are
+          released.
+
+    OUTPUT
+    ======
+    The number of released models.
+
+    The memory used by a model is freed once there are no references left
+    to the object returned by LoadSurrogate. """
+    if name is not None and name.endswith('.h5'):
+        path = os.path.realpath(name)
+        match = lambda key: key[1] == path
+    else:
+        match = lambda key: name is None or key[0] == name
+    with _loaded_surrogates_lock:
+        keys = [key for key in list(_loaded_surrogates.keys()) if match(key)]
+        for key in keys:
+            _loaded_surrogates.pop(key, None)
+    return len(keys)
+
+
 # TODO: would this be better off as a function as opposed to a class?
 class LoadSurrogate(object):
     """
@@ -2167,7 +3344,9 @@ class LoadSurrogate(object):
     """
 
     #NOTE: __init__ is never called for LoadSurrogate
-    def __new__(self, surrogate_name, surrogate_name_spliced=None):
+    def __new__(self, surrogate_name, surrogate_name_spliced=None,
+            mode_list=None, ellMax=None, lazy=False, reuse=True,
+            dtype=np.float64):
         """ Returns a SurrogateEvaluator derived object based on name.
 
         INPUT
@@ -2193,7 +3372,38 @@ class LoadSurrogate(object):
                                 If you wish to load a spliced model from its h5
                                 file, provide (i) the hdf5 file path as its
                                 surrogate name and (ii) the model name (e.g.
-                                NRHybSur3dq8Tidal) as SURROGATE_NAME_SPLICED."""
+                                NRHybSur3dq8Tidal) as SURROGATE_NAME_SPLICED.
+
+        MODE_LIST: A list of (ell, m) modes to load. Only these modes (and
+                   the (2,2) mode, which is always loaded) can be evaluated,
+                   and the loading time and memory use are reduced. Not
+                   allowed for precessing models, use ELLMAX instead.
+                   Default: None, in which case all modes are loaded.
+
+        ELLMAX: Load only the modes with ell <= ELLMAX. At most one of
+                MODE_LIST and ELLMAX can be specified. Default: None.
+
+        LAZY: If True, the data for each mode (or each ell for precessing
+              models) is read from the hdf5 file when it is first evaluated,
+              instead of when loading. The hdf5 file is kept open until
+              close() is called on the returned object. Default: False.
+
+        REUSE: If True, and the same model file (same path, modification
+               time and size) was already loaded in this process with the
+               same MODE_LIST and ELLMAX, the already loaded object is
+               returned. Note that this object, including any cache enabled
+               with enable_cache, is then shared. Models loaded with
+               LAZY=True are never shared, as their file is closed by their
+               owner. Use gwsurrogate.release to load a model from disk
+               again. Default: True.
+
+        DTYPE: np.float64 or np.float32. With np.float32 (or np.complex64)
+               the model data is stored, and waveforms are evaluated and
+               returned, in single precision: the waveform is complex64. The
+               phases used to rotate to the inertial frame, and the
+               precessing dynamics, are still computed in double precision.
+               This halves the memory used by long waveforms and large
+               batches. Default: np.float64."""
 
 
         # the "output" of this if-block is surrogate_h5file and surrogate_name
@@ -2231,6 +3441,24 @@ class LoadSurrogate(object):
 
         if surrogate_name not in SURROGATE_CLASSES.keys():
             raise Exception('Invalid surrogate : %s'%surrogate_name)
-        else:
-            return SURROGATE_CLASSES[surrogate_name](surrogate_h5file)
+
+        reuse = reuse and not lazy
+        if reuse:
+            key = _registry_key(surrogate_name, surrogate_h5file, mode_list,
+                ellMax, dtype)
+            with _loaded_surrogates_lock:
+                sur = _loaded_surrogates.get(key)
+            if sur is not None:
+                return sur
+
+        # Not loaded under the lock, so that different models can be loaded
+        # concurrently
+        sur = SURROGATE_CLASSES[surrogate_name](surrogate_h5file,
+            mode_list=mode_list, ellMax=ellMax, lazy=lazy, dtype=dtype)
+
+        if reuse:
+            with _loaded_surrogates_lock:
+                # Another thread may have loaded the same model meanwhile
+                sur = _loaded_surrogates.setdefault(key, sur)
+        return sur
 
@@ -0,0 +1,460 @@
+""" Synthetic surrogate models for tests and benchmarks.
+
+Writes small hdf5 files that have the same structure as the NRHybSur3dq8 and
+NRSur7dq4 model files, and can be loaded in the same way:
+
+    >>> from gwsurrogate import synthetic
+    >>> synthetic.write_NRHybSur3dq8('/tmp/models/NRHybSur3dq8.h5')
+    >>> sur = gws.LoadSurrogate('/tmp/models/NRHybSur3dq8.h5')
+
+The file name determines the model class used by LoadSurrogate, so it should
+be the model name. The fits and bases are filled with random data, chosen
+such that the waveforms are smooth and well behaved: the EI bases are hat
+functions, so that each node is the value of the data piece at its node
+time, and the fits give small random variations about a chirp-like
+reference waveform. The waveforms are not physical, but all evaluation
+options (f_low, f_ref, dt, times, inclination, ...) work as for the real
+models, so these can be used for tests of the evaluation code and for
+performance and scaling tests without downloading the models.
+
+The sizes of the models are configurable. num_times is the length of the
+sparse time domain, and num_nodes the number of empirical nodes of each data
+piece. The arguments of the writer are stored as a json string in the
+'synthetic_params' attribute of the file, see read_params. The writers do
+not overwrite existing files unless overwrite=True, while write_models
+rewrites the files whose parameters differ.
+
+NRHybSur3dq8 files are written through AlignedSpinCoOrbitalFrameSurrogate.save,
+with NRHybSur3dq8Fit GPR node functions. Evaluating these fits needs the
+eval_pysur package, like the real model. The GPR fit data has the format
+written by pySurrogate:
+    fitType:        'GPR'
+    data_mean, data_std:
+                    The fit is data_mean + data_std*(GPR prediction), plus
+                    the linear fit, if lin_reg_params is not None.
+    lin_reg_params: Dict with the fitted LinearRegression attributes 'coef_'
+                    and 'intercept_' of a linear fit, or None.
+    GPR_params:     Dict with the fitted GaussianProcessRegressor attributes
+                    'kernel_', 'X_train_', 'alpha_', 'L_' and
+                    '_y_train_mean'. 'kernel_' is a dict with the 'name' of
+                    the kernel and its hyperparameters, and the sub kernels
+                    'k1' and 'k2' for 'Sum' and 'Product' kernels.
+
+NRSur7dq4 files have the t_ds and ds_node_%d groups of the dynamics
+surrogate, and the t_coorb and hCoorb_%d_%d_* groups of the coorbital
+waveform surrogate, with polynomial fits in the fit parameters. """
+
+from __future__ import division # for python 2
+
+
+__copyright__ = "Copyright (C) 2014 Scott Field and Chad Galley"
+__email__     = "sfield@umassd.edu, crgalley@tapir.caltech.edu"
+__status__    = "testing"
+__author__    = "Jonathan Blackman, Scott Field, Chad Galley, Vijay Varma, Kevin Barkett"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import inspect
+import json
+import os
+
+import h5py
+import numpy as np
+
+# The time after the peak at which the 0PN TaylorT3 phase diverges. The
+# reference waveform uses the same phase as the TaylorT3 term of
+# AlignedSpinCoOrbitalFrameSurrogate.
+_TAYLORT3_T_REF = 1000.
+
+# The attribute of the written files that holds the writer arguments
+_PARAMS_ATTR = 'synthetic_params'
+
+# Modes of the models
+NRHybSur3dq8_MODES = [(2,2), (2,1), (2,0), (3,3), (3,2), (3,1), (3,0),
+                      (4,4), (4,3), (4,2), (5,5)]
+NRSur7dq4_ELLMAX = 4
+
+
+def _reference_phase_22(t, eta=0.25):
+    """ The 0PN TaylorT3 phase of the (2, 2) mode """
+    return -2.*((_TAYLORT3_T_REF - t)/5.)**(5./8)/eta**(3./8)
+
+
+def _reference_omega_22(t, eta=0.25):
+    """ The time derivative of _reference_phase_22 """
+    return 0.25*((_TAYLORT3_T_REF - t)/5.)**(-3./8)/eta**(3./8)
+
+
+def _reference_amp_22(t):
+    """ A chirp-like amplitude, with a peak at t=0 """
+    inspiral = 0.4*(1. + np.abs(t)/30.)**(-1./4)
+    ringdown = 0.4*np.exp(-(t/15.)**2)
+    return np.where(t <= 0, inspiral, ringdown)
+
+
+def _hat_basis(domain, node_indices):
+    """ Returns an EI basis with shape (len(node_indices), len(domain)) of
+    hat functions, such that nodes.dot(basis) linearly interpolates the node
+    values given at domain[node_indices]. """
+    t_nodes = domain[node_indices]
+    basis = np.zeros((len(node_indices), len(domain)))
+    for i in range(len(node_indices)):
+        unit = np.zeros(len(node_indices))
+        unit[i] = 1.
+        basis[i] = np.interp(domain, t_nodes, unit)
+    return basis
+
+
+def _node_indices(domain, num_nodes):
+    """ Returns num_nodes indices spread over the domain, including the
+    first and last index and the index of the peak at t=0 """
+    num_times = len(domain)
+    if num_nodes < 3 or num_nodes > num_times:
+        raise ValueError('Expected 3 <= num_nodes <= num_times, got '
+            'num_nodes=%s, num_times=%s'%(num_nodes, num_times))
+    indices = np.round(np.linspace(0, num_times - 1, num_nodes - 1))
+    indices = np.append(indices, np.argmin(np.abs(domain)))
+    return np.unique(indices.astype(int))
+
+
+def _sparse_domain(t_start, t_end, num_times):
+    """ Returns a time domain that is denser near t_end """
+    u = np.linspace(0, 1, num_times)
+    return t_end - (t_end - t_start)*(1 - u)**2
+
+
+#############################################################################
+# NRHybSur3dq8
+
+def _gpr_fit_data(rng, mean, std, num_train, dim=3):
+    """ Returns GPR fit data in the pySurrogate format, see the module
+    docstring, with random training points in [-1, 1]^dim and small random
+    alpha, such that the fit is mean + O(std) over the parameter space. """
+    length_scale = rng.uniform(0.5, 2., dim)
+    kernel = {
+        'name': 'Sum',
+        'k1': {
+            'name': 'Product',
+            'k1': {'name': 'ConstantKernel',
+                   'constant_value': 1.,
+                   'constant_value_bounds': (1e-3, 1e3)},
+            'k2': {'name': 'RBF',
+                   'length_scale': length_scale,
+                   'length_scale_bounds': (1e-2, 1e2)},
+            },
+        'k2': {'name': 'WhiteKernel',
+               'noise_level': 1e-6,
+               'noise_level_bounds': (1e-10, 1e-2)},
+        }
+
+    X_train = rng.uniform(-1, 1, (num_train, dim))
+    scaled = X_train/length_scale
+    sq_dist = np.sum((scaled[:, None, :] - scaled[None, :, :])**2, axis=-1)
+    K = np.exp(-0.5*sq_dist) + 1e-6*np.eye(num_train)
+    # The kernel values are at most 1, so the GPR prediction, which is the
+    # product of the kernel values and alpha, is O(1)
+    alpha = rng.randn(num_train)/np.sqrt(num_train)
+
+    return {
+        'fitType': 'GPR',
+        'data_mean': float(mean),
+        'data_std': float(std),
+        'lin_reg_params': {'coef_': std*rng.randn(dim),
+                           'intercept_': 0.},
+        'GPR_params': {
+            'kernel_': kernel,
+            'X_train_': X_train,
+            'alpha_': alpha,
+            'L_': np.linalg.cholesky(K),
+            '_y_train_mean': 0.,
+            },
+        }
+
+
+def _gpr_component(rng, name, reference, node_indices, domain, rel_std,
+                   abs_std, num_train):
+    """ Returns the (ei_basis, node_functions) of a data piece whose nodes
+    vary about reference[node_indices] """
+    from .new.nodeFunction import NodeFunction, NRHybSur3dq8Fit
+
+    node_functions = []
+    for i, idx in enumerate(node_indices):
+        mean = reference[idx]
+        std = rel_std*abs(mean) + abs_std
+        # Set the data directly, NRHybSur3dq8Fit(fit_data=...) would set up
+        # the fit evaluator, which is only needed for evaluating
+        fit = NRHybSur3dq8Fit()
+        fit.name = '%s_node_%s'%(name, i)
+        fit.fit_data = _gpr_fit_data(rng, mean, std, num_train)
+        node_functions.append(NodeFunction(fit.name, fit))
+    return _hat_basis(domain, node_indices), node_functions
+
+
+def _params_string(writer, filename, **kwargs):
+    """ Returns the arguments of writer(filename, **kwargs), except filename
+    and overwrite, with the defaults filled in, as stored in the file. """
+    params = inspect.getcallargs(writer, filename, **kwargs)
+    params.pop('filename')
+    params.pop('overwrite')
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def read_params(filename):
+    """ Returns the json string of the writer arguments stored in a
+    synthetic model file, or None if the file does not exist or has no
+    such string. """
+    if not os.path.exists(filename):
+        return None
+    with h5py.File(filename, 'r') as f:
+        params = f.attrs.get(_PARAMS_ATTR)
+    if isinstance(params, bytes):
+        params = params.decode()
+    return params
+
+
+def _check_overwrite(filename, overwrite):
+    """ Removes filename if overwrite is True, else raises an Exception if
+    it exists. """
+    if os.path.exists(filename):
+        if not overwrite:
+            raise Exception("Will not overwrite %s"%(filename))
+        os.remove(filename)
+
+
+def write_NRHybSur3dq8(filename, num_times=2000, num_nodes=20, num_train=30,
+                       modes=None, t_start=-20000., t_end=100., seed=0,
+                       overwrite=False):
+    """
+    Writes a synthetic model with the structure of NRHybSur3dq8 to filename,
+    see the module docstring. This file can also be loaded as
+    NRHybSur3dq8Tidal, see LoadSurrogate.
+
+    num_times:  Length of the sparse time domain [t_start, t_end].
+    num_nodes:  Number of empirical nodes of each data piece.
+    num_train:  Number of GPR training points of each node fit.
+    modes:      List of (ell, m) modes, which must include (2, 2).
+                Default: None, in which case the modes of NRHybSur3dq8 are
+                used.
+    seed:       Seed of the random data.
+    overwrite:  If True, an existing file is replaced, else an Exception
+                is raised. Default: False.
+    """
+    from .new.surrogate import AlignedSpinCoOrbitalFrameSurrogate, \
+        ParamDim, ParamSpace
+
+    params = _params_string(write_NRHybSur3dq8, filename,
+        num_times=num_times, num_nodes=num_nodes, num_train=num_train,
+        modes=modes, t_start=t_start, t_end=t_end, seed=seed)
+
+    if modes is None:
+        modes = NRHybSur3dq8_MODES
+    modes = [tuple(mode) for mode in modes]
+    if (2, 2) not in modes:
+        raise ValueError('modes must include the (2, 2) mode.')
+    if t_end <= 0 or t_start >= 0:
+        raise ValueError('The peak, t=0, must lie in [t_start, t_end].')
+    _check_overwrite(filename, overwrite)
+
+    rng = np.random.RandomState(seed)
+    domain = _sparse_domain(t_start, t_end, num_times)
+    node_indices = _node_indices(domain, num_nodes)
+    amp_22 = _reference_amp_22(domain)
+
+    coorb_mode_data = {}
+    for mode in modes:
+        name = '%s_%s'%mode
+        if mode == (2, 2):
+            # The phase is the residual after removing the TaylorT3 phase
+            coorb_mode_data[mode] = {
+                'amp': _gpr_component(rng, name + '_amp', amp_22,
+                    node_indices, domain, 0.02, 0., num_train),
+                'phase': _gpr_component(rng, name + '_phase',
+                    np.zeros(num_times), node_indices, domain, 0., 0.01,
+                    num_train),
+                }
+        else:
+            ell, m = mode
+            scale = 0.3**(ell - 2 + abs(2 - m))
+            coorb_mode_data[mode] = {
+                're': _gpr_component(rng, name + '_re', scale*amp_22,
+                    node_indices, domain, 0.05, 0., num_train),
+                'im': _gpr_component(rng, name + '_im', 0.1*scale*amp_22,
+                    node_indices, domain, 0.05, 0., num_train),
+                }
+
+    # The fits are done in [np.log(q), chiHat, chi_a], but the parameter
+    # space is in [q, chi1z, chi2z]
+    param_space = ParamSpace('NRHybSur3dq8', [
+        ParamDim('mass ratio', 0.98, 10.01),
+        ParamDim('chi1z', -1., 1.),
+        ParamDim('chi2z', -1., 1.),
+        ])
+    phaseAlignIdx = int(np.argmin(np.abs(domain - t_start/2.)))
+
+    sur = AlignedSpinCoOrbitalFrameSurrogate('NRHybSur3dq8', domain,
+        param_space, phaseAlignIdx=phaseAlignIdx,
+        TaylorT3_t_ref=_TAYLORT3_T_REF, coorb_mode_data=coorb_mode_data)
+    sur.save(filename)
+    with h5py.File(filename, 'a') as f:
+        f.attrs[_PARAMS_ATTR] = params
+
+
+#############################################################################
+# NRSur7dq4
+
+# See precessing_surrogate._get_fit_settings
+_Q_MAX_BFORDER = 3
+_CHI_MAX_BFORDER = 2
+
+
+def _poly_fit(rng, value, scale, num_coefs):
+    """ Returns a polynomial fit in the format of precessing_surrogate, with
+    value as the constant term and num_coefs-1 random terms of size scale.
+    The fit parameters lie in [-1, 1], so the fit is value + O(scale). """
+    bf_orders = [np.zeros(7, dtype=np.int64)]
+    seen = set([tuple(bf_orders[0])])
+    while len(bf_orders) < num_coefs:
+        orders = np.append(rng.randint(0, _Q_MAX_BFORDER + 1),
+                           rng.randint(0, _CHI_MAX_BFORDER + 1, 6))
+        # Keep the fits low order
+        if np.sum(orders) > 3 or tuple(orders) in seen:
+            continue
+        seen.add(tuple(orders))
+        bf_orders.append(orders.astype(np.int64))
+    coefs = np.append(value, scale*rng.randn(num_coefs - 1)/num_coefs)
+    return np.array(bf_orders, dtype=np.int64), coefs
+
+
+def _write_poly_fit(group, key, fit):
+    bf_orders, coefs = fit
+    group.create_dataset('%s_coefs'%key, data=coefs)
+    group.create_dataset('%s_bfOrders'%key, data=bf_orders)
+
+
+def _dynamics_times(t_start, t_end, num_ds):
+    """ Returns t_ds, where the first 3 steps are split into two equal half
+    steps for the initial RK4 steps, see DynamicsSurrogate. The times are
+    even integers, so that the half steps are exactly equal. """
+    tds = np.unique(2*np.round(np.linspace(t_start, t_end, num_ds)/2.))
+    halves = (tds[:3] + tds[1:4])/2.
+    return np.sort(np.append(tds, halves))
+
+
+def write_NRSur7dq4(filename, num_times=2000, num_nodes=20, num_ds=300,
+                    num_coefs=10, ellMax=None, t_start=-4300., t_end=100.,
+                    seed=0, overwrite=False):
+    """
+    Writes a synthetic model with the structure of NRSur7dq4 to filename,
+    see the module docstring.
+
+    num_times:  Length of the coorbital time domain t_coorb, in
+                [t_start, t_end].
+    num_nodes:  Number of empirical nodes of each waveform data piece.
+    num_ds:     Number of dynamics time nodes, excluding the half steps.
+    num_coefs:  Number of terms of each polynomial fit.
+    ellMax:     Maximum ell of the waveform modes. Default: None, in which
+                case 4 is used as for NRSur7dq4.
+    seed:       Seed of the random data.
+    overwrite:  If True, an existing file is replaced, else an Exception
+                is raised. Default: False.
+    """
+    params = _params_string(write_NRSur7dq4, filename, num_times=num_times,
+        num_nodes=num_nodes, num_ds=num_ds, num_coefs=num_coefs,
+        ellMax=ellMax, t_start=t_start, t_end=t_end, seed=seed)
+    if ellMax is None:
+        ellMax = NRSur7dq4_ELLMAX
+    if t_end <= 0 or t_start >= 0:
+        raise ValueError('The peak, t=0, must lie in [t_start, t_end].')
+
+    rng = np.random.RandomState(seed)
+    _check_overwrite(filename, overwrite)
+
+    with h5py.File(filename, 'w') as f:
+        f.attrs[_PARAMS_ATTR] = params
+
+        # Dynamics surrogate. The orbital frequency is half the (2, 2) mode
+        # frequency, and the precession and spin evolution are small.
+        t_ds = _dynamics_times(t_start, t_end, num_ds)
+        f.create_dataset('t_ds', data=t_ds)
+        omega = 0.5*_reference_omega_22(t_ds)
+        for i in range(len(t_ds)):
+            group = f.create_group('ds_node_%s'%i)
+            _write_poly_fit(group, 'omega',
+                _poly_fit(rng, omega[i], 0.01*omega[i], num_coefs))
+            for key, size, scale in [('omega_orb', 2, 1e-2*omega[i]),
+                                     ('chiA', 3, 1e-3*omega[i]),
+                                     ('chiB', 3, 1e-3*omega[i])]:
+                for j in range(size):
+                    _write_poly_fit(group, '%s_%d'%(key, j),
+                        _poly_fit(rng, 0., scale, num_coefs))
+
+        # Coorbital waveform surrogate
+        t_coorb = np.linspace(t_start, t_end, num_times)
+        f.create_dataset('t_coorb', data=t_coorb)
+        node_indices = _node_indices(t_coorb, num_nodes)
+        basis = _hat_basis(t_coorb, node_indices)
+        amp_22 = _reference_amp_22(t_coorb)
+
+        def write_component(name, reference):
+            group = f.create_group(name)
+            group.create_dataset('EIBasis', data=basis)
+            group.create_dataset('nodeIndices', data=node_indices)
+            modelers = group.create_group('nodeModelers')
+            for i, idx in enumerate(node_indices):
+                bf_orders, coefs = _poly_fit(rng, reference[idx],
+                    0.05*abs(reference[idx]) + 1e-4, num_coefs)
+                modelers.create_dataset('coefs_%s'%i, data=coefs)
+                modelers.create_dataset('bfOrders_%s'%i, data=bf_orders)
+
+        for ell in range(2, ellMax+1):
+            # See _assemble_mode_pair: the (ell, +-m) modes are built from
+            # the sum (+) and difference (-) of the (ell, -m) and conjugate
+            # (ell, m) modes
+            write_component('hCoorb_%s_0_real'%ell,
+                            0.05*0.3**(ell - 2)*amp_22)
+            write_component('hCoorb_%s_0_imag'%ell,
+                            0.01*0.3**(ell - 2)*amp_22)
+            for m in range(1, ell+1):
+                scale = 0.3**(ell - 2 + abs(2 - m))
+                write_component('hCoorb_%s_%s_Re+'%(ell, m), scale*amp_22)
+                write_component('hCoorb_%s_%s_Re-'%(ell, m),
+                                0.05*scale*amp_22)
+                write_component('hCoorb_%s_%s_Im+'%(ell, m),
+                                0.05*scale*amp_22)
+                write_component('hCoorb_%s_%s_Im-'%(ell, m),
+                                0.05*scale*amp_22)
+
+
+def write_models(directory, seed=0, **kwargs):
+    """ Writes synthetic NRHybSur3dq8.h5 and NRSur7dq4.h5 files with default
+    sizes to directory, and returns a dict with their paths. kwargs are
+    passed to both writers. Existing files are kept if they were written
+    with the same arguments, and are replaced otherwise. """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    paths = {}
+    for name, writer in [('NRHybSur3dq8', write_NRHybSur3dq8),
+                         ('NRSur7dq4', write_NRSur7dq4)]:
+        paths[name] = os.path.join(directory, '%s.h5'%name)
+        params = _params_string(writer, paths[name], seed=seed, **kwargs)
+        if read_params(paths[name]) != params:
+            writer(paths[name], seed=seed, overwrite=True, **kwargs)
+    return paths
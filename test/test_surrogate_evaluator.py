@@ -0,0 +1,724 @@
+"""
+Tests for the SurrogateEvaluator evaluation interfaces.
+
+These use the NRHybSur3dq8 model, which is downloaded if it is not already
+in the surrogate download path.
+"""
+
+from __future__ import division
+import os
+import numpy as np
+import pytest
+import gwsurrogate as gws
+
+rtol = 1.e-10
+
+@pytest.fixture(scope="module")
+def sur():
+  return gws.LoadSurrogate('NRHybSur3dq8')
+
+
+@pytest.fixture(scope="module")
+def synthetic_paths(tmp_path_factory):
+  """ Small synthetic models, see gwsurrogate.synthetic """
+  from gwsurrogate import synthetic
+  return synthetic.write_models(str(tmp_path_factory.mktemp('synthetic')),
+                                num_times=300, num_nodes=8)
+
+
+@pytest.fixture(scope="module")
+def synthetic_sur(synthetic_paths):
+  return gws.LoadSurrogate(synthetic_paths['NRHybSur3dq8'], reuse=False)
+
+
+def _aligned_spin_params(num, seed=0):
+  """ Returns q, chiA0, chiB0 arrays for num aligned-spin binaries """
+  rng = np.random.RandomState(seed)
+  q = rng.uniform(1, 8, num)
+  chiA0 = np.zeros((num, 3))
+  chiB0 = np.zeros((num, 3))
+  chiA0[:,2] = rng.uniform(-0.8, 0.8, num)
+  chiB0[:,2] = rng.uniform(-0.8, 0.8, num)
+  return q, chiA0, chiB0
+
+
+def test_evaluate_batch_shared_domain(sur):
+  """ With f_low=0 all waveforms share the same time array and are stacked """
+
+  q, chiA0, chiB0 = _aligned_spin_params(4)
+  t, h, modes, dyn = sur.evaluate_batch(q, chiA0, chiB0, f_low=0, dt=1.0)
+  assert h.shape == (4, len(modes), len(t))
+
+  for i in range(4):
+    t_i, h_i, _ = sur(q[i], chiA0[i], chiB0[i], f_low=0, dt=1.0)
+    np.testing.assert_array_equal(t, t_i)
+    for j, mode in enumerate(modes):
+      np.testing.assert_allclose(h[i,j], h_i[mode], rtol=rtol,
+        atol=rtol*np.max(np.abs(h_i[mode])))
+
+
+def test_evaluate_batch_ragged(sur):
+  """ With f_low > 0 the time arrays differ, and a list is returned """
+
+  q, chiA0, chiB0 = _aligned_spin_params(3, seed=1)
+  kwargs = dict(M=60, dist_mpc=100, f_low=20, dt=1./4096, inclination=0.4,
+                phi_ref=0.3, units='mks')
+  t, h, modes, dyn = sur.evaluate_batch(q, chiA0, chiB0, **kwargs)
+  assert modes is None
+  assert len(t) == len(h) == 3
+
+  for i in range(3):
+    t_i, h_i, _ = sur(q[i], chiA0[i], chiB0[i], **kwargs)
+    np.testing.assert_array_equal(t[i], t_i)
+    np.testing.assert_allclose(h[i], h_i, rtol=rtol,
+      atol=rtol*np.max(np.abs(h_i)))
+
+
+def test_map(sur):
+  """ Process pool evaluations should agree with direct evaluations, in
+  the same order """
+
+  q, chiA0, chiB0 = _aligned_spin_params(4, seed=2)
+  params = [(q[i], chiA0[i], chiB0[i]) for i in range(3)]
+  params.append({'q': q[3], 'chiA0': chiA0[3], 'chiB0': chiB0[3],
+                 'inclination': 0.2})
+  res = sur.map(params, workers=2, f_low=0, dt=1.0)
+  assert len(res) == len(params)
+
+  for i in range(3):
+    t_i, h_i, _ = sur(q[i], chiA0[i], chiB0[i], f_low=0, dt=1.0)
+    np.testing.assert_array_equal(res[i][0], t_i)
+    for mode in h_i.keys():
+      np.testing.assert_array_equal(res[i][1][mode], h_i[mode])
+
+  t_3, h_3, _ = sur(q[3], chiA0[3], chiB0[3], f_low=0, dt=1.0,
+                    inclination=0.2)
+  np.testing.assert_array_equal(res[3][1], h_3)
+
+
+def test_map_thread_limits(synthetic_sur, monkeypatch):
+  """ The threads of the workers are limited with threadpoolctl, and a
+  warning is issued without it """
+  import importlib
+  import multiprocessing
+  threadpoolctl = pytest.importorskip('threadpoolctl')
+  gws_surrogate = importlib.import_module('gwsurrogate.surrogate')
+
+  params = [(2., [0, 0, 0.5], [0, 0, -0.3]), (3., [0, 0, 0.1], [0, 0, 0.2])]
+  kwargs = dict(f_low=0, dt=0.5)
+  res = synthetic_sur.map(params, workers=2, max_threads=1,
+                          mp_context=multiprocessing.get_context('spawn'),
+                          **kwargs)
+  for (t, h, _), p in zip(res, params):
+    t_p, h_p, _ = synthetic_sur(*p, **kwargs)
+    np.testing.assert_array_equal(t, t_p)
+    for mode in h_p.keys():
+      np.testing.assert_array_equal(h[mode], h_p[mode])
+
+  # The worker initializer limits the threads, which are restored on exit
+  with threadpoolctl.threadpool_limits(limits=None):
+    gws_surrogate._map_worker_init(synthetic_sur.__class__,
+                                   synthetic_sur.h5filename,
+                                   synthetic_sur._load_kwargs, 1)
+    for info in threadpoolctl.threadpool_info():
+      assert info['num_threads'] == 1
+
+  monkeypatch.setattr(gws_surrogate, '_threadpoolctl', None)
+  with pytest.warns(UserWarning, match='threadpoolctl'):
+    synthetic_sur.map(params[:1], workers=1, **kwargs)
+
+
+def test_threaded_calls(sur):
+  """ A single instance can be evaluated from several threads at once """
+  from concurrent.futures import ThreadPoolExecutor
+
+  q, chiA0, chiB0 = _aligned_spin_params(6, seed=3)
+  kwargs = dict(f_low=0, dt=1.0, inclination=0.3)
+  expected = [sur(q[i], chiA0[i], chiB0[i], **kwargs)[1] for i in range(6)]
+
+  def evaluate(i):
+    return sur(q[i], chiA0[i], chiB0[i], **kwargs)[1]
+
+  with ThreadPoolExecutor(max_workers=3) as executor:
+    res = list(executor.map(evaluate, list(range(6))*3))
+
+  for i, h in enumerate(res):
+    np.testing.assert_array_equal(h, expected[i % 6])
+
+
+def test_make_plan(sur):
+  """ A plan should give the same result as __call__ with the same options """
+
+  q, chiA0, chiB0 = _aligned_spin_params(3, seed=4)
+  kwargs = dict(M=60, dist_mpc=100, f_low=20, dt=1./4096, inclination=0.4,
+                phi_ref=0.3, units='mks', taper_end_duration=0.01)
+  plan = sur.make_plan(**kwargs)
+
+  for i in range(3):
+    t_i, h_i, _ = sur(q[i], chiA0[i], chiB0[i], **kwargs)
+    t, h, _ = plan(q[i], chiA0[i], chiB0[i])
+    np.testing.assert_array_equal(t, t_i)
+    np.testing.assert_array_equal(h, h_i)
+
+  # Invalid options are caught when the plan is made
+  with pytest.raises(ValueError):
+    sur.make_plan(f_low=0, dt=1.0, times=np.arange(-100., 0.))
+
+
+def test_cache(sur):
+  """ Repeated evaluations are served from the cache, as copies """
+
+  q, chiA0, chiB0 = _aligned_spin_params(2, seed=5)
+  kwargs = dict(f_low=0, dt=1.0)
+  t0, h0, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+
+  sur.enable_cache(max_entries=1)
+  try:
+    t1, h1, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+    h1[(2,2)][:] = 0
+    t2, h2, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+    stats = sur.cache_stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+    np.testing.assert_array_equal(t2, t0)
+    for mode in h0.keys():
+      np.testing.assert_array_equal(h2[mode], h0[mode])
+
+    # Different options or parameters are different entries, and the
+    # oldest entry is evicted
+    sur(q[0], chiA0[0], chiB0[0], f_low=0, dt=2.0)
+    sur(q[1], chiA0[1], chiB0[1], **kwargs)
+    stats = sur.cache_stats()
+    assert stats['misses'] == 3 and stats['evictions'] == 2
+    assert stats['entries'] == 1
+  finally:
+    sur.disable_cache()
+
+
+def test_disk_cache(sur, tmp_path):
+  """ Results written to the disk cache are found by a new cache using the
+  same directory """
+
+  q, chiA0, chiB0 = _aligned_spin_params(2, seed=6)
+  kwargs = dict(f_low=0, dt=1.0, inclination=0.2)
+  directory = str(tmp_path)
+
+  try:
+    sur.enable_cache(max_entries=0, directory=directory)
+    t0, h0, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+    assert sur.cache_stats()['disk']['misses'] == 1
+
+    sur.enable_cache(max_entries=0, directory=directory)
+    t1, h1, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+    stats = sur.cache_stats()['disk']
+    assert stats['hits'] == 1 and stats['entries'] == 1
+    np.testing.assert_array_equal(t1, t0)
+    np.testing.assert_array_equal(h1, h0)
+
+    # Least recently used entries are removed to respect max_disk_bytes
+    sur.enable_cache(max_entries=0, directory=directory,
+                     max_disk_bytes=stats['nbytes'])
+    sur(q[1], chiA0[1], chiB0[1], **kwargs)
+    stats = sur.cache_stats()['disk']
+    assert stats['entries'] == 1 and stats['evictions'] == 1
+  finally:
+    sur.disable_cache()
+
+
+def test_load_selected_modes(sur):
+  """ Models loaded with only some modes, or lazily, agree with the full
+  model """
+
+  q, chiA0, chiB0 = _aligned_spin_params(1, seed=7)
+  kwargs = dict(f_low=0, dt=1.0)
+  _, h, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+
+  sur_modes = gws.LoadSurrogate('NRHybSur3dq8', mode_list=[(3,3)])
+  _, h_modes, _ = sur_modes(q[0], chiA0[0], chiB0[0], **kwargs)
+  assert sorted(h_modes.keys()) == [(2,2), (3,3)]
+  with pytest.raises(ValueError):
+    sur_modes(q[0], chiA0[0], chiB0[0], mode_list=[(2,1)], **kwargs)
+
+  sur_lazy = gws.LoadSurrogate('NRHybSur3dq8', ellMax=3, lazy=True)
+  _, h_lazy, _ = sur_lazy(q[0], chiA0[0], chiB0[0], **kwargs)
+  sur_lazy.close()
+  assert sorted(h_lazy.keys()) == sorted(k for k in h.keys() if k[0] <= 3)
+
+  for h_sel in [h_modes, h_lazy]:
+    for mode in h_sel.keys():
+      np.testing.assert_array_equal(h_sel[mode], h[mode])
+
+
+def test_load_registry(sur):
+  """ Loading the same model again returns the loaded object, until it is
+  released """
+
+  assert gws.LoadSurrogate('NRHybSur3dq8') is sur
+  assert gws.LoadSurrogate('NRHybSur3dq8', reuse=False) is not sur
+  assert gws.LoadSurrogate('NRHybSur3dq8', ellMax=3) is not sur
+
+  assert gws.release('NRHybSur3dq8') >= 1
+  sur_new = gws.LoadSurrogate('NRHybSur3dq8')
+  assert sur_new is not sur
+  assert gws.LoadSurrogate('NRHybSur3dq8') is sur_new
+
+
+def test_frequency_domain(sur):
+  """ Frequency domain waveforms agree with a direct Fourier transform of
+  the tapered time domain waveform """
+  from gwsurrogate import fourier
+
+  q, chiA0, chiB0 = _aligned_spin_params(1, seed=8)
+  kwargs = dict(M=60, dist_mpc=100, f_low=20, dt=1./2048, units='mks')
+  t, h, _ = sur(q[0], chiA0[0], chiB0[0], inclination=0.4, **kwargs)
+  _, h_modes, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+  num_taper = fourier.taper_length(h_modes[(2,2)])
+  h[:num_taper] *= fourier.planck_window(num_taper)
+
+  f, htilde, _ = sur(q[0], chiA0[0], chiB0[0], inclination=0.4, df=0.125,
+                     **kwargs)
+  assert len(f) == 2048*8
+  for i in [0, 2000, 6000, 8192, 12000]:
+    expected = np.sum(h*np.exp(-2j*np.pi*f[i]*t))*kwargs['dt']
+    np.testing.assert_allclose(htilde[i], expected, rtol=1e-8,
+      atol=1e-8*np.max(np.abs(htilde)))
+
+  # freqs select from the same frequency grid
+  freqs = np.arange(-200, -20, 0.125)
+  f_sel, h_sel, _ = sur(q[0], chiA0[0], chiB0[0], inclination=0.4,
+                        freqs=freqs, **kwargs)
+  np.testing.assert_array_equal(f_sel, freqs)
+  idx = np.round((freqs - f[0])/0.125).astype(int)
+  np.testing.assert_allclose(h_sel, htilde[idx], rtol=1e-12, atol=0)
+
+  # The waveform must fit in 1/df
+  with pytest.raises(ValueError):
+    sur(q[0], chiA0[0], chiB0[0], df=4, **kwargs)
+
+
+def test_out_and_polarizations(sur):
+  """ Results written to preallocated arrays, and polarizations, agree with
+  the usual results """
+
+  q, chiA0, chiB0 = _aligned_spin_params(1, seed=9)
+  kwargs = dict(M=60, dist_mpc=100, f_low=0, dt=1./1024, units='mks')
+  t, h, _ = sur(q[0], chiA0[0], chiB0[0], inclination=0.4, **kwargs)
+  _, h_modes, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+
+  # A buffer longer than needed can be used
+  out = np.zeros(len(t) + 10, dtype=complex)
+  _, h_out, _ = sur(q[0], chiA0[0], chiB0[0], inclination=0.4, out=out,
+                    **kwargs)
+  assert np.shares_memory(h_out, out) and len(h_out) == len(t)
+  np.testing.assert_allclose(h_out, h, rtol=1e-12, atol=0)
+
+  out = np.zeros((2, len(t)))
+  _, h_pol, _ = sur(q[0], chiA0[0], chiB0[0], inclination=0.4,
+                    return_polarizations=True, out=out, **kwargs)
+  assert h_pol.base is out
+  np.testing.assert_allclose(h_pol[0] - 1j*h_pol[1], h, rtol=1e-12, atol=0)
+
+  out = np.zeros((len(h_modes), len(t)), dtype=complex)
+  _, h_out, _ = sur(q[0], chiA0[0], chiB0[0], out=out, **kwargs)
+  assert list(h_out.keys()) == list(h_modes.keys())
+  for i, mode in enumerate(h_modes.keys()):
+    np.testing.assert_array_equal(out[i], h_modes[mode])
+
+  with pytest.raises(ValueError):
+    sur(q[0], chiA0[0], chiB0[0], inclination=0.4, out=np.zeros(len(t)),
+        **kwargs)
+  with pytest.raises(ValueError):
+    sur(q[0], chiA0[0], chiB0[0], return_polarizations=True, **kwargs)
+
+
+def test_single_precision(sur):
+  """ Single precision models give complex64 waveforms that agree with the
+  double precision waveforms to single precision accuracy """
+
+  sur32 = gws.LoadSurrogate('NRHybSur3dq8', dtype=np.float32)
+  q, chiA0, chiB0 = _aligned_spin_params(1, seed=10)
+  for inclination in [None, 0.3]:
+    kwargs = dict(f_low=0, dt=1.0, inclination=inclination)
+    _, h, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+    _, h32, _ = sur32(q[0], chiA0[0], chiB0[0], **kwargs)
+    if inclination is None:
+      pairs = [(h32[mode], h[mode]) for mode in h.keys()]
+    else:
+      pairs = [(h32, h)]
+    for h_single, h_double in pairs:
+      assert h_single.dtype == np.complex64
+      np.testing.assert_allclose(h_single, h_double, rtol=0,
+        atol=1e-5*np.max(np.abs(h_double)))
+
+
+def test_iter_chunks(sur):
+  """ Concatenated chunks agree with the full waveform. They differ at the
+  level of roundoff, as vectorized numpy functions can round differently
+  depending on the array length. """
+
+  q, chiA0, chiB0 = _aligned_spin_params(1, seed=11)
+  for kwargs in [dict(f_low=0, dt=1.0),
+                 dict(f_low=0, dt=1.0, inclination=0.4, phi_ref=0.3),
+                 dict(M=60, dist_mpc=100, f_low=20, f_ref=25, dt=1./4096,
+                      units='mks', inclination=0.4, taper_end_duration=0.01,
+                      return_polarizations=True)]:
+    t, h, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+    chunks = list(sur.iter_chunks(q[0], chiA0[0], chiB0[0],
+                                  chunk_samples=1000, **kwargs))
+    assert max(len(t_c) for t_c, _ in chunks) == 1000
+    np.testing.assert_array_equal(np.concatenate([c[0] for c in chunks]), t)
+    if type(h) == dict:
+      for mode in h.keys():
+        h_c = np.concatenate([c[1][mode] for c in chunks])
+        np.testing.assert_allclose(h_c, h[mode], rtol=1e-14, atol=0)
+    else:
+      h_c = np.concatenate([c[1] for c in chunks], axis=-1)
+      np.testing.assert_allclose(h_c, h, rtol=1e-14, atol=0)
+
+  with pytest.raises(ValueError):
+    sur.iter_chunks(q[0], chiA0[0], chiB0[0], f_low=0, dt=1.0, df=0.125)
+
+
+def test_project_modes(sur):
+  """ Projections of the modes for many orientations agree with evaluations
+  at each orientation """
+
+  q, chiA0, chiB0 = _aligned_spin_params(1, seed=12)
+  kwargs = dict(M=60, dist_mpc=100, f_low=20, dt=1./4096, units='mks')
+  _, h_modes, _ = sur(q[0], chiA0[0], chiB0[0], **kwargs)
+  inclination = np.array([0, 0.4, 1.2, np.pi])
+  phi_ref = np.array([0, 0.3, 2.0, 5.0])
+  h = sur.project_modes(h_modes, inclination, phi_ref)
+  h_pol = sur.project_modes(h_modes, inclination, phi_ref,
+                            return_polarizations=True)
+  assert h.shape == (4, len(h_modes[(2,2)]))
+  assert h_pol.shape == (4, 2, h.shape[1])
+
+  for i in range(4):
+    _, h_i, _ = sur(q[0], chiA0[0], chiB0[0], inclination=inclination[i],
+                    phi_ref=phi_ref[i], **kwargs)
+    atol = 1e-12*np.max(np.abs(h_i))
+    np.testing.assert_allclose(h[i], h_i, rtol=0, atol=atol)
+    np.testing.assert_allclose(h_pol[i,0] - 1j*h_pol[i,1], h_i, rtol=0,
+      atol=atol)
+
+  # A single inclination broadcasts against the phases
+  h_b = sur.project_modes(h_modes, 0.4, phi_ref)
+  np.testing.assert_array_equal(h_b[1], h[1])
+
+
+def test_harmonics():
+  """ The vectorized -2Ylm and mode sums agree with gwtools """
+  from gwtools.harmonics import sYlm
+  from gwsurrogate import harmonics
+
+  theta = np.array([0, 0.3, 1.7, np.pi])
+  phi = np.array([0.2, -1.1, 2.5, 0.4])
+  table = harmonics.sYlm_table(8, theta, phi)
+  for i, (ell, m) in enumerate(harmonics.mode_list(8)):
+    for j in range(len(theta)):
+      assert abs(table[i,j] - sYlm(-2, ell, m, theta[j], phi[j])) < 1e-13
+
+  rng = np.random.RandomState(13)
+  modes = [(2,2), (2,1), (3,3), (4,0)]
+  h_modes = [rng.randn(100) + 1j*rng.randn(100) for _ in modes]
+  coefs, coefs_neg = harmonics.mode_sum_coefs(modes, 0.3, -1.1,
+                                              fake_neg_modes=True)
+  h = harmonics.mode_sum(h_modes, coefs, coefs_neg, scale=2.)
+  expected = 0
+  for (ell, m), h_mode in zip(modes, h_modes):
+    expected += sYlm(-2, ell, m, 0.3, -1.1)*h_mode
+    if m > 0:
+      expected += sYlm(-2, ell, -m, 0.3, -1.1)*(-1)**ell*h_mode.conjugate()
+  np.testing.assert_allclose(h, 2*expected, rtol=1e-13, atol=0)
+
+
+def test_rescaler(sur):
+  """ Rescaled waveforms agree with evaluations at each total mass """
+
+  q, chiA0, chiB0 = _aligned_spin_params(1, seed=14)
+  resc = sur.rescaler(q[0], chiA0[0], chiB0[0])
+  for M, dist_mpc, dt, inclination in [(40, 100, 1./4096, None),
+                                       (60, 300, 1./2048, 0.4),
+                                       (100, 50, 1./4096, 1.1)]:
+    kwargs = dict(f_low=20, dt=dt, inclination=inclination,
+                  taper_end_duration=0.01)
+    t, h, _ = sur(q[0], chiA0[0], chiB0[0], M=M, dist_mpc=dist_mpc,
+                  units='mks', **kwargs)
+    t_r, h_r, _ = resc(M, dist_mpc, **kwargs)
+    np.testing.assert_array_equal(t_r, t)
+    if inclination is None:
+      for mode in h.keys():
+        np.testing.assert_array_equal(h_r[mode], h[mode])
+    else:
+      np.testing.assert_array_equal(h_r, h)
+
+
+def test_profiler(sur):
+  """ The Profiler records the stages of evaluations, and only while
+  active """
+  from gwsurrogate import profiling
+
+  q, chiA0, chiB0 = _aligned_spin_params(1, seed=15)
+  calls = []
+  with profiling.Profiler(callback=lambda *args: calls.append(args)) as prof:
+    sur(q[0], chiA0[0], chiB0[0], f_low=20, dt=1./4096, M=60, dist_mpc=100,
+        units='mks', inclination=0.4, taper_end_duration=0.01)
+  for stage in ['param_checks', 'fits', 'ei_basis', 'interpolation',
+                'rotation', 'taper', 'mode_sum']:
+    assert prof.stats[stage]['calls'] > 0
+    assert prof.stats[stage]['self_time'] <= prof.stats[stage]['time']
+  assert len(calls) == sum(v['calls'] for v in prof.stats.values())
+
+  stats = dict((k, dict(v)) for k, v in prof.stats.items())
+  sur(q[0], chiA0[0], chiB0[0], f_low=0)
+  assert prof.stats == stats
+
+
+def test_synthetic_models(synthetic_paths):
+  """ Synthetic models load and evaluate like the real models """
+  for name, chiA0, chiB0 in [
+      ('NRHybSur3dq8', [0, 0, 0.5], [0, 0, -0.3]),
+      ('NRSur7dq4', [0.3, 0.2, 0.4], [-0.2, 0.4, 0.1])]:
+    sur = gws.LoadSurrogate(synthetic_paths[name], reuse=False)
+    t, h, _ = sur(2., chiA0, chiB0, f_low=0, dt=0.5)
+    assert np.all(np.diff(t) > 0)
+    for mode, hlm in h.items():
+      assert hlm.shape == t.shape
+      assert np.all(np.isfinite(hlm))
+    # The (2, 2) mode amplitude peaks near t=0, and the phase increases
+    amp = np.abs(h[(2,2)])
+    assert abs(t[np.argmax(amp)]) < 50
+    phase = -np.unwrap(np.angle(h[(2,2)]))
+    assert np.all(np.diff(phase[t < 0]) > 0)
+
+    t, h, _ = sur(2., chiA0, chiB0, f_low=20, dt=1./4096, M=60,
+                  dist_mpc=100, units='mks', inclination=0.4)
+    assert np.all(np.isfinite(h))
+
+
+def test_write_models(tmp_path):
+  """ Synthetic model files are rewritten when their parameters change """
+  from gwsurrogate import synthetic
+
+  kwargs = dict(num_times=100, num_nodes=5)
+  paths = synthetic.write_models(str(tmp_path), **kwargs)
+  params = {name: synthetic.read_params(path)
+            for name, path in paths.items()}
+  assert '"num_nodes": 5' in params['NRHybSur3dq8']
+  assert '"num_nodes": 5' in params['NRSur7dq4']
+  for writer, name in [(synthetic.write_NRHybSur3dq8, 'NRHybSur3dq8'),
+                       (synthetic.write_NRSur7dq4, 'NRSur7dq4')]:
+    with pytest.raises(Exception, match='Will not overwrite'):
+      writer(paths[name])
+
+  mtimes = {name: os.path.getmtime(path) for name, path in paths.items()}
+  assert synthetic.write_models(str(tmp_path), **kwargs) == paths
+  for name, path in paths.items():
+    assert os.path.getmtime(path) == mtimes[name]
+
+  kwargs['seed'] = 1
+  synthetic.write_models(str(tmp_path), **kwargs)
+  for name, path in paths.items():
+    new_params = synthetic.read_params(path)
+    assert new_params != params[name] and '"seed": 1' in new_params
+
+
+def test_stacked_gpr_fits():
+  """ Stacked GPR fits agree with evaluating each fit separately """
+  from gwsurrogate.new.nodeFunction import NRHybSur3dq8Fit, stack_gpr_fits
+
+  def fit_data(rng, num_train, sum_kernel, lin_reg):
+    """ GPR fit data as saved by pySurrogate """
+    rbf = {'name': 'RBF', 'length_scale': rng.uniform(0.5, 2., 3),
+           'length_scale_bounds': (1e-2, 1e2)}
+    kernel = rbf
+    if sum_kernel:
+      kernel = {'name': 'Sum',
+                'k1': {'name': 'Product',
+                       'k1': {'name': 'ConstantKernel',
+                              'constant_value': rng.uniform(0.5, 2.),
+                              'constant_value_bounds': (1e-3, 1e3)},
+                       'k2': rbf},
+                'k2': {'name': 'WhiteKernel', 'noise_level': 1e-6,
+                       'noise_level_bounds': (1e-10, 1e-2)}}
+    gpr = {'kernel_': kernel,
+           'X_train_': rng.uniform(-1, 1, (num_train, 3)),
+           'alpha_': rng.randn(num_train),
+           'L_': np.eye(num_train),
+           '_y_train_mean': rng.randn()}
+    if num_train % 2 == 0:
+      gpr['_y_train_std'] = rng.uniform(0.5, 2.)
+    lin_reg_params = None
+    if lin_reg:
+      lin_reg_params = {'coef_': rng.randn(3), 'intercept_': rng.randn()}
+    return {'fitType': 'GPR', 'data_mean': rng.randn(),
+            'data_std': rng.uniform(0.1, 1.),
+            'lin_reg_params': lin_reg_params, 'GPR_params': gpr}
+
+  rng = np.random.RandomState(0)
+  fits = []
+  for i in range(12):
+    fit = NRHybSur3dq8Fit()
+    # Fits with a different kernel structure are evaluated as a separate
+    # group
+    fit.fit_data = fit_data(rng, 10 + i, sum_kernel=(i % 3 != 0),
+                            lin_reg=(i % 3 != 0))
+    fits.append(fit)
+  stack = stack_gpr_fits(fits)
+  assert stack_gpr_fits(fits + [None]) is None
+
+  def expected(fit, x):
+    data = fit.fit_data
+    gpr = data['GPR_params']
+    kernel = gpr['kernel_']
+    if kernel['name'] == 'Sum':
+      constant = kernel['k1']['k1']['constant_value']
+      kernel = kernel['k1']['k2']
+    else:
+      constant = 1.
+    z = fit._map_params(x)
+    sq_dist = np.sum(((z - gpr['X_train_'])/kernel['length_scale'])**2, -1)
+    y = constant*np.exp(-0.5*sq_dist).dot(gpr['alpha_'])
+    y = gpr['_y_train_mean'] + gpr.get('_y_train_std', 1.)*y
+    y = data['data_mean'] + data['data_std']*y
+    if data['lin_reg_params'] is not None:
+      y += z.dot(data['lin_reg_params']['coef_']) \
+          + data['lin_reg_params']['intercept_']
+    return y
+
+  q, chiA0, chiB0 = _aligned_spin_params(7)
+  xs = np.array([q, chiA0[:,2], chiB0[:,2]]).T
+  res = stack(xs)
+  assert res.shape == (len(fits), len(xs))
+  for i, fit in enumerate(fits):
+    for j, x in enumerate(xs):
+      assert np.allclose(res[i, j], expected(fit, x), rtol=1e-10, atol=1e-12)
+  # Evaluating in chunks gives the same result
+  stack.max_kernel_size = 50
+  assert np.allclose(stack(xs), res, rtol=1e-12, atol=1e-14)
+
+
+def test_flat_evaluation(synthetic_paths):
+  """ The flattened evaluation of all data pieces agrees with evaluating
+  each data piece separately """
+  q, chiA0, chiB0 = _aligned_spin_params(4)
+  xs = np.array([q, chiA0[:,2], chiB0[:,2]]).T
+
+  def check(sur, mode_list):
+    h_22, h_coorb = sur._eval_coorbital_batch(xs, mode_list)
+    assert sorted(h_coorb.keys()) == sorted(k for k in mode_list
+                                            if k != (2,2))
+    for mode in mode_list:
+      expected = sur._get_sur_sub(mode).batch_call(xs)[0]
+      res = h_22[0] if mode == (2,2) else h_coorb[mode][0]
+      for key, data in expected.items():
+        if mode == (2,2) and key == 'phase':
+          data = data + sur._TaylorT3_phase_22(xs)
+        assert res[key].dtype == data.dtype
+        assert np.allclose(res[key], data, rtol=1e-5, atol=1e-6)
+
+  def bases(sur):
+    return [basis for _, _, basis, _ in sur._flat_plan.blocks]
+
+  mode_lists = [[(2,2), (3,3)], [(4,4), (2,2), (3,3)], [(2,2)]]
+  for dtype in [np.float64, np.float32]:
+    sur = gws.LoadSurrogate(synthetic_paths['NRHybSur3dq8'], reuse=False,
+                            dtype=dtype)._sur_dimless
+    for mode_list in [sur.mode_list] + mode_lists:
+      check(sur, mode_list)
+      # All plans share the bases of the loaded modes
+      plan = sur._get_flat_plan(mode_list)
+      assert all(any(basis is b for b in bases(sur))
+                 for _, _, basis, _ in plan.blocks)
+    for mode in sur.mode_list:
+      for func_sub in sur._get_sur_sub(mode).func_subs.object_dict.values():
+        assert any(np.shares_memory(func_sub.ei_basis, b)
+                   for b in bases(sur))
+
+  # Data pieces with different numbers of nodes are in separate blocks
+  for mode in [(3,3), (2,1)]:
+    func_sub = sur._get_sur_sub(mode).func_subs['re']
+    func_sub.ei_basis = func_sub.ei_basis[:-mode[1]]
+    func_sub.node_functions = func_sub.node_functions[:-mode[1]]
+  sur._flat_plan = None
+  for mode_list in [sur.mode_list] + mode_lists:
+    check(sur, mode_list)
+  assert len(sur._flat_plan.blocks) == 4
+
+  # With lazy loading, the plan is extended as modes are read
+  sur = gws.LoadSurrogate(synthetic_paths['NRHybSur3dq8'], lazy=True)._sur_dimless
+  for mode_list in mode_lists + [sur.mode_list]:
+    check(sur, mode_list)
+    assert sorted(sur._flat_plan.modes) \
+        == sorted(sur.sur_subs.object_dict.keys())
+  sur.close()
+
+
+def test_dense_basis_cache(synthetic_sur):
+  """ Evaluations with the dense basis cache agree with interpolation """
+  chiA0, chiB0 = [0, 0, 0.5], [0, 0, -0.3]
+
+  def check_modes(h_cached, h, phase_atol):
+    for mode in h:
+      amp = np.abs(h[mode])
+      np.testing.assert_allclose(np.abs(h_cached[mode]), amp, rtol=0,
+                                 atol=1e-12*np.max(amp))
+      # The TaylorT3 part of the (2, 2) phase is evaluated on the dense
+      # times instead of being interpolated, which is more accurate at
+      # the start of the sparse domain
+      np.testing.assert_allclose(np.unwrap(np.angle(h_cached[mode])),
+                                 np.unwrap(np.angle(h[mode])), rtol=0,
+                                 atol=phase_atol)
+
+  # The dense data is truncated at f_low, and aligned at f_ref
+  cases = [(dict(f_low=0, dt=0.5), 1e-3),
+           (dict(f_low=4e-3, dt=0.5), 1e-5),
+           (dict(f_low=4e-3, f_ref=6e-3, dt=0.5), 1e-5),
+           (dict(f_low=20, f_ref=25, dt=1./4096, M=60, dist_mpc=100,
+                 units='mks'), 1e-5)]
+  for kwargs, phase_atol in cases:
+    t, h, _ = synthetic_sur(2., chiA0, chiB0, **kwargs)
+    synthetic_sur.enable_dense_basis_cache(max_entries=2)
+    t_cached, h_cached, _ = synthetic_sur(2., chiA0, chiB0, **kwargs)
+    synthetic_sur.disable_dense_basis_cache()
+    assert np.array_equal(t, t_cached)
+    check_modes(h_cached, h, phase_atol)
+
+  # Without f_low, other binaries use the same grid
+  _, h2, _ = synthetic_sur(3., chiA0, chiB0, f_low=0, dt=0.5)
+  synthetic_sur.enable_dense_basis_cache(max_entries=2)
+  synthetic_sur(2., chiA0, chiB0, f_low=0, dt=0.5)
+  _, h2_cached, _ = synthetic_sur(3., chiA0, chiB0, f_low=0, dt=0.5)
+  stats = synthetic_sur._sur_dimless.dense_basis_cache_stats()
+  assert stats['entries'] == 1 and stats['hits'] == 1
+  synthetic_sur.disable_dense_basis_cache()
+  check_modes(h2_cached, h2, 1e-3)
+
+
+def test_fused_mode_sum(synthetic_sur):
+  """ Sums over modes done in one pass agree with summing the modes """
+  chiA0, chiB0 = [0, 0, 0.5], [0, 0, -0.3]
+  for kwargs in [dict(f_low=0, dt=0.5),
+                 dict(f_low=0, times=np.arange(-2000., 50., 0.7)),
+                 dict(f_low=20, f_ref=25, dt=1./4096, M=60, dist_mpc=100,
+                      units='mks', mode_list=[(2,2), (3,3), (2,0)])]:
+    t_modes, h_modes, _ = synthetic_sur(2., chiA0, chiB0, **kwargs)
+    for return_polarizations in [False, True]:
+      t, h, _ = synthetic_sur(2., chiA0, chiB0, inclination=0.4,
+                              phi_ref=1.,
+                              return_polarizations=return_polarizations,
+                              **kwargs)
+      h_sum = synthetic_sur.project_modes(h_modes, 0.4, phi_ref=1.,
+          return_polarizations=return_polarizations)[0]
+      assert np.array_equal(t, t_modes)
+      np.testing.assert_allclose(h, h_sum, rtol=0,
+                                 atol=1e-12*np.max(np.abs(h_sum)))
+
+  # With the dense basis cache the modes are summed as usual
+  synthetic_sur.enable_dense_basis_cache()
+  kwargs = dict(f_low=4e-3, dt=0.5)
+  _, h_modes, _ = synthetic_sur(2., chiA0, chiB0, **kwargs)
+  _, h, _ = synthetic_sur(2., chiA0, chiB0, inclination=0.4, **kwargs)
+  synthetic_sur.disable_dense_basis_cache()
+  np.testing.assert_allclose(h, synthetic_sur.project_modes(h_modes, 0.4)[0],
+                             rtol=0, atol=1e-12*np.max(np.abs(h)))
@@ -32,3 +32,96 @@ def test_orbital_symmetry_flags():
     modes, t, hp, hc = EOBNRv2_sur(q=1.14,ell=[2],m=[2],mode_sum=False,fake_neg_modes=True)
   except ValueError:
     pass
+
+def test_spline_interp_Cwrapper():
+  """ The multi-RHS splines agree with the gsl spline function """
+  from ctypes import c_double, POINTER
+  from gwsurrogate import spline_interp_Cwrapper as sic
+
+  def gsl_interp(xnew, x, y):
+    ynew = np.zeros(len(xnew))
+    # The real and imaginary parts of complex arrays are strided views
+    x, y, xnew = [np.ascontiguousarray(a, dtype=np.float64)
+                  for a in (x, y, xnew)]
+    p = lambda a: a.ctypes.data_as(POINTER(c_double))
+    sic.spline_interp_Cwrapper._get_c_interp()(len(x), len(xnew), p(x),
+        p(y), p(xnew), p(ynew))
+    return ynew
+
+  # Equal up to rounding, which can differ with fused multiply-adds
+  same = lambda a, b: np.allclose(a, b, rtol=1e-13, atol=1e-13)
+
+  rng = np.random.RandomState(0)
+  for x in [np.linspace(-3, 5, 40), np.sort(rng.uniform(-3, 5, 40))]:
+    y = rng.randn(3, len(x)) + 1j*rng.randn(3, len(x))
+    xnew = np.append(np.linspace(x[0], x[-1], 101), x)
+    spline = sic.Spline(x, y)
+    res = spline(xnew)
+    assert res.shape == (3, len(xnew)) and res.dtype == np.complex128
+    for i in range(3):
+      assert same(res[i].real, gsl_interp(xnew, x, y[i].real))
+      assert same(res[i].imag, gsl_interp(xnew, x, y[i].imag))
+
+    # Real data, new data on the same spline, and out arrays
+    spline.set_data(y[0].real)
+    out = np.empty(len(xnew))
+    assert spline(xnew, out=out) is out
+    assert same(out, gsl_interp(xnew, x, y[0].real))
+    assert np.array_equal(sic.interpolate(xnew, x, y[0].real), out)
+
+    try:
+      spline(np.array([x[-1] + 1e-6]))
+      raise AssertionError('Extrapolation should fail')
+    except Exception as e:
+      assert 'Extrapolation' in str(e)
+
+def test_roq():
+  """ ROQ inner products agree with inner products of the waveform """
+  from gwsurrogate import roq
+  from gwsurrogate.new.surrogate import _SingleFunctionSurrogate_NoChecks
+  from gwsurrogate.new.nodeFunction import NodeFunction, Polyfit1D
+
+  rng = np.random.RandomState(1)
+  domain = np.sort(rng.uniform(-100., 10., 60))
+  basis = rng.randn(5, len(domain)) + 1j*rng.randn(5, len(domain))
+  node_functions = [NodeFunction('node%d'%i, Polyfit1D('polyval_1d',
+                                                       rng.randn(3)))
+                    for i in range(len(basis))]
+  sur = _SingleFunctionSurrogate_NoChecks('test', basis, node_functions)
+
+  # The data segment is longer than the domain
+  times = np.arange(-150., 40., 0.25)
+  data = rng.randn(len(times)) + 1j*rng.randn(len(times))
+  psd = lambda f: 1. + (f/0.5)**2
+  kwargs = dict(f_min=0.05, f_max=1.5)
+  sur_roq = roq.ROQ(sur, times, data, psd, domain=domain, **kwargs)
+
+  # The PSD can also be given at the rfft frequencies
+  L, Q = roq.roq_weights(basis, domain, times, data,
+                         psd(np.fft.rfftfreq(len(times), 0.25)), **kwargs)
+  assert np.allclose(L, sur_roq.L, rtol=1e-14, atol=0)
+  assert np.allclose(Q, Q.conj().T, rtol=1e-14, atol=0)
+
+  inside = (times >= domain[0]) & (times <= domain[-1])
+  xs = np.array([[1.3], [2.1], [0.4]])
+  dh_batch, hh_batch = sur_roq.batch_inner_products(xs)
+  for i, x in enumerate(xs):
+    h = np.zeros(len(times), dtype=complex)
+    h[inside] = gws.spline_interp_Cwrapper.interpolate(times[inside], domain,
+                                                       sur(x))
+    dh = roq.inner_product(data, h, times, psd, **kwargs)
+    hh = roq.inner_product(h, h, times, psd, **kwargs)
+    assert np.allclose(sur_roq.inner_products(x), [dh, hh], rtol=1e-10,
+                       atol=0)
+    assert np.allclose([dh_batch[i], hh_batch[i]], [dh, hh], rtol=1e-10,
+                       atol=0)
+    assert np.isclose(sur_roq.log_likelihood(x), dh - 0.5*hh, rtol=1e-10)
+
+def test_star_import():
+  """ The public names are exported by a star import """
+  namespace = {}
+  exec('from gwsurrogate import *', namespace)
+  for name in ['LoadSurrogate', 'EvaluateSurrogate', 'NRHybSur3dq8',
+               'catalog', 'spline_interp_Cwrapper', 'precessing_utils']:
+    assert name in namespace
+  assert namespace['LoadSurrogate'] is gws.LoadSurrogate